@@ -0,0 +1,78 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+"""
+Micro-benchmark of the exciton weights of YamboExcitonDB against the loop over transitions
+they replaced.
+
+    python benchmarks/bench_exciton_weights.py [--nk 96] [--nexcitons 3] [--repeat 5]
+
+The transitions are those of a nk x nk k-grid with 2 valence and 2 conduction bands.
+"""
+import os
+import argparse
+from timeit import repeat
+import numpy as np
+from yambopy.tools.funcs import abs2
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.excitondb import YamboExcitonDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','yambopy','data','refs','bse','SAVE')
+
+def exciton_weights_loop(exc,excitons):
+    """ get_exciton_weights as the explicit loop over excitons and transitions """
+    weights = np.zeros([exc.nkpoints,exc.mband])
+    for exciton in excitons:
+        eivec = exc.eigenvectors[exciton-1]
+        for t,kcv in enumerate(exc.table):
+            k,c,v = kcv[0:3]-1
+            this_weight = abs2(eivec[t])
+            weights[k,c] += this_weight
+            weights[k,v] += this_weight
+    return weights
+
+def rho_loop(exc,excitons):
+    """ calculate_rho as the explicit loop over excitons and transitions """
+    rho = np.zeros([exc.nkpoints,exc.nvbands,len(excitons)])
+    v_min = exc.unique_vbands[0]
+    for i_exc,exciton in enumerate(excitons):
+        eivec = exc.eigenvectors[exciton-1]
+        for t,kvc in enumerate(exc.table):
+            k,v,c = kvc[0:3]-1
+            rho[k,v-v_min,i_exc] += abs2(eivec[t])
+    return rho
+
+def random_excitons(nk,nexcitons,vbands=(3,4),cbands=(5,6)):
+    """ YamboExcitonDB with random normalized eigenvectors on a nk x nk k-grid """
+    lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+    table = np.array([ [k,v,c] for k in range(1,nk*nk+1) for v in vbands for c in cbands ])
+    rng = np.random.default_rng(0)
+    eivs = rng.normal(size=(nexcitons,len(table))) + 1j*rng.normal(size=(nexcitons,len(table)))
+    eivs /= np.linalg.norm(eivs,axis=1)[:,np.newaxis]
+    energies = np.sort(rng.random(nexcitons)).astype(complex)
+    return YamboExcitonDB(lat,'1',energies,energies,energies,table=table,eigenvectors=eivs)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the exciton weights')
+    parser.add_argument('--nk',type=int,default=96,help='k-points along each direction')
+    parser.add_argument('--nexcitons',type=int,default=3,help='number of excitons')
+    parser.add_argument('--repeat',type=int,default=5,help='repetitions of each timing (the best one is shown)')
+    args = parser.parse_args()
+
+    exc = random_excitons(args.nk,args.nexcitons)
+    excitons = list(range(1,args.nexcitons+1))
+    print('%d excitons, %d transitions'%(args.nexcitons,exc.ntransitions))
+
+    for name,new,old in [('get_exciton_weights',exc.get_exciton_weights,exciton_weights_loop),
+                         ('calculate_rho',exc.calculate_rho,rho_loop)]:
+        np.testing.assert_allclose(new(excitons),old(exc,excitons),atol=1e-12)
+        t_new = min(repeat(lambda: new(excitons),number=1,repeat=args.repeat))
+        t_old = min(repeat(lambda: old(exc,excitons),number=1,repeat=1))
+        print('%-20s %10.2f ms (loop: %10.2f ms, speedup %.0fx)'%(name,t_new*1e3,t_old*1e3,t_old/t_new))
+
+if __name__ == '__main__':
+    main()
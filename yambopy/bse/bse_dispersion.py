@@ -9,14 +9,63 @@
 #
 import os
 from glob import glob
+from netCDF4 import Dataset
 from qepy.lattice import Path
 from yambopy import *
+from yambopy.dbs.excitondb import ExcitonEigenvectors, expand_index, gather_index
 from yambopy.units import *
 from yambopy.plot.plotting import add_fig_kwargs,BZ_Wigner_Seitz
 from yambopy.lattice import replicate_red_kmesh, calculate_distances, car_red
 from yambopy.kpoints import get_path
 from yambopy.tools.funcs import gaussian, lorentzian
 
+class ExcitonDispersionEigenvectors():
+    """
+    Lazy per-Q view of the exciton eigenvectors of a set of ndb.BS_diago_Q* databases
+
+    Only the Q database being indexed is opened and only the requested exciton rows are read.
+
+        Usage: eivs[iQ]             -> [nexcitons,(ntransitions) or (nkpoints,nvalence,nconduction)]
+               eivs[iQ,i_exc]       -> [(ntransitions) or (nkpoints,nvalence,nconduction)]
+               eivs[:,i_exc]        -> [nqpoints,...] (reads all the Q databases)
+
+        Any numpy index gives the same result as on the full array.
+    """
+    def __init__(self,filenames,nexcitons,ntransitions,transition_shape=None):
+        self.filenames    = filenames
+        self.nexcitons    = nexcitons
+        self.ntransitions = ntransitions
+        if transition_shape is None: transition_shape = (ntransitions,)
+        self.transition_shape = tuple(transition_shape)
+        self.shape = (len(filenames),nexcitons)+tuple(int(n) for n in self.transition_shape)
+
+    def __len__(self): return self.shape[0]
+
+    def read_Q(self,iQ,excitons=slice(None)):
+        """ Read the eigenvectors of the excitons (python indices, up to nexcitons) at a single Q
+        """
+        rows = np.arange(self.nexcitons)[excitons]
+        eivs = ExcitonEigenvectors(self.filenames[iQ])
+        eiv  = eivs[rows][...,:self.ntransitions]
+        eivs.close()
+        return eiv.reshape(np.shape(rows)+self.transition_shape)
+
+    def __getitem__(self,index):
+        # numpy indexing: only the Q databases and exciton rows needed are read, the full index
+        # is then applied to them with the Q and exciton entries rewritten for the data read
+        entries, axes = expand_index(index,len(self.shape))
+        Qs, entries[axes[0]] = gather_index(entries[axes[0]],self.shape[0])
+        excitons, entries[axes[1]] = gather_index(entries[axes[1]],self.nexcitons)
+        Qs = np.arange(len(self))[Qs]
+        eiv = np.zeros((len(Qs),len(np.arange(self.nexcitons)[excitons]))+self.transition_shape,dtype=complex)
+        for i,iQ in enumerate(Qs): eiv[i] = self.read_Q(iQ,excitons)
+        return eiv[tuple(entries)]
+
+    def __array__(self,dtype=None,copy=None):
+        eiv = self[:]
+        if dtype is not None: eiv = eiv.astype(dtype)
+        return eiv
+
 class ExcitonDispersion():
     """
     Class to obtain exciton information at all momenta
@@ -25,13 +74,16 @@ class ExcitonDispersion():
     - Plots of exciton weights in q-space
 
     :: Lattice is an instance of YamboLatticeDB
-    :: nexcitons is the number of excitonic states - by default it is taken from the Q=1 database
+    :: nexcitons is the number of excitonic states - by default it is taken from the Q=1 database.
+                 Only nexcitons eigenvectors are read for each Q.
+    :: lazy: if True the eigenvectors are not loaded in memory, exc_eigenvectors is an ExcitonDispersionEigenvectors
+             view reading one Q database at a time
 
     NB: so far does not support spin-polarised exciton plots (should be implemented when needed!)
     NB: only supports BSEBands option in yambo bse input, not BSEEhEny
     """
 
-    def __init__(self,lattice,nexcitons=None,folder='.'):
+    def __init__(self,lattice,nexcitons=None,folder='.',lazy=False):
 
         if not isinstance(lattice,YamboLatticeDB):
             raise ValueError('Invalid type for lattice argument. It must be YamboLatticeDB')
@@ -43,21 +95,29 @@ class ExcitonDispersion():
         if not nqpoints==lattice.ibz_nkpoints :
             raise ValueError("Incomplete list of qpoints (%d/%d)"%(nqpoints,lattice.ibz_nkpoints)) 
     
-        dbs_are_consistent, spin_is_there = self.db_check(lattice,nqpoints,folder)
+        filenames = [ folder+'/ndb.BS_diago_Q%d'%(iQ+1) for iQ in range(nqpoints) ]
+
+        # Read (each database is opened once): the eigenvectors of the first nexcitons states are
+        # written one Q at a time in an array allocated with the dimensions of the first database
+        dbs = []
+        exc_eigenvectors = None
+        for iQ,filename in enumerate(filenames):
+            with Dataset(filename) as database:
+                dbs.append(self.read_db(lattice,database,filename,nexcitons))
+                if lazy: continue
+                if exc_eigenvectors is None:
+                    ntransitions = dbs[0]['nexcitons']
+                    nexc = ntransitions if nexcitons is None else nexcitons
+                    exc_eigenvectors = np.zeros((nqpoints,nexc,ntransitions),dtype=complex)
+                self.read_eigenvectors(database,exc_eigenvectors[iQ])
+        dbs_are_consistent, spin_is_there = self.db_check(dbs)
         if nexcitons is None: nexcitons = self.ntransitions
 
-        # Read
-        car_qpoints         = np.zeros((nqpoints,3))
-        exc_energies        = np.zeros((nqpoints,nexcitons))
-        exc_eigenvectors    = np.zeros((nqpoints,nexcitons,self.ntransitions),dtype=complex)
-        exc_tables          = np.zeros((nqpoints,self.ntransitions,5),dtype=int)
-        for iQ in range(nqpoints):
-            exc_obj = YamboExcitonDB.from_db_file(lattice,filename=folder+'/ndb.BS_diago_Q%d'%(iQ+1))
-            if iQ==0: car_qpoints[iQ] = np.array([0.,0.,0.])
-            else:     car_qpoints[iQ] = exc_obj.car_qpoint
-            exc_energies[iQ,:]        = exc_obj.eigenvalues[:nexcitons].real
-            exc_eigenvectors[iQ,:]    = exc_obj.eigenvectors[:nexcitons]    
-            exc_tables[iQ,:]          = exc_obj.table
+        car_qpoints  = np.array([ db['car_qpoint'] for db in dbs ])
+        exc_energies = np.array([ db['energies'][:nexcitons] for db in dbs ],dtype=float)
+        exc_tables   = np.array([ db['table'][:self.ntransitions] for db in dbs ])
+        if not lazy: exc_eigenvectors = exc_eigenvectors[:,:nexcitons,:self.ntransitions]
+        del dbs
 
         # Set up variables
         self.nqpoints     = nqpoints
@@ -69,22 +129,49 @@ class ExcitonDispersion():
         self.exc_tables   = exc_tables
 
         # Reshape eigenvectors if possible
-        if dbs_are_consistent and not spin_is_there: self.exc_eigenvectors = self.reshape_eigenvectors(exc_eigenvectors)
-        else:                                        self.exc_eigenvectors = exc_eigenvectors
+        reshape = dbs_are_consistent and not spin_is_there
+        if lazy:
+            transition_shape = (self.nkpoints,self.nvalence,self.nconduction) if reshape else None
+            self.exc_eigenvectors = ExcitonDispersionEigenvectors(filenames,nexcitons,self.ntransitions,transition_shape)
+        elif reshape: self.exc_eigenvectors = self.reshape_eigenvectors(exc_eigenvectors)
+        else:         self.exc_eigenvectors = exc_eigenvectors
 
         # Necessary lattice information
         self.alat = lattice.alat
         self.rlat = lattice.rlat
 
-    def db_check(self,lattice,nqpoints,folder):
+    def read_db(self,lattice,database,filename,nexcitons=None):
+        """
+        Read energies (eV), transition table and Q-point of one open ndb.BS_diago_Q* database
+        """
+        db = {}
+        db['energies'] = database.variables['BS_Energies'][:nexcitons,0]*ha2ev
+        db['table']    = database.variables['BS_TABLE'][:].T.astype(int)
+        db['car_qpoint'] = np.zeros(3)
+        if 'Q-point' in database.variables and not filename.endswith('_Q1'):
+            db['car_qpoint'] = database.variables['Q-point'][:]/lattice.alat
+        db['nexcitons'] = database.variables['BS_Energies'].shape[0]
+        return db
+
+    def read_eigenvectors(self,database,eigenvectors):
+        """
+        Read the eigenvectors of one open ndb.BS_diago_Q* database in the array eigenvectors [nexcitons,ntransitions]
+        (only the excitons and transitions fitting in it are read)
+        """
+        nexc, ntransitions = eigenvectors.shape
+        eiv = database.variables['BS_EIGENSTATES'][:nexc,:ntransitions]
+        nexc, ntransitions = eiv.shape[:2]
+        eigenvectors.real[:nexc,:ntransitions] = eiv[:,:,0]
+        eigenvectors.imag[:nexc,:ntransitions] = eiv[:,:,1]
+
+    def db_check(self,dbs):
         """
         Check nexcitons and ntransitions in each database
+
+        dbs: list of the headers read with read_db
         """
-        nexcitons_each_Q    = np.zeros(nqpoints,dtype=int)
-        for iQ in range(nqpoints):
-            exc_obj = YamboExcitonDB.from_db_file(lattice,filename=folder+'/ndb.BS_diago_Q%d'%(iQ+1))
-            nexcitons_each_Q[iQ] = exc_obj.nexcitons
-            if iQ==0: tbl = exc_obj.table
+        nexcitons_each_Q = np.array([ db['nexcitons'] for db in dbs ])
+        tbl = dbs[0]['table']
 
         is_spin_pol = len(np.unique(tbl[:,3]))>1 or len(np.unique(tbl[:,4]))>1
         is_consistent = np.all(nexcitons_each_Q==nexcitons_each_Q[0])
@@ -111,14 +198,8 @@ class ExcitonDispersion():
         TODO: Extend to spin-polarised case
         """
         nq, nexc, nk, nv, nc = self.nqpoints, self.nexcitons, self.nkpoints, self.nvalence, self.nconduction
-        reshaped_eigenvectors = np.zeros((nq,nexc,nk,nv,nc),dtype=complex)
-        #print(eigenvectors[2,5,2])
-        for iQ in range(nq):
-            for i_exc in range(nexc): 
-                reshaped_eigenvectors[iQ,i_exc,:,:,:] = eigenvectors[iQ,i_exc,:].reshape([nk,nv,nc])
-        #print(reshaped_eigenvectors[2,5,0,1,0])    
-
-        return reshaped_eigenvectors
+        # transitions are ordered as (k,v,c) so this is a view, no data is copied
+        return eigenvectors.reshape([nq,nexc,nk,nv,nc])
 
     @add_fig_kwargs
     def plot_Aweights(self,data,plt_show=False,plt_cbar=False,**kwargs):
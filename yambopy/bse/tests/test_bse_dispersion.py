@@ -0,0 +1,70 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from unittest import mock
+from netCDF4 import Dataset
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.bse.bse_dispersion import ExcitonDispersion
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
+
+def write_bse_diago_db(filename,table,rng):
+    """
+    Small ndb.BS_diago_Q* with random energies and eigenvectors
+    """
+    ntransitions = len(table)
+    with Dataset(filename,'w') as database:
+        database.createDimension('BS_K_dim',ntransitions)
+        database.createDimension('BS_TABLE_dim',table.shape[1])
+        database.createDimension('complex',2)
+        database.createDimension('three',3)
+        database.createVariable('BS_Energies','f4',('BS_K_dim','complex'))[:] = rng.random((ntransitions,2))
+        database.createVariable('BS_TABLE','f4',('BS_TABLE_dim','BS_K_dim'))[:] = table.T
+        database.createVariable('BS_EIGENSTATES','f4',('BS_K_dim','BS_K_dim','complex'))[:] = rng.random((ntransitions,ntransitions,2))
+        database.createVariable('Q-point','f4',('three',))[:] = rng.random(3)
+
+class TestExcitonDispersion(unittest.TestCase):
+
+    def test_lazy_dispersion(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        nk, vbands, cbands = 4, [3,4], [5,6,7]
+        table = np.array([ [k,v,c,1,1] for k in range(1,nk+1) for v in vbands for c in cbands ])
+        rng = np.random.default_rng(0)
+
+        with tempfile.TemporaryDirectory() as folder:
+            for iQ in range(lat.ibz_nkpoints):
+                write_bse_diago_db(os.path.join(folder,'ndb.BS_diago_Q%d'%(iQ+1)),table,rng)
+
+            #each database is opened once
+            with mock.patch('yambopy.bse.bse_dispersion.Dataset',side_effect=Dataset) as opened:
+                exc = ExcitonDispersion(lat,nexcitons=10,folder=folder)
+            self.assertEqual(opened.call_count,lat.ibz_nkpoints)
+            lazy = ExcitonDispersion(lat,nexcitons=10,folder=folder,lazy=True)
+
+            self.assertEqual(exc.exc_eigenvectors.shape,(lat.ibz_nkpoints,10,nk,len(vbands),len(cbands)))
+            self.assertEqual(lazy.exc_eigenvectors.shape,exc.exc_eigenvectors.shape)
+            np.testing.assert_array_equal(lazy.exc_energies,exc.exc_energies)
+            np.testing.assert_array_equal(lazy.exc_tables,exc.exc_tables)
+            np.testing.assert_array_equal(lazy.car_qpoints,exc.car_qpoints)
+            np.testing.assert_array_equal(exc.car_qpoints[0],np.zeros(3))
+
+            #the lazy view is indexed as the array in memory
+            for index in [1,-1,slice(1,3),slice(None,None,-1),[2,0],(1,4),(slice(None),[0,3]),([0,2],[1,3]),
+                          (1,2,3),(1,slice(2,8,2),0,1,2),(...,1,0),([0,1],slice(None),[3,0],1),(2,...)]:
+                self.assertEqual(lazy.exc_eigenvectors[index].shape,exc.exc_eigenvectors[index].shape)
+                np.testing.assert_array_equal(lazy.exc_eigenvectors[index],exc.exc_eigenvectors[index])
+            np.testing.assert_array_equal(np.array(lazy.exc_eigenvectors),exc.exc_eigenvectors)
+            with self.assertRaises(IndexError):
+                lazy.exc_eigenvectors[0,10]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,6 @@
 import os
 from yambopy import *
 from yambopy.units import *
-from itertools import product
 
 class YamboBSEKernelDB(object):
     """ Read the BSE Kernel database from yambo.
@@ -15,17 +14,34 @@ class YamboBSEKernelDB(object):
         
         Only supports "RESONANT" case for BSE calculation.
         TODO: support more cases
+
+        The kernel is Hermitian and it is stored in packed form: only the upper triangle
+        is kept, column by column (LAPACK 'U' packed storage), i.e. 
+        K[i,j] (i<=j) is packed_kernel[j*(j+1)/2+i].
+        Products with the kernel are done by blocks of columns, without building the full matrix.
     """
-    def __init__(self,lattice,kernel):
+    def __init__(self,lattice,kernel,block_size=256):
         if not isinstance(lattice,YamboLatticeDB):
             raise ValueError('Invalid type for lattice argument. It must be YamboLatticeDB')
         
-        self.lattice  = lattice
-        self.kernel   = kernel
+        self.lattice    = lattice
+        self.block_size = block_size
+
+        # Full matrix: keep the upper triangle
+        kernel = np.asarray(kernel)
+        if kernel.ndim == 2: kernel = kernel.T[np.tril_indices(len(kernel))]
+        self.packed_kernel = kernel
+        self._ntransitions = int(round((np.sqrt(8*len(kernel)+1)-1)/2))
+        if self._ntransitions*(self._ntransitions+1)//2 != len(kernel):
+            raise ValueError('Invalid size of the packed kernel')
 
     @classmethod
-    def from_db_file(cls, lattice, Qpt=1, folder='.'):
-        """Initialize this class from a ndb.BS_PAR_Q# file."""
+    def from_db_file(cls, lattice, Qpt=1, folder='.', block_size=256, check_hermitian=False):
+        """Initialize this class from a ndb.BS_PAR_Q# file.
+
+           The upper triangle of the kernel is read by blocks of block_size transitions.
+           check_hermitian -> check that the diagonal of the kernel is real
+        """
         filename = 'ndb.BS_PAR_Q%d' % Qpt
         path_filename = os.path.join(folder, filename)
         if not os.path.isfile(path_filename):
@@ -33,24 +49,78 @@ class YamboBSEKernelDB(object):
 
         with Dataset(path_filename) as database:
             if 'BSE_RESONANT' in database.variables:
-                # Read as transposed since dimensions in netCDF are inverted
-                reker, imker = database.variables['BSE_RESONANT'][:].T
-                ker = reker + imker*I
-                
-                # Transform the triangular matrix to a square Hermitian matrix
-                kernel = np.conjugate(np.transpose(np.triu(ker))) + np.triu(ker)
-                kernel[np.diag_indices(len(kernel))] *= 0.5
-                
-                # Check if the kernel is Hermitian
-                if not np.allclose(kernel, np.conjugate(kernel.T)):
-                    raise ValueError("The constructed kernel matrix is not Hermitian")
+                database.set_auto_mask(False)
+                var = database.variables['BSE_RESONANT']
+                ntransitions = var.shape[0]
+                kernel = np.empty(ntransitions*(ntransitions+1)//2,dtype=np.result_type(var.dtype,np.complex64))
+                # Dimensions in netCDF are inverted: row j of the variable is column j of the kernel
+                for j0 in range(0,ntransitions,block_size):
+                    j1 = min(j0+block_size,ntransitions)
+                    columns = var[j0:j1,:j1,:]
+                    upper = np.arange(j1)[np.newaxis,:] <= np.arange(j0,j1)[:,np.newaxis]
+                    kernel[j0*(j0+1)//2:j1*(j1+1)//2] = columns[upper,0] + columns[upper,1]*I
             else:
                 raise ValueError('Only BSE_RESONANT case supported so far')
 
-        return cls(lattice, kernel)
+        # The diagonal of a Hermitian matrix is real
+        diagonal = np.arange(ntransitions)*(np.arange(ntransitions)+3)//2
+        if check_hermitian and not np.allclose(kernel[diagonal].imag,0):
+            raise ValueError("The constructed kernel matrix is not Hermitian")
+        kernel[diagonal] = kernel[diagonal].real
+
+        return cls(lattice, kernel, block_size=block_size)
 
     @property
-    def ntransitions(self): return len(self.kernel)
+    def ntransitions(self): return self._ntransitions
+
+    @property
+    def kernel(self):
+        """ Full kernel matrix (built from the packed storage on each call)
+        """
+        kernel = np.zeros((self.ntransitions,self.ntransitions),dtype=self.packed_kernel.dtype)
+        for j0,j1,columns in self._column_blocks():
+            kernel[:j1,j0:j1] = columns.T
+            kernel[j0:j1,:j0] = np.conj(columns[:,:j0])
+            kernel[j0:j1,j0:j1] += np.conj(np.tril(columns[:,j0:j1],-1))
+        return kernel
+
+    def _column_blocks(self,block_size=None):
+        """ Iterate over the blocks of columns j0<=j<j1 of the upper triangle.
+            Yields j0, j1 and the array columns[j-j0,i] = K[i,j] for i<=j (zero for i>j)
+        """
+        if block_size is None: block_size = self.block_size
+        N = self.ntransitions
+        for j0 in range(0,N,block_size):
+            j1 = min(j0+block_size,N)
+            columns = np.zeros((j1-j0,j1),dtype=self.packed_kernel.dtype)
+            upper = np.arange(j1)[np.newaxis,:] <= np.arange(j0,j1)[:,np.newaxis]
+            columns[upper] = self.packed_kernel[j0*(j0+1)//2:j1*(j1+1)//2]
+            yield j0, j1, columns
+
+    def get_elements(self,t1,t2):
+        """ Kernel matrix elements <t1|K|t2> for arrays of transition indices (starting from zero)
+        """
+        t1, t2 = np.broadcast_arrays(np.asarray(t1,dtype=np.int64),np.asarray(t2,dtype=np.int64))
+        i, j = np.minimum(t1,t2), np.maximum(t1,t2)
+        values = self.packed_kernel[j*(j+1)//2+i]
+        return np.where(t1<=t2,values,np.conj(values))
+
+    def matvec(self,vectors,block_size=None):
+        """ Product of the kernel with vectors, K|v>
+
+            vectors -> array with shape (ntransitions,) or (ntransitions,nvectors)
+            block_size -> number of kernel columns unpacked at the same time
+        """
+        vectors = np.asarray(vectors)
+        result  = np.zeros(vectors.shape,dtype=np.result_type(vectors,self.packed_kernel))
+        for j0,j1,columns in self._column_blocks(block_size):
+            v_block = vectors[j0:j1]
+            diagonal_block = columns[:,j0:j1].T
+            # upper triangle above the block, its conjugate on the left of the block and the diagonal block
+            result[:j0]   += columns[:,:j0].T @ v_block
+            result[j0:j1] += np.conj(columns[:,:j0]) @ vectors[:j0]
+            result[j0:j1] += (diagonal_block + np.conj(np.triu(diagonal_block,1)).T) @ v_block
+        return result
 
     def consistency_BSE_BSK(self,excitons):
         """ Check that exciton and kernel dbs are consistent
@@ -60,7 +130,7 @@ class YamboBSEKernelDB(object):
         if excitons.ntransitions != self.ntransitions:
             print('[WARNING] Mismatch in ntransitions between ExcitonDB and BSEkernelDB!')        
 
-    def get_kernel_exciton_basis(self,excitons):
+    def get_kernel_exciton_basis(self,excitons,chunk_size=None,block_size=None):
         """ Switch from transition |tq>=|kc,k-qv> to excitonic |lq> basis. 
             In this basis the kernel is diagonal.
             
@@ -69,19 +139,22 @@ class YamboBSEKernelDB(object):
        
             exciton: YamboExcitonDB object 
             Here t->kcv according to table from YamboExcitonDB database
+
+            chunk_size -> number of excitons projected at the same time (default: all)
+            block_size -> number of kernel columns unpacked at the same time
         """
-        kernel   = self.kernel
-        Nstates  = self.ntransitions
         eivs     = excitons.eigenvectors
+        nexcitons = len(eivs)
         self.consistency_BSE_BSK(excitons)
+        if chunk_size is None: chunk_size = nexcitons
 
         # Basis transformation
-        kernel_exc_basis  = np.einsum('ij,kj,ki->k', kernel, eivs, np.conj(eivs), optimize=True)
-        #kernel_exc_basis = np.zeros(Nstates,dtype=complex)
-        #for il in range(Nstates):
-        #    kernel_exc_basis[il] = np.dot( np.conj(eivs[il]), np.dot(kernel,eivs[il]) )
+        kernel_exc_basis = []
+        for l0 in range(0,nexcitons,chunk_size):
+            A = np.asarray(eivs[l0:l0+chunk_size]).T
+            kernel_exc_basis.append( np.einsum('tl,tl->l',np.conj(A),self.matvec(A,block_size)) )
 
-        return kernel_exc_basis
+        return np.concatenate(kernel_exc_basis)
 
     def get_kernel_value_bands(self,excitons,bands):
         """ Get value of kernel matrix elements 
@@ -94,7 +167,6 @@ class YamboBSEKernelDB(object):
         """
         table  = excitons.table
         nk     = self.lattice.nkpoints
-        kernel = self.kernel
         self.consistency_BSE_BSK(excitons)
         
         if bands[0] not in table[:,1] or bands[1] not in table[:,2]:
@@ -102,18 +174,12 @@ class YamboBSEKernelDB(object):
              
         # Wcv defined on the full BZ (only a subset will be filled)
         Wcv = np.zeros((nk,nk),dtype=complex)
-        # Find indices where selected valence band appears
-        t_v = np.where(table[:,1]==bands[0])[0]
-        # Find indices where selected conduction band appears
-        t_c = np.where(table[:,2]==bands[1])[0]
-        # Among those, find subset of indices where both appear together
-        t_vc = [t for t in t_v if t in t_c ]
-
-        # Iterate only on the subset
-        for it1_subset, it2_subset in product(t_vc,repeat=2):
-            ik = table[it1_subset][0]
-            ip = table[it2_subset][0]
-            Wcv[ik-1,ip-1] = kernel[it1_subset,it2_subset]
+        # Subset of indices where the selected valence and conduction bands appear together
+        t_vc = np.where((table[:,1]==bands[0]) & (table[:,2]==bands[1]))[0]
+
+        # Fill only the subset
+        kpoints = table[t_vc,0]-1
+        Wcv[np.ix_(kpoints,kpoints)] = self.get_elements(t_vc[:,np.newaxis],t_vc[np.newaxis,:])
         return Wcv
 
     def get_string(self,mark="="):
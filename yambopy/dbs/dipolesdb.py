@@ -16,8 +16,46 @@ import matplotlib.pyplot as plt
 from yambopy.units import I
 from yambopy.tools.string import marquee
 from yambopy.tools.funcs import abs2,lorentzian, gaussian
+from yambopy.dbs.fragments import hyperslab
 from yambopy.plot.plotting import add_fig_kwargs,BZ_Wigner_Seitz,shifted_grids_2D
 
+def _lorentzian_kernel(freq,ecv,broad):
+    """
+    Lorentzians centered at ecv on the frequencies freq: [nfreqs,ntransitions]
+    (same as tools.funcs.lorentzian, evaluated in place)
+    """
+    kernel = np.subtract.outer(freq,ecv)
+    np.square(kernel,out=kernel)
+    kernel += broad**2
+    np.reciprocal(kernel,out=kernel)
+    kernel *= broad/np.pi
+    return kernel
+
+def _gaussian_kernel(freq,ecv,broad,min_exp=-100.):
+    """
+    Gaussians centered at ecv on the frequencies freq: [nfreqs,ntransitions]
+    (same as tools.funcs.gaussian, evaluated in place)
+    """
+    kernel = np.subtract.outer(freq,ecv)
+    kernel *= 1./broad
+    np.square(kernel,out=kernel)
+    kernel *= -0.5
+    np.maximum(kernel,min_exp,out=kernel)
+    np.exp(kernel,out=kernel)
+    kernel *= 1./(np.sqrt(2.*np.pi)*broad)
+    return kernel
+
+def _green_kernel(freq,ecv,broad):
+    """
+    Resonant and antiresonant Green's functions -1/(w-e+i*b) - 1/(-w-e-i*b): [nfreqs,ntransitions]
+    """
+    resonant = np.subtract.outer(freq+broad*I,ecv)
+    np.reciprocal(resonant,out=resonant)
+    antiresonant = np.add.outer(freq+broad*I,ecv)
+    np.reciprocal(antiresonant,out=antiresonant)
+    antiresonant -= resonant
+    return antiresonant
+
 class YamboDipolesDB():
     """
     Class to read the dipoles databases from the ``ndb.dipoles`` files
@@ -27,11 +65,27 @@ class YamboDipolesDB():
 
     Dipole matrix elements <ck|vec{r}|vk> are stored in self.dipoles with indices [k,r_i,c,v]. If the calculation is spin-polarised (nk->nks), then they are stored with indices [s,k,r_i,c,v]
     """
-    def __init__(self,lattice,save='SAVE',filename='ndb.dipoles',dip_type='iR',field_dir=[1,1,1],project=True):
+    #maximum size in bytes of the temporary arrays used to compute spectra in chunks of transitions
+    spectra_memory = 2**24
 
+    def __init__(self,lattice,save='SAVE',filename='ndb.dipoles',dip_type='iR',field_dir=[1,1,1],project=True,
+                 bands=None,directions=None,kpoints=None):
+        """
+        Only part of the database can be read with the optional arguments
+        (they are applied as netCDF hyperslabs, before the conversion to complex numbers):
+
+            bands      -> [b_first,b_last] python indexes (inclusive) of the bands to be read.
+                          The window must contain the top valence and the bottom conduction bands.
+            directions -> cartesian directions of the expanded dipoles, e.g. [0,1] (default: all).
+                          Only the components mixed with them by the symmetry operations are read.
+            kpoints    -> IBZ k-points to be read. The expanded dipoles then contain the
+                          full-BZ k-points in their stars, listed in self.kpoints_bz
+
+        The expansion to the full BZ is done at the first access to self.dipoles
+        """
         self.lattice   = lattice
         self.filename  = "%s/%s"%(save,filename)
-        self.field_dir = field_dir
+        self.field_dir = np.array(field_dir)/np.linalg.norm(field_dir)
         self.project   = project
 
         #read dipoles
@@ -48,6 +102,17 @@ class YamboDipolesDB():
         self.min_band, self.max_band, self.indexv, self.indexc = database.variables['PARS'][:4].astype(int)
         database.close()
 
+        # band window: slices of the valence and conduction dimensions of the database
+        self.vslice, self.cslice = slice(None), slice(None)
+        if bands is not None:
+            b_first, b_last = bands
+            if b_first<self.min_band-1 or b_first>self.indexv-1 or b_last<self.indexc-1 or b_last>self.max_band-1:
+                raise ValueError('Invalid band window [%d,%d]: the dipoles contain bands %d-%d, valence up to %d, conduction from %d'%
+                                 (b_first,b_last,self.min_band-1,self.max_band-1,self.indexv-1,self.indexc-1))
+            self.vslice = slice(b_first-self.min_band+1,None)
+            self.cslice = slice(0,b_last-self.indexc+2)
+            self.min_band, self.max_band = b_first+1, b_last+1
+
         # determine the number of bands
         self.nbands  = self.max_band-self.min_band+1
         self.nbandsv = self.indexv-self.min_band+1
@@ -68,67 +133,92 @@ class YamboDipolesDB():
             self.nbandsv_os = [self.nbandsv, self.nbandsv-d_n_el ] 
             self.nbandsc_os = [self.nbandsc-d_n_el, self.nbandsc ]
 
-        #read the database
-        self.dipoles = self.readDB(dip_type)
+        # k-points window: IBZ k-points read and full-BZ k-points in their stars
+        nks = np.array(lattice.kpoints_indexes)
+        if kpoints is None:
+            self.kpoints_ibz = None
+            self.kpoints_bz  = np.arange(len(nks))
+        else:
+            self.kpoints_ibz = np.unique(np.array(kpoints,dtype=int))
+            if np.any(self.kpoints_ibz<0) or np.any(self.kpoints_ibz>=self.nk_ibz):
+                raise ValueError('Invalid kpoints: the dipoles contain %d IBZ k-points'%self.nk_ibz)
+            self.kpoints_bz = np.nonzero(np.isin(nks,self.kpoints_ibz))[0]
 
-        #expand the dipoles to the full brillouin zone 
-        #and project them along field dir
-        if self.spin==1: self.expandDipoles(self.dipoles,project=project)
-        if self.spin==2:
-            dip_up, dip_dn = self.dipoles[0], self.dipoles[1]
-            exp_dip      = self.expandDipoles
-            self.dipoles = np.stack((exp_dip(dip_up,spin=0,project=project)[0], exp_dip(dip_dn,spin=1,project=project)[0]),axis=0) 
+        # directions: the rotations of the selected k-points mix the cartesian components
+        self.directions = np.arange(3) if directions is None else np.array(directions,dtype=int).ravel()
+        syms = np.array(lattice.sym_car)[np.unique(np.array(lattice.symmetry_indexes)[self.kpoints_bz])]
+        self.read_directions = np.nonzero(np.any(np.abs(syms[:,self.directions])>1e-8,axis=(0,1)))[0]
 
-    def normalize(self,electrons):
+        #read the database (the expansion to the full BZ is done on first access)
+        self.dipoles_ibz = self.readDB(dip_type)
+
+    @property
+    def dipoles(self):
+        """
+        Dipoles expanded to the full BZ and projected along field_dir: [k,r_i,c,v] or [s,k,r_i,c,v]
+        """
+        if not hasattr(self,'_dipoles'):
+            #expand the dipoles to the full brillouin zone 
+            #and project them along field dir
+            if self.spin==1: self._dipoles = self._expand(self.dipoles_ibz,project=self.project)
+            if self.spin==2:
+                self._dipoles = np.stack([self._expand(self.dipoles_ibz[s],spin=s,project=self.project) for s in range(2)],axis=0)
+        return self._dipoles
+
+    @dipoles.setter
+    def dipoles(self,dipoles):
+        self._dipoles = dipoles
+
+    def normalize(self,electrons,chunk_size=None):
         """ 
         Use the electrons to normalize the dipole matrix elements
+
+        chunk_size -> number of k-points normalized at once (default: all)
         """
         # We take the eivs with the added spin dimensions even in non-spin pol case
-        eiv = electrons.eigenvalues
-        nkpoints, nbands = eiv[0].shape
+        eiv = electrons.eigenvalues[:,self.kpoints_bz]
+        nkpoints = eiv.shape[1]
 
         dipoles = self.dipoles
         if self.spin==1: dipoles = np.expand_dims(dipoles,axis=0)
         print(dipoles.shape)
-        for nk in range(nkpoints):
-            for ns in range(self.spin):
-
-                eiv_sk = eiv[ns,nk]
-            
-                #create eigenvalues differences arrays
-                norm = np.array([ [ec-ev for ev in eiv_sk] for ec in eiv_sk ])
-            
-                #normalize
-                for i,j in product(list(range(nbands)),repeat=2):
-
-                    if norm[i,j] == 0: dipoles[ns,nk,:,i,j] = 0.
-                    else: dipoles[ns,nk,:,i,j] = dipoles[ns,nk,:,i,j]/norm[i,j]
-
-        if self.spin==1: dipoles=np.squeeze(dipoles)
+        nbands = min(eiv.shape[2],dipoles.shape[-1])
+        if chunk_size is None: chunk_size = nkpoints
+
+        #divide by the eigenvalue differences e_i-e_j (in place), zero where they vanish
+        for ns in range(self.spin):
+            for k1 in range(0,nkpoints,chunk_size):
+                ks = slice(k1,min(k1+chunk_size,nkpoints))
+                eiv_sk = eiv[ns,ks,:nbands]
+                norm = (eiv_sk[:,:,np.newaxis]-eiv_sk[:,np.newaxis,:])[:,np.newaxis]
+                dip  = dipoles[ns,ks,:,:nbands,:nbands]
+                dipoles[ns,ks,:,:nbands,:nbands] = np.where(norm==0,0.,dip/np.where(norm==0,1.,norm))
+
+        if self.spin==1: dipoles=dipoles[0]
         self.dipoles = dipoles
 
     def readDB(self,dip_type):
         """
         The dipole matrix has the following indexes:
         [nspin, nkpoints, cartesian directions, nbands conduction, nbands valence]
+
+        Only the k-points, bands and directions selected in the constructor are read
         """
         #check if output is in the old format
         fragmentname = "%s_fragment_1"%(self.filename)
         if os.path.isfile(fragmentname): return self.readDB_oldformat(dip_type)
 
         self.dip_type = dip_type
-        if self.spin==1: 
-            dipoles = np.zeros([self.nk_ibz,3,self.nbandsc,self.nbandsv],dtype=np.complex64)
-        if self.spin==2:
-            dipoles = np.zeros([self.spin,self.nk_ibz,3,self.nbandsc,self.nbandsv],dtype=np.complex64)
-        
+        kslab = hyperslab(self.kpoints_ibz)
+        dslab = hyperslab(self.read_directions)
+
         database = Dataset(self.filename)
         dip = database.variables['DIP_%s'%(dip_type)]
-        if self.spin==1:
-            dip = np.squeeze(dip)
-            dip = (dip[:,:,:,:,0]+1j*dip[:,:,:,:,1]) # Read as nk,nv,nc,ir
-        if self.spin==2:
-            dip = (dip[:,:,:,:,:,0]+1j*dip[:,:,:,:,:,1]) # Read as ns,nk,nv,nc,ir
+        # Read as [ns],nk,nv,nc,ir
+        if self.spin==1: index = (0,)*(dip.ndim-5)+(kslab,self.vslice,self.cslice,dslab)
+        if self.spin==2: index = (slice(None),kslab,self.vslice,self.cslice,dslab)
+        dip = dip[index]
+        dip = dip[...,0]+1j*dip[...,1]
         dipoles = np.swapaxes(dip,self.spin,self.spin+2) # Swap indices as mentioned in the docstring
         database.close()
 
@@ -142,7 +232,9 @@ class YamboDipolesDB():
         [nkpoints, cartesian directions, nspin, nbands conduction, nbands valence]
         """
         self.dip_type = dip_type
-        dipoles = np.zeros([self.nk_ibz,3,self.nbandsc,self.nbandsv],dtype=np.complex64)
+        kpoints = range(self.nk_ibz) if self.kpoints_ibz is None else self.kpoints_ibz
+        dslab = hyperslab(self.read_directions)
+        dipoles = np.zeros([len(kpoints),len(self.read_directions),self.nbandsc,self.nbandsv],dtype=np.complex64)
    
         #check dipole db format
         filename = "%s_fragment_1"%(self.filename)
@@ -155,50 +247,59 @@ class YamboDipolesDB():
             dipoles_format = 2
         database.close()
         
-        for nk in range(self.nk_ibz):
+        for ik,nk in enumerate(kpoints):
 
             #open database for each k-point
             filename = "%s_fragment_%d"%(self.filename,nk+1)
             database = Dataset(filename)
 
             if dipoles_format == 1:
-                dip = database.variables['DIP_%s_k_%04d_spin_%04d'%(dip_type,nk+1,1)]
-                dip = (dip[:,:,:,0]+1j*dip[:,:,:,1])
-                for i in range(3):
-                    dipoles[nk,i] = dip[:,:,i].T
+                dip = database.variables['DIP_%s_k_%04d_spin_%04d'%(dip_type,nk+1,1)][self.vslice,self.cslice,dslab]
+                dip = (dip[...,0]+1j*dip[...,1])
+                dipoles[ik] = np.transpose(dip,(2,1,0))
             elif dipoles_format == 2:
-                for i in range(3):
-                    dip = database.variables['DIP_%s_k_%04d_xyz_%04d_spin_%04d'%(dip_type,nk+1,i+1,1)][:]
-                    dipoles[nk,i] = dip[0].T+dip[1].T*1j
+                for i,idir in enumerate(self.read_directions):
+                    dip = database.variables['DIP_%s_k_%04d_xyz_%04d_spin_%04d'%(dip_type,nk+1,idir+1,1)][:,self.vslice,self.cslice]
+                    dipoles[ik,i] = dip[0].T+dip[1].T*1j
 
             #close database
             database.close()
 
         return dipoles
         
-    def expandDipoles(self,dipoles=None,spin=None,project=True):
+    def expandDipoles(self,dipoles=None,spin=None,project=True,chunk_size=None):
         """
         Rotate dipoles from the IBZ to the FBZ
         and project them along field_dir
         (Equivalent to DIP_rotated and DIP_projected in Yambo)
+
+        chunk_size -> number of full-BZ k-points rotated at once, to bound the memory
+                      of the temporary arrays (default: all)
         """
         if dipoles is None:
-            dipoles = self.dipoles
-            
+            dipoles = self.dipoles_ibz
+
+        #save dipoles in the ibz
+        self.dipoles_ibz = dipoles 
+        #get dipoles in the full Brillouin zone
+        self.dipoles = self._expand(dipoles,spin=spin,project=project,chunk_size=chunk_size)
+        return self.dipoles, self.lattice.car_kpoints[self.kpoints_bz]
+
+    def _expand(self,dipoles,spin=None,project=True,chunk_size=None):
+        """
+        Dipoles of one spin channel in the full BZ: [k,r_i,nbands,nbands]
+        (only the k-points in self.kpoints_bz and the directions in self.directions)
+        """
         #check if we need to expand the dipoles to the full BZ
         lattice = self.lattice
-        kpts = lattice.car_kpoints
-        nks  = lattice.kpoints_indexes
-        nss  = lattice.symmetry_indexes
+        nks  = np.array(lattice.kpoints_indexes)[self.kpoints_bz]
+        nss  = np.array(lattice.symmetry_indexes)[self.kpoints_bz]
+        #position of the IBZ k-points in the dipoles read
+        if self.kpoints_ibz is not None: nks = np.searchsorted(self.kpoints_ibz,nks)
         
         #normalize the fields
         self.field_dir  = np.array(self.field_dir)
         self.field_dir  = self.field_dir/np.linalg.norm(self.field_dir)
-        
-        #calculate polarization directions
-        field_dirx = np.array([self.field_dir[0],0.,0.])
-        field_diry = np.array([0.,self.field_dir[1],0.])
-        field_dirz = np.array([0.,0.,self.field_dir[2]])
 
         #get band indexes
         nkpoints = len(nks)
@@ -210,6 +311,8 @@ class YamboDipolesDB():
         if self.open_shell: indexc  = self.indexc_os[spin]
         if self.open_shell: nbandsv = self.nbandsv_os[spin]
         if self.open_shell: nbandsc = self.nbandsc_os[spin]
+        vbands = slice(indexv,indexv+nbandsv)
+        cbands = slice(indexc,indexc+nbandsc)
 
         #Note that P is Hermitian and iR anti-hermitian.
         # [FP] Other possible dipole options to be checked (i.e., velocity gauge needs energy renormalization). Treat them as not supported.
@@ -217,37 +320,32 @@ class YamboDipolesDB():
             factor =  1.0
         else:
             factor = -1.0
-           
-        #save dipoles in the ibz
-        self.dipoles_ibz = dipoles 
-        #get dipoles in the full Brillouin zone
-        self.dipoles = np.zeros([nkpoints,3,nbands,nbands],dtype=np.complex64)
-        for nk_fbz,nk_ibz,ns in zip(list(range(nkpoints)),nks,nss):
-            
-            #if time rev we conjugate
-            if lattice.time_rev_list[ns]:
-                dip = np.conjugate(dipoles[nk_ibz,:,:,:])
-            else:
-                dip = dipoles[nk_ibz,:,:,:]
-
-            #get symmmetry operation
-            sym = lattice.sym_car[ns]
-            #get projection operation
-            pro = np.array([field_dirx,field_diry,field_dirz])
-            #transformation: this is rotation
-            if not project: tra = sym
-            #transformation: this is combined rotation + projection
-            if project:     tra = np.dot(pro,sym)
-
-            #rotate dipoles
-            for c,v in product(list(range(nbandsc)),list(range(nbandsv))):
-                self.dipoles[nk_fbz,:,indexc+c,indexv+v] = np.dot(tra,dip[:,c,v])
+
+        #transformation for each k-point: this is rotation
+        #or combined rotation + projection along field_dir
+        #(from the directions read to the directions selected)
+        tra = np.array(lattice.sym_car)[nss]
+        if project: tra = self.field_dir[np.newaxis,:,np.newaxis]*tra
+        tra = tra[:,self.directions][:,:,self.read_directions]
+        ndirs, nread = len(self.directions), len(self.read_directions)
+        #if time rev we conjugate
+        time_rev = np.array(lattice.time_rev_list)[nss]
+
+        expanded = np.zeros([nkpoints,ndirs,nbands,nbands],dtype=np.complex64)
+        if chunk_size is None: chunk_size = max(nkpoints,1)
+        for k1 in range(0,nkpoints,chunk_size):
+            ks = slice(k1,min(k1+chunk_size,nkpoints))
+            dip = dipoles[nks[ks],:,:nbandsc,:nbandsv]
+            dip = np.where(time_rev[ks,np.newaxis,np.newaxis,np.newaxis],np.conjugate(dip),dip)
+
+            #rotate dipoles: [k,ndirs,nread] x [k,nread,c*v]
+            dip = np.matmul(tra[ks],dip.reshape(len(dip),nread,-1)).reshape(len(dip),ndirs,nbandsc,nbandsv)
+            expanded[ks,:,cbands,vbands] = dip
 
             #make hermitian
-            for c,v in product(list(range(nbandsc)),list(range(nbandsv))):
-                self.dipoles[nk_fbz,:,indexv+v,indexc+c] = factor*np.conjugate(self.dipoles[nk_fbz,:,indexc+c,indexv+v])
+            expanded[ks,:,vbands,cbands] = factor*np.conjugate(dip).swapaxes(2,3)
                         
-        return self.dipoles, kpts
+        return expanded
 
     def plot(self,ax,kpoint=0,dir=0,func=abs2):
         return ax.matshow(func(self.dipoles[kpoint,dir]))
@@ -302,11 +400,12 @@ class YamboDipolesDB():
         if plt_show: plt.show()
         else: print("Plot ready.\nYou can customise adding savefig, title, labels, text, show, etc...")
         
-    def ip_eps2(self,electrons,mode='imag',ntot_dip=-1,nspin=-1,GWshift=0.,broad=0.1,broadtype='l',nbnds=[-1,-1],emin=0.,emax=10.,esteps=500,res_k=False,system_2D=False):
+    def ip_eps2(self,electrons,mode='imag',ntot_dip=-1,nspin=-1,GWshift=0.,broad=0.1,broadtype='l',nbnds=[-1,-1],emin=0.,emax=10.,esteps=500,res_k=False,system_2D=False,chunk_size=None):
         """
         Compute independent-particle absorption [interband transitions]
 
         electrons -> electrons YamboElectronsDB over full BZ (Expand=True)
+                     (if only some kpoints were read, the sum runs over the k-points in self.kpoints_bz)
         ntot_dip -> if nbands_dip in ndb.dipoles < nbands_el in ns.db1, set ntot_dip=nbands_dip 
         nspin -> if -1 spin polarisations are summed (default)
                  if  0 only majority spin channel is considered
@@ -321,6 +420,8 @@ class YamboDipolesDB():
                 'full': complex eps(w) including antiresonant case i.e. dielectric function / additional optical functions
         
         2D_system -> if True, returns 2D polarizability instead of eps2
+        chunk_size -> number of (k-point,transition) pairs evaluated at once
+                      (default: fixed by spectra_memory)
         res_k -> if True, it returns an additional array epskres with IPA absorption for each k-point. 
                  In this way, we can plot it on the 2D-BZ (e.g. integrating over an energy range).
 
@@ -353,6 +454,11 @@ class YamboDipolesDB():
         #Print band gap values and apply GW_shift
         eiv[0]=electrons.energy_gaps(eiv[0],GWshift)
 
+        #only the k-points of the dipoles read
+        if self.kpoints_ibz is not None:
+            eiv = eiv[:,self.kpoints_bz]
+            weights = weights[self.kpoints_bz]
+
         #get dipoles
         dipoles = self.dipoles
         # (shape them according to spin polarization)
@@ -364,10 +470,8 @@ class YamboDipolesDB():
                 eiv = np.expand_dims(eiv[nspin],axis=0)
                 sp_pol = self.spin-1 # sum over one spin channel only
 
-        #get frequencies and im
+        #get frequencies
         freq = np.linspace(emin,emax,esteps)
-        if mode=='imag': eps = np.zeros([len(freq)])
-        if mode=='full': eps = np.zeros([len(freq)],dtype=np.complex64)
 
         #Cut bands to the maximum number used for the dipoles
         if ntot_dip>0: 
@@ -375,6 +479,7 @@ class YamboDipolesDB():
             nc=ntot_dip-nv
 
         #Check bands to include in the calculation
+        nbnds = list(nbnds)
         if nbnds[0]<0: nbnds[0]=nv
         if nbnds[1]<0: nbnds[1]=nc
         iv = nv-nbnds[0] #first valence
@@ -382,8 +487,8 @@ class YamboDipolesDB():
 
         #choose broadening
         if mode=='imag' or res_k:
-            if "l" in broadtype: broadening = lorentzian
-            else:                broadening = gaussian
+            if "l" in broadtype: broadening = _lorentzian_kernel
+            else:                broadening = _gaussian_kernel
 
         #dimensional factors
         if self.spin == 1 : spin_deg=2
@@ -391,51 +496,32 @@ class YamboDipolesDB():
         cofactor = spin_deg*8.*np.pi/(self.lattice.rlat_vol)
 
         na = np.newaxis
-        epskres = np.zeros([esteps,nkpoints])
-        #calculate epsilon
-        for c,v,s in product(range(nv,lc),range(iv,nv),range(sp_pol)):
-
-                #get electron-hole energy and dipoles
-                #(sum over pol directions if needed)
-                eivs = eiv[s]
-                ecv  = eivs[:,c]-eivs[:,v]
-
-                # these are the expanded+projected dipoles already
-                dips = dipoles[s]
-                if self.project:     dip2= np.abs( np.sum( dips[:,:,c,v], axis=1) )**2.
-                if not self.project: dip2 = np.abs( np.einsum('j,ij->i', self.field_dir , dips[:,:,c,v]) )**2
-
-                #make dimensions match
-                dip2a = dip2[na,:]
-                ecva  = ecv[na,:]
-                freqa = freq[:,na]
-                # rescale weight factors because we are in the expanded BZ
-                wa    = weights[na,:]*self.nk_ibz/nkpoints       
-
-                if mode=='imag' or res_k: 
-                    #calculate the lorentzians 
-                    broadw = broadening(freqa,ecva,broad)
-   
-                    #scale broadening with dipoles and weights
-                    epsk =  wa*dip2a*broadw
+        #get electron-hole energies and dipoles of all the (s,c,v) transitions: [s,k,c,v]
+        eivs = eiv[:sp_pol]
+        ecv  = eivs[:,:,nv:lc,na]-eivs[:,:,na,iv:nv]
 
-                    #k-resolved absorption
-                    if res_k: epskres+=epsk
+        # these are the expanded+projected dipoles already
+        #(sum over pol directions if needed)
+        dips = dipoles[:sp_pol,:,:,nv:lc,iv:nv]
+        if self.project:     dip2 = np.abs( np.sum( dips, axis=2) )**2.
+        if not self.project: dip2 = np.abs( np.einsum('j,skjcv->skcv', self.field_dir[self.directions], dips) )**2
 
-                    #integrate over kpoints
-                    if mode=='imag': eps += np.sum(epsk,axis=1)
+        # rescale weight factors because we are in the expanded BZ
+        osc = dip2*(weights*self.nk_ibz/nkpoints)[na,:,na,na]
 
-                if mode=='full':
-                    #construct complex-valued response function
-                    #including resonant and antiresonant components
-                    G1 = -1./(freqa-ecva+broad*I)
-                    G2 = -1./(-freqa-ecva-broad*I)
+        #transitions of each k-point: [k,s*c*v]
+        ecv = np.moveaxis(ecv,1,0).reshape(len(self.kpoints_bz),-1)
+        osc = np.moveaxis(osc,1,0).reshape(len(self.kpoints_bz),-1)
 
-                    # oscillators
-                    osc = wa*dip2a
+        if mode=='imag' or res_k:
+            #scale broadening with dipoles and weights and integrate over kpoints
+            eps, epskres = self._transitions_sum(freq,ecv,osc,broadening,broad,res_k=res_k,chunk_size=chunk_size)
 
-                    # +=: sum over (c,v,s) ; np.sum(axis=1): sum over k                    
-                    eps += np.sum(osc*(G1+G2),axis=1)/np.pi
+        if mode=='full':
+            #construct complex-valued response function
+            #including resonant and antiresonant components
+            eps = self._transitions_sum(freq,ecv,osc,_green_kernel,broad,chunk_size=chunk_size,dtype=complex)[0]
+            eps = (eps/np.pi).astype(np.complex64)
 
         eps = eps*cofactor
        
@@ -453,6 +539,45 @@ class YamboDipolesDB():
         if res_k: return freq, eps, epskres
         else:     return freq, eps
 
+    def _transitions_sum(self,freq,ecv,osc,kernel,broad,res_k=False,chunk_size=None,dtype=float):
+        """
+        Sum the broadened transitions of all k-points
+
+            eps(w) = sum_kt osc_kt kernel(w,ecv_kt,broad)
+
+            freq   -> frequencies [nfreqs]
+            ecv    -> transition energies [nkpoints,ntransitions]
+            osc    -> oscillator strengths [nkpoints,ntransitions]
+            kernel -> broadening function kernel(freq,ecv,broad) returning an array [nfreqs,len(ecv)]
+            res_k  -> if True, also return the k-resolved sum [nfreqs,nkpoints] (None otherwise)
+
+        The (k,transition) pairs are processed in chunks of chunk_size pairs at once,
+        by default chosen to keep each [nfreqs,chunk_size] array below spectra_memory bytes.
+        """
+        nkpoints, ntransitions = ecv.shape
+        npairs = nkpoints*ntransitions
+        ecv, osc = ecv.ravel(), osc.ravel()
+        if chunk_size is None: chunk_size = max(1,self.spectra_memory//(np.dtype(dtype).itemsize*max(len(freq),1)))
+
+        eps = np.zeros([len(freq)],dtype=dtype)
+        epskres = np.zeros([len(freq),nkpoints]) if res_k else None
+        for start in range(0,npairs,chunk_size):
+            stop = min(start+chunk_size,npairs)
+            broadw = kernel(freq,ecv[start:stop],broad)
+
+            if not res_k:
+                eps += np.dot(broadw,osc[start:stop])
+                continue
+
+            epsk = broadw*osc[np.newaxis,start:stop]
+            eps += np.sum(epsk,axis=1)
+            #k-resolved absorption: sum the pairs of each k-point in the chunk
+            k1, k2 = start//ntransitions, (stop-1)//ntransitions+1
+            bounds = np.maximum(np.arange(k1,k2)*ntransitions,start)-start
+            epskres[:,k1:k2] += np.add.reduceat(epsk,bounds,axis=1)
+
+        return eps, epskres
+
     def add_drude(self,freq,eps,omegap,gammap):
         """
         Add 3D Drude term from semiclassical electron gas, i.e.,
@@ -499,6 +624,8 @@ class YamboDipolesDB():
         app("indexv : %d" % (self.min_band-1))
         app("indexc : %d" % self.indexc)
         app("gauge  : %s" % (self.dip_type))
+        if self.kpoints_ibz is not None: app("kpoints read: %d ibz, %d bz" % (len(self.kpoints_ibz),len(self.kpoints_bz)))
+        app("directions: %s" % (" ".join("xyz"[i] for i in self.directions)))
         app("spin:")
         app("spin pol         : %d" % (self.spin))
         if self.spin==2:
@@ -11,10 +11,10 @@ import os
 import numpy as np
 from netCDF4 import Dataset
 from yambopy.tools.string import marquee
-from yambopy.tools.funcs import fermi, fermi_array
+from yambopy.tools.funcs import smeared_occupations
 from yambopy.lattice import car_red, rec_lat, vol_lat
 from yambopy.kpoints import expand_kpoints, get_path
-from yambopy.plot.spectra import get_spectra
+from yambopy.plot.spectra import get_spectra_binned
 from yambopy.units import ha2ev
 
 class YamboElectronsDB():
@@ -221,61 +221,63 @@ class YamboElectronsDB():
 
     @property
     def efermi(self):
-        if not hasattr(self,"_efermi") and self.Expand:
-            # AMS: To be tested
-            self._efermi = self.GetFermi()
+        if not hasattr(self,"_efermi"):
+            self._efermi = self.GetFermi(setfermi=False)
         return self._efermi
 
-    def GetFermi(self,inv_smear=0.001,verbose=0,setfermi=True):
-        """ Determine the fermi energy
+    @efermi.setter
+    def efermi(self,efermi):
+        self._efermi = efermi
+
+    def occupations_minus_ne(self,ef,inv_smear=0.001,smearing='fermi-dirac',order=1):
+        """ The total occupation minus the total number of electrons
+            (sum over spin, IBZ k-points with their weights and bands)
         """
-        from scipy.optimize import bisect
+        self.expand_kpoints(verbose=0)
+        weights = self.weights_ibz[:self.nkpoints_ibz]
+        occupations = smeared_occupations(self.eigenvalues_ibz,ef,inv_smear,smearing=smearing,order=order)
+        return self.spin_degen*np.einsum('skb,k->',occupations,weights)-self.nelectrons
 
-        kpts, nks, nss = self.expand_kpoints()
+    def GetFermi(self,inv_smear=0.001,verbose=0,setfermi=True,smearing='fermi-dirac',order=1):
+        """ Determine the fermi energy
 
-        def fermi_array(e_array,ef):
-            """ Fermi dirac function for an array
-            """
-            e_array = (e_array-ef)/inv_smear
-            return [ fermi(e) for e in e_array]
+            inv_smear -> smearing width in eV
+            smearing  -> 'fermi-dirac', 'gaussian' or 'methfessel-paxton' (of order `order`)
 
-        def occupation_minus_ne(ef):
-            """ The total occupation minus the total number of electrons
-            """
-            if self.spinor == 1:
-               return sum([sum(self.spin_degen*fermi_array(self.eigenvalues[0,nk],ef))*self.weights[nk] for nk in range(self.nkpoints)])-self.electrons
-            elif self.spinor == 2:
-               sum_up = sum([sum(self.spin_degen*fermi_array(self.eigenvalues[0,nk],ef))*self.weights[nk] for nk in range(self.nkpoints)]) 
-               sum_dw = sum([sum(self.spin_degen*fermi_array(self.eigenvalues[1,nk],ef))*self.weights[nk] for nk in range(self.nkpoints)]) 
-               return sum_up + sum_dw -self.electrons
-     
-        efermi = bisect(occupation_minus_ne,self.min_eival,self.max_eival)
+            The root of occupations_minus_ne is found with Brent's method in a bracket
+            enclosing all the eigenvalues
+        """
+        from scipy.optimize import brentq
+
+        f = lambda ef: self.occupations_minus_ne(ef,inv_smear,smearing,order)
+        emin = np.min(self.eigenvalues_ibz)-10*inv_smear
+        emax = np.max(self.eigenvalues_ibz)+10*inv_smear
+        if f(emin)*f(emax) > 0:
+            raise ValueError('The Fermi level is not within the bands: %d electrons, %d bands'%(self.nelectrons,self.nbands))
+
+        efermi = brentq(f,emin,emax,xtol=1e-12*max(1.,abs(emax-emin)))
 
         if verbose: print("fermi: %lf eV"%efermi)
 
-        if setfermi: return self.setFermi(efermi, inv_smear)
+        if setfermi: return self.setFermi(efermi,inv_smear,smearing,order)
         else:        return efermi
 
-    def setFermi(self,fermi,invsmear):
+    def setFermi(self,fermi,invsmear,smearing='fermi-dirac',order=1):
         """
         Shift bands and get occupations
         """
         self.invsmear = invsmear
+        self.smearing = smearing
         self.efermi = fermi
 
         #full brillouin zone
-        self.eigenvalues     -= self.efermi
-        self.occupations = np.zeros([self.spin,self.nkpoints,self.nbands],dtype=np.float32)
-        for nspin in range(self.spin):
-            for nk in range(self.nkpoints):
-                self.occupations[nspin,nk] = fermi_array(self.eigenvalues[nspin,nk,:self.nbands],0)
+        if hasattr(self,'eigenvalues'):
+            self.eigenvalues -= self.efermi
+            self.occupations  = smeared_occupations(self.eigenvalues[:,:,:self.nbands],0.,invsmear,smearing,order).astype(np.float32)
 
         #for the ibz
         self.eigenvalues_ibz -= self.efermi
-        self.occupations_ibz = np.zeros([self.spin,self.nkpoints_ibz,self.nbands],dtype=np.float32)
-        for nspin in range(self.spin):
-            for nk in range(self.nkpoints_ibz):
-                self.occupations_ibz[nk] = fermi_array(self.eigenvalues_ibz[nspin,nk,:],0,self.invsmear)
+        self.occupations_ibz  = smeared_occupations(self.eigenvalues_ibz,0.,invsmear,smearing,order).astype(np.float32)
 
         return self.efermi
 
@@ -289,7 +291,7 @@ class YamboElectronsDB():
         #top of valence
         top = np.max(eigenvalues[:,:,self.nbandsv-1])
         #bottom of conduction
-        bot = np.max(eigenvalues[:,:,self.nbandsv])
+        bot = np.min(eigenvalues[:,:,self.nbandsv])
         efermi = (top+bot)/2.
         self.setFermi(efermi,broad)
 
@@ -421,24 +423,28 @@ class YamboElectronsDB():
         """
         Retrieve the Density of States (DOS)
         (Should work for metals as well but untested)
+
+        The eigenvalues are binned and convolved with the broadening (see get_spectra_binned)
         """
         if eigenvalues is None: eigenvalues = self.eigenvalues_ibz[0] # assume non spin polarized if not given
         if not self.EXPAND: self.expandEigenvalues()                  # we need this to get the weights
         weights = self.weights_ibz[:self.nkpoints_ibz]
         
-        w, dos = get_spectra(eigenvalues,weights=weights,broadening=broad,emin=emin,emax=emax,estep=estep)
+        w, dos = get_spectra_binned(eigenvalues,weights=weights,broadening=broad,emin=emin,emax=emax,estep=estep)
 
         return w, dos
 
     def getJDOS(self,eigenvalues=None,nconduction=None,broad=0.1,emin=0,emax=10,estep=0.01):
         """
         Calculate the joint density of states
+
+        The transition energies are binned and convolved with the broadening (see get_spectra_binned)
         """
         transitions = self.get_transitions(eigenvalues=eigenvalues,nconduction=nconduction)
         if not self.EXPAND: self.expandEigenvalues() # we need this to get the weights
         weights = self.weights_ibz[:self.nkpoints_ibz]
 
-        w, jdos = get_spectra(transitions,weights=weights,broadening=broad,emin=emin,emax=emax,estep=estep)
+        w, jdos = get_spectra_binned(transitions,weights=weights,broadening=broad,emin=emin,emax=emax,estep=estep)
 
         return w, jdos
     
@@ -447,27 +453,26 @@ class YamboElectronsDB():
         Add electronic lifetimes using the DOS
         """
         self.lifetimes_ibz = np.ones(self.eigenvalues_ibz.shape,dtype=np.float32)*broad
-        if self.Expand: self.lifetimes = np.ones(self.eigenvalues.shape,dtype=np.float32)*broad
+        if self.EXPAND: self.lifetimes = np.ones(self.eigenvalues.shape,dtype=np.float32)*broad
 
     def setLifetimesDOS(self,broad=0.1,debug=False):
         """
         Approximate the electronic lifetimes using the DOS
+
+        The DOS is computed on a grid of step broad/10 and interpolated at all the eigenvalues at once
         """
         eigenvalues = self.eigenvalues_ibz
-        weights = self.weights_ibz
-        nkpoints = self.nkpoints_ibz
 
         #get dos
         emin = np.min(eigenvalues)-broad
         emax = np.max(eigenvalues)+broad
-        energies, dos = self.getDOS(emin=emin, emax=emax, step=0.1, broad=broad)
+        energies, dos = self.getDOS(emin=emin, emax=emax, estep=broad/10., broad=broad)
 
         #normalize dos to broad
         dos = dos/np.max(dos)*broad
 
-        #create a interpolation function to get the lifetimes for all the values
-        from scipy.interpolate import interp1d
-        f = interp1d(energies, dos, kind='cubic')
+        #interpolation function to get the lifetimes for all the values
+        f = lambda e: np.interp(e,energies,dos)
 
         if debug:
             """
@@ -482,8 +487,8 @@ class YamboElectronsDB():
             exit()
 
         #add imaginary part to the energies proportional to the DOS
-        self.lifetimes_ibz = np.array([ [f(eig) for eig in eigk] for eigk in self.eigenvalues_ibz],dtype=np.float32)
-        if self.Expand: self.lifetimes = np.array([ [f(eig) for eig in eigk] for eigk in self.eigenvalues],dtype=np.float32)
+        self.lifetimes_ibz = f(self.eigenvalues_ibz).astype(np.float32)
+        if self.EXPAND: self.lifetimes = f(self.eigenvalues).astype(np.float32)
     
     def __str__(self):
         lines = []; app = lines.append
@@ -9,10 +9,71 @@ from math import sqrt
 import numpy as np
 from yambopy.tools.string import marquee
 import os
+from functools import partial
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from yambopy.units import ha2ev, ev2cm1, I
 from yambopy.plot.plotting import add_fig_kwargs,BZ_Wigner_Seitz,shifted_grids_2D
+from yambopy.dbs.fragments import read_fragments, get_nfragments, hyperslab
+
+def _get_frequencies(database,iq,modes=slice(None)):
+    return np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][modes])*ha2ev
+
+def _get_eigenmodes(database,modes=slice(None)):
+    #eigs_q[cartesian][atom][mode][complex]
+    eigs_q = database.variables['POLARIZATION_VECTORS'][:,:,modes,:].T
+    return eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*I
+
+def _get_elph(database,iq,var_nm='ELPH_GKKP_Q',bands=slice(None),modes=slice(None),kpoints=slice(None)):
+    #gkkp[k][bnd2][bnd1][mode][complex]
+    gkkp = database.variables['%s%d'%(var_nm,iq+1)][kpoints,bands,bands,modes,:]
+    return np.swapaxes(gkkp[:,:,:,:,0] + I*gkkp[:,:,:,:,1],-1,1)
+
+def _read_frequencies_fragment(filename,iq,modes=slice(None)):
+    with Dataset(filename) as database:
+        return _get_frequencies(database,iq,modes)
+
+def _read_eigenmodes_fragment(filename,iq,modes=slice(None)):
+    with Dataset(filename) as database:
+        return _get_eigenmodes(database,modes)
+
+def _read_elph_fragment(filename,iq,var_nm='ELPH_GKKP_Q',bands=slice(None),modes=slice(None),kpoints=slice(None)):
+    with Dataset(filename) as database:
+        return _get_elph(database,iq,var_nm,bands,modes,kpoints)
+
+def _read_full_fragment(filename,iq,bands=slice(None),modes=slice(None),kpoints=slice(None),read_bare=False):
+    """
+    Open a fragment once and read frequencies, eigenmodes, dressed and (optionally) bare gkkp
+    """
+    with Dataset(filename) as database:
+        data = ( _get_frequencies(database,iq,modes),
+                 _get_eigenmodes(database,modes),
+                 _get_elph(database,iq,'ELPH_GKKP_Q',bands,modes,kpoints) )
+        if read_bare: data += ( _get_elph(database,iq,'ELPH_GKKP_BARE_Q',bands,modes,kpoints), )
+        return data
+
+def scale_gkkp(gkkp,ph_energies,acoustic=None,energy_unit=ha2ev):
+    """
+    Normalise in place the matrix elements by the phonon energies as:
+
+    g_qnu = dvscf_qnu/sqrt(2*w_qnu)
+
+        gkkp        -> complex array with q-points along axis 0 and modes along axis 2,
+                       e.g. gkkp[q][k][mode][bnd1][bnd2] (it is overwritten)
+        ph_energies -> phonon energies [q][mode] in eV
+        acoustic    -> boolean mask [q][mode] of the acoustic modes, whose couplings are set to zero
+        energy_unit -> eV per unit of energy of the matrix elements (ha2ev: Hartree, ha2ev/2: Rydberg)
+
+    The scaled array is returned (it is the same object as gkkp).
+    """
+    ph_E = np.array(ph_energies,dtype=np.float64)/energy_unit
+    zero = np.zeros(ph_E.shape,dtype=bool) if acoustic is None else np.array(acoustic,dtype=bool)
+    factor = np.zeros(ph_E.shape)
+    factor[~zero] = 1./np.sqrt(2.*ph_E[~zero])
+    # factor[q,1,mode,1,...] broadcasts without copies of gkkp
+    factor = factor.reshape(factor.shape[:1]+(1,)+factor.shape[1:]+(1,)*(gkkp.ndim-3))
+    gkkp *= factor
+    return gkkp
 
 class YamboElectronPhononDB():
     """
@@ -22,6 +83,11 @@ class YamboElectronPhononDB():
     
     - Input: YamboLatticeDB object, paths of ndb.elph* and ns.db1
     - Input: if not read_all, read only header
+    - Input: nworkers, number of processes reading the fragments in parallel
+    - Input: bands, [b_first,b_last] subset of the gkkp bands to be kept (python indices as b_in, b_out)
+    - Input: modes, list of phonon modes to be kept (the acoustic ones are the modes 0,1,2)
+    - Input: kpoints, qpoints, lists of k- and q-point indices to be kept
+      (only the selected slices of the fragments are read from disk)
     
     - Usage and main variables: 
     
@@ -30,12 +96,15 @@ class YamboElectronPhononDB():
       :: yph.ph_energies     #Phonon energies (eV)      
       :: yph.ph_eigenvectors #Phonon modes
       :: yph.gkkp            #El-ph matrix elements (by default normalised with ph. energies):
-      :: yph.gkkp_sq         #Couplings (square) 
+      :: yph.gkkp_sq         #Couplings (square, computed when first accessed) 
 
       Additional variables (Experimental stuff)
       :: yph.gkkp_bare
       :: yph.gkkp_bare_sq
-      :: yph.gkkp_mixed      #Coupling (mixed bare-dressed)
+      :: yph.gkkp_mixed      #Coupling (mixed bare-dressed, computed when first accessed)
+
+      With k/q subsets, yph.car_kpoints/yph.qpoints/yph.car_qpoints only contain the selected points
+      (yph.k_indices, yph.q_indices give their position in the full grids)
    
     Formats:
     - modes[il][iat][ix]
@@ -49,9 +118,10 @@ class YamboElectronPhononDB():
       Example, plot of |g(k)_{0,3,4,4}|:      
            :: yph.plot_elph( np.abs(yph.gkkp[0,:,3,4,4]) )              
     """
-    def __init__(self,lattice,filename='ndb.elph_gkkp',folder_gkkp='SAVE',save='SAVE',read_all=True):
+    def __init__(self,lattice,filename='ndb.elph_gkkp',folder_gkkp='SAVE',save='SAVE',read_all=True,nworkers=1,bands=None,modes=None,kpoints=None,qpoints=None):
         
         self.lattice = lattice
+        self.nworkers = nworkers
 
         # Find correct database names
         if os.path.isfile("%s/ndb.elph_gkkp"%folder_gkkp): filename='%s/ndb.elph_gkkp'%folder_gkkp
@@ -93,6 +163,24 @@ class YamboElectronPhononDB():
             self.b_in, self.b_out = [b_1-1,b_2-1]
             self.nbands = b_2-b_1+1
         self.natoms = int(self.nmodes/3)
+        # band and mode subsets
+        if bands is None: 
+            self.band_slice = slice(None)
+        else:
+            if bands[0]<self.b_in or bands[1]>self.b_out or bands[0]>bands[1]:
+                raise ValueError("Band range %s not contained in gkkp bands [%d,%d]"%(str(bands),self.b_in,self.b_out))
+            self.band_slice = slice(bands[0]-self.b_in,bands[1]-self.b_in+1)
+            self.b_in, self.b_out = bands
+            self.nbands = self.b_out-self.b_in+1
+        if modes is None: 
+            self.modes = np.arange(self.nmodes)
+            self.mode_slice = slice(None)
+        else:
+            self.modes = np.array(modes,dtype=int)
+            if np.any(self.modes<0) or np.any(self.modes>=self.nmodes):
+                raise ValueError("Mode indices %s out of range (nmodes=%d)"%(str(modes),self.nmodes))
+            self.mode_slice = hyperslab(self.modes)
+            self.nmodes = len(self.modes)
         # read IBZ k-points
         self.ibz_kpoints_elph = database.variables['HEAD_KPT'][:].T
         self.ibz_car_kpoints = np.array([ k/self.alat for k in self.ibz_kpoints_elph ])
@@ -102,63 +190,78 @@ class YamboElectronPhononDB():
             database.close()
         except KeyError:
             database.close()
+        # k-point subset
+        self.k_indices = np.arange(self.nkpoints) if kpoints is None else np.array(kpoints,dtype=int)
+        if np.any(self.k_indices<0) or np.any(self.k_indices>=self.nkpoints):
+            raise ValueError("K-point indices out of range (nkpoints=%d)"%self.nkpoints)
+        self.k_slice = hyperslab(kpoints)
+        if kpoints is not None:
+            if hasattr(self,'kpoints_elph'): self.kpoints_elph = self.kpoints_elph[self.k_indices]
+            self.car_kpoints = self.car_kpoints[self.k_indices]
+            self.nkpoints = len(self.k_indices)
         
         #Check how many databases are present
-        self.nfrags = self.nqpoints
-        for iq in range(self.nqpoints):
-            if not os.path.isfile("%s%d"%(self.frag_filename,iq+1)): 
-                self.nfrags = iq
-                break
+        self.nfrags = get_nfragments(self.frag_filename,self.nqpoints)
+
+        # q-point subset (one fragment per q-point)
+        self.q_indices = np.arange(self.nfrags) if qpoints is None else np.array(qpoints,dtype=int)
+        if np.any(self.q_indices<0) or np.any(self.q_indices>=self.nfrags):
+            raise ValueError("Q-point indices out of range (%d fragments found)"%self.nfrags)
+        self.nq_read = len(self.q_indices)
+        if qpoints is not None:
+            self.qpoints = self.qpoints[self.q_indices]
+            self.car_qpoints = self.car_qpoints[self.q_indices]
         
         # Keep reading
         if read_all: self.read_full_DB()
         
-    def read_full_DB(self):
+    @property
+    def frag_filenames(self):
+        return [ self.frag_filename + "%d"%(iq+1) for iq in self.q_indices ]
+
+    def read_full_DB(self,scale_g_with_ph_energies=True):
         """
         Read all variables in the ndb.elph_gkkp* dbs as attributes of this class
+
+        Each fragment is opened only once: frequencies, eigenmodes, <dVscf> and,
+        if present, <dVbare> matrix elements are read together.
         """
-        
-        # Frequencies
-        self.read_frequencies()
-        
-        # Eigenmodes
-        self.read_eigenmodes()
+        self.ph_energies     = np.zeros([self.nq_read,self.nmodes])
+        self.ph_eigenvectors = np.zeros([self.nq_read,self.nmodes,self.natoms,3],dtype=np.complex64)
+        # gkkp[q][k][mode][bnd1][bnd2]
+        gkkp_shape = [self.nq_read,self.nkpoints,self.nmodes,self.nbands,self.nbands]
+        self.gkkp  = np.zeros(gkkp_shape,dtype=np.complex64)
+        out = (self.ph_energies,self.ph_eigenvectors,self.gkkp)
+        if self.are_bare_there:
+            self.gkkp_bare = np.zeros(gkkp_shape,dtype=np.complex64)
+            out += (self.gkkp_bare,)
 
-        # <dVscf> matrix elements plus <dVbare> if they exist
-        self.read_elph()
-        if self.are_bare_there: self.read_elph(kind='bare')   
-   
-        # Get square matrix elements
-        self.get_gkkp_sq()
+        read_fragment = partial(_read_full_fragment,bands=self.band_slice,modes=self.mode_slice,kpoints=self.k_slice,read_bare=self.are_bare_there)
+        read_fragments(read_fragment,self.frag_filenames,out=out,nworkers=self.nworkers,indices=self.q_indices)
+        self.reset_couplings()
         
-        # Get the symmetrised dressed-bare coupling
-        if self.are_bare_there: self.get_gkkp_mixed()
+        # Check integrity of elph values and scale with phonon energies
+        for gkkp in out[2:]:
+            if np.isnan(gkkp).any(): print('[WARNING] NaN values detected in elph database.')
+        if scale_g_with_ph_energies:
+            self.gkkp = self.scale_g(self.gkkp)
+            if self.are_bare_there: self.gkkp_bare = self.scale_g(self.gkkp_bare)
 
     def read_frequencies(self):
         """
         Read phonon frequencies in eV
         """
-        self.ph_energies  = np.zeros([self.nfrags,self.nmodes])
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            self.ph_energies[iq] = np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][:])*ha2ev
-            database.close()
+        self.ph_energies  = np.zeros([self.nq_read,self.nmodes])
+        read_frequencies = partial(_read_frequencies_fragment,modes=self.mode_slice)
+        read_fragments(read_frequencies,self.frag_filenames,out=self.ph_energies,nworkers=self.nworkers,indices=self.q_indices)
         
     def read_eigenmodes(self):
         """
         Read phonon eigenmodes
         """
-        self.ph_eigenvectors = np.zeros([self.nfrags,self.nmodes,self.natoms,3],dtype=np.complex64)
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            #eigs_q[cartesian][atom][mode][complex]
-            eigs_q = database.variables['POLARIZATION_VECTORS'][:].T
-            self.ph_eigenvectors[iq] = eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*I
-            database.close()
+        self.ph_eigenvectors = np.zeros([self.nq_read,self.nmodes,self.natoms,3],dtype=np.complex64)
+        read_eigenmodes = partial(_read_eigenmodes_fragment,modes=self.mode_slice)
+        read_fragments(read_eigenmodes,self.frag_filenames,out=self.ph_eigenvectors,nworkers=self.nworkers,indices=self.q_indices)
              
     def read_elph(self,kind='dressed',scale_g_with_ph_energies=True):
         """
@@ -179,14 +282,9 @@ class YamboElectronPhononDB():
         if kind=='bare':    var_nm = 'ELPH_GKKP_BARE_Q'       
         
         # gkkp[q][k][mode][bnd1][bnd2]
-        gkkp_full = np.zeros([self.nfrags,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)   
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            gkkp = database.variables['%s%d'%(var_nm,iq+1)][:]
-            gkkp_full[iq] = np.swapaxes(gkkp[:,:,:,:,0] + I*gkkp[:,:,:,:,1],-1,1)
-            database.close()
+        gkkp_full = np.zeros([self.nq_read,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)   
+        read_elph = partial(_read_elph_fragment,var_nm=var_nm,bands=self.band_slice,modes=self.mode_slice,kpoints=self.k_slice)
+        read_fragments(read_elph,self.frag_filenames,out=gkkp_full,nworkers=self.nworkers,indices=self.q_indices)
         
         # Check integrity of elph values
         if np.isnan(gkkp_full).any(): print('[WARNING] NaN values detected in elph database.')
@@ -196,36 +294,83 @@ class YamboElectronPhononDB():
                 
         if kind=='dressed': self.gkkp = gkkp_full
         if kind=='bare': self.gkkp_bare = gkkp_full          
+        self.reset_couplings()
     
     def scale_g(self,dvscf):
         """
-        Normalise matrix elements by the phonon energy as: 
+        Normalise matrix elements by the phonon energy (in place) as: 
        
         g_qnu = dvscf_qnu/sqrt(2*w_qnu)
+
+        The acoustic modes at q=0 are set to zero.
         """
-        
-        g = np.zeros([self.nfrags,self.nkpoints,self.nmodes,self.nbands,self.nbands],dtype=np.complex64)
-        for iq in range(self.nfrags):
-            for inu in range(self.nmodes): 
-                if iq==0 and inu in [0,1,2]: 
-                    g[iq,:,inu,:,:] = 0. # Remove acoustic branches
-                else:
-                    ph_E = self.ph_energies[iq,inu]/ha2ev # Put back the energies in Hartree units
-                    g[iq,:,inu,:,:] = dvscf[iq,:,inu,:,:]/np.sqrt(2.*ph_E)
-        return g
-
-    def get_gkkp_sq(self,read_bare=False):
+        acoustic = np.logical_and.outer(self.q_indices==0,self.modes<3)
+        return scale_gkkp(dvscf,self.ph_energies,acoustic=acoustic,energy_unit=ha2ev)
+
+    def get_gkkp_sq(self,kind='dressed'):
         """
         Return g^2
+        
+        - kind is 'dressed' or 'bare'
         """
-        self.gkkp_sq = np.abs(self.gkkp)**2. 
-        if self.are_bare_there: self.gkkp_bare_sq = np.abs(self.gkkp_bare)**2. 
+        if kind=='dressed':
+            self._gkkp_sq = np.abs(self.gkkp)**2. 
+            return self._gkkp_sq
+        if kind=='bare':
+            self._gkkp_bare_sq = np.abs(self.gkkp_bare)**2. 
+            return self._gkkp_bare_sq
+        raise ValueError("Wrong kind %s (can be 'dressed' [Default] or 'bare')"%kind) 
 
     def get_gkkp_mixed(self):
         """
         Return the symmetrised dressed-bare coupling
         """
-        self.gkkp_mixed = np.real(self.gkkp)*np.real(self.gkkp_bare)+np.imag(self.gkkp)*np.imag(self.gkkp_bare)
+        self._gkkp_mixed = np.real(self.gkkp)*np.real(self.gkkp_bare)+np.imag(self.gkkp)*np.imag(self.gkkp_bare)
+        return self._gkkp_mixed
+
+    @property
+    def gkkp(self):
+        return self._gkkp
+
+    @gkkp.setter
+    def gkkp(self,gkkp):
+        self._gkkp = gkkp
+        self.reset_couplings()
+
+    @property
+    def gkkp_bare(self):
+        return self._gkkp_bare
+
+    @gkkp_bare.setter
+    def gkkp_bare(self,gkkp_bare):
+        self._gkkp_bare = gkkp_bare
+        self.reset_couplings()
+
+    @property
+    def gkkp_sq(self):
+        """
+        |g|^2, computed on first access. It is recomputed when gkkp (or gkkp_bare) is reassigned,
+        call reset_couplings() after changing their values in place.
+        """
+        if not hasattr(self,'_gkkp_sq'): self.get_gkkp_sq()
+        return self._gkkp_sq
+
+    @property
+    def gkkp_bare_sq(self):
+        if not hasattr(self,'_gkkp_bare_sq'): self.get_gkkp_sq(kind='bare')
+        return self._gkkp_bare_sq
+
+    @property
+    def gkkp_mixed(self):
+        if not hasattr(self,'_gkkp_mixed'): self.get_gkkp_mixed()
+        return self._gkkp_mixed
+
+    def reset_couplings(self):
+        """
+        Discard the derived couplings (|g|^2, mixed) so that they are recomputed from the current gkkp
+        """
+        for name in ['_gkkp_sq','_gkkp_bare_sq','_gkkp_mixed']:
+            if hasattr(self,name): delattr(self,name)
         
     @add_fig_kwargs
     def plot_elph(self,data,kcoords=None,plt_show=False,plt_cbar=False,**kwargs):
@@ -295,13 +440,14 @@ class YamboElectronPhononDB():
         app('nbands: %d (%d - %d)'%(self.nbands,self.b_in,self.b_out))
         if self.nfrags == self.nqpoints: app('fragments: %d'%self.nfrags)
         else: app('fragments: %d [WARNING] nfrags < nqpoints'%self.nfrags)
+        if self.nq_read != self.nfrags: app('qpoints read: %d'%self.nq_read)
         if self.are_bare_there: app('bare couplings are present')
         if verbose:
             app('-----------------------------------')
-            for iq in range(self.nfrags):
-                app('nqpoint %d'%iq)
+            for iq in range(self.nq_read):
+                app('nqpoint %d'%self.q_indices[iq])
                 for n,mode in enumerate(self.ph_eigenvectors[iq]):
-                    app('mode %d freq: %lf meV'%(n,self.ph_energies[iq,n]*1000.))
+                    app('mode %d freq: %lf meV'%(self.modes[n],self.ph_energies[iq,n]*1000.))
                     for a in range(self.natoms):
                         app(("%12.8lf "*3)%tuple(mode[a].real))
             app('-----------------------------------')
@@ -12,8 +12,27 @@ import shutil
 import numpy as np
 import matplotlib.pyplot as plt
 from netCDF4 import Dataset
-from yambopy.lattice import rec_lat, car_red
+from yambopy.lattice import rec_lat, car_red, GvectorsMap
 from yambopy.tools.string import marquee
+from yambopy.dbs.fragments import read_fragments
+
+def _read_X_fragment(filename,nq):
+    #open database for each k-point
+    try:
+        database = Dataset(filename)
+    except:
+        raise IOError("Error opening %s in YamboStaticScreeningDB"%filename)
+
+    # static screening means we have only one frequency
+    # this try except is because the way this is stored has changed in yambo
+    # Reading like this is not the best way to do it, but it works for now 
+    try:
+        re, im = database.variables['X_Q_%d'%(nq+1)][0,:]
+    except:
+        re, im = database.variables['X_Q_%d'%(nq+1)][0,:].T
+    database.close()
+
+    return re + 1j*im
 
 class YamboStaticScreeningDB(object):
     """
@@ -32,8 +51,9 @@ class YamboStaticScreeningDB(object):
         \epsilon_{0,0}(q)={\epsilon^{-1}(q)}^{-1}_{0,0}
         
     """
-    def __init__(self,save='.',em1s='.',filename='ndb.em1s',db1='ns.db1',do_not_read_cutoff=False):
+    def __init__(self,save='.',em1s='.',filename='ndb.em1s',db1='ns.db1',do_not_read_cutoff=False,nworkers=1):
         self.save = save
+        self.nworkers = nworkers
         self.em1s = em1s
         self.filename = filename
         self.no_cutoff = do_not_read_cutoff
@@ -102,28 +122,8 @@ class YamboStaticScreeningDB(object):
 
         #create database to hold all the X data
         self.X = np.zeros([self.nqpoints,self.size,self.size],dtype=np.complex64)
-        for nq in range(self.nqpoints):
-
-            #open database for each k-point
-            filename = "%s/%s_fragment_%d"%(self.em1s,self.filename,nq+1)
-            try:
-                database = Dataset(filename)
-            except:
-                print("warning: failed to read %s"%filename)
-
-
-            # static screening means we have only one frequency
-            # this try except is because the way this is stored has changed in yambo
-            # Reading like this is not the best way to do it, but it works for now 
-            try:
-                re, im = database.variables['X_Q_%d'%(nq+1)][0,:]
-            except:
-                re, im = database.variables['X_Q_%d'%(nq+1)][0,:].T
-
-            self.X[nq] = re + 1j*im
-         
-            #close database
-            database.close()
+        filenames = [ "%s/%s_fragment_%d"%(self.em1s,self.filename,nq+1) for nq in range(self.nqpoints) ]
+        read_fragments(_read_X_fragment,filenames,out=self.X,nworkers=self.nworkers)
 
     def saveDBS(self,path):
         """
@@ -162,10 +162,10 @@ class YamboStaticScreeningDB(object):
         get the index of the gvectors.
         If the gvector is not present return None
         """
-        for ng,gvec in enumerate(self.gvectors):
-            if np.isclose(g,gvec).all():
-                return ng
-        return None
+        if not hasattr(self,'_gvectors_map'): self._gvectors_map = GvectorsMap(self.red_gvectors)
+        ng = self._gvectors_map(car_red(g,self.rlat))
+        if ng<0: return None
+        return int(ng)
 
     def get_Coulomb(self):
         """
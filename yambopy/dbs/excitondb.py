@@ -19,7 +19,7 @@ from yambopy.kpoints import get_path, get_path_car
 from yambopy.tools.funcs import gaussian, lorentzian, boltzman_f, abs2
 from yambopy.tools.string import marquee
 from yambopy.plot.bandstructure import YambopyBandStructure
-from yambopy.tools.skw import SkwInterpolator
+from yambopy.tools.skw import get_skw_interpolator
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
 from yambopy.dbs.qpdb import YamboQPDB
@@ -60,12 +60,143 @@ class Exciton():
     def __str__(self):
         return self.get_string()
 
+def expand_index(index,ndim):
+    """
+    Write a numpy index as a tuple with one entry per axis (plus the np.newaxis entries),
+    as numpy does: the Ellipsis is expanded and boolean arrays become integer arrays.
+    Returns the list of entries and the positions of the entries acting on each axis.
+    """
+    if not isinstance(index,tuple): index = (index,)
+    entries = []
+    for entry in index:
+        if entry is not None and entry is not Ellipsis and not isinstance(entry,slice):
+            entry = np.asarray(entry)
+            if entry.dtype == bool:
+                if entry.ndim == 0: raise IndexError('scalar boolean indices are not supported')
+                entries.extend(np.nonzero(entry)); continue
+            if entry.size == 0: entry = entry.astype(int)
+            if not np.issubdtype(entry.dtype,np.integer):
+                raise IndexError('only integers, slices, ellipsis, numpy.newaxis and integer or boolean arrays are valid indices')
+            if entry.ndim == 0: entry = int(entry)
+        entries.append(entry)
+
+    nellipsis = sum(entry is Ellipsis for entry in entries)
+    if nellipsis > 1: raise IndexError("an index can only have a single ellipsis ('...')")
+    naxes = sum(entry is not None and entry is not Ellipsis for entry in entries)
+    if naxes > ndim:
+        raise IndexError('too many indices for array: array is %d-dimensional, but %d were indexed'%(ndim,naxes))
+    if nellipsis:
+        pos = [ entry is Ellipsis for entry in entries ].index(True)
+        entries = entries[:pos] + [slice(None)]*(ndim-naxes) + entries[pos+1:]
+    else:
+        entries = entries + [slice(None)]*(ndim-naxes)
+    axes = [ pos for pos,entry in enumerate(entries) if entry is not None ]
+    return entries, axes
+
+def gather_index(entry,length):
+    """
+    Rows to be read along an axis of size length for one index entry (integer, slice or integer array)
+    Returns the rows (a forward slice or a sorted array of unique indices) and the entry
+    to be used on the rows read, which is of the same kind as the original one.
+    """
+    if isinstance(entry,slice):
+        start, stop, step = entry.indices(length)
+        if step > 0: return slice(start,stop,step), slice(None)
+        return np.arange(start,stop,step)[::-1], slice(None,None,-1)
+    entry = np.asarray(entry)
+    if np.any(entry < -length) or np.any(entry >= length):
+        raise IndexError('index out of bounds for axis with size %d'%length)
+    rows, inverse = np.unique(np.where(entry<0,entry+length,entry),return_inverse=True)
+    if entry.ndim == 0: return rows, 0
+    return rows, inverse.reshape(entry.shape)
+
+class ExcitonEigenvectors():
+    """
+    Lazy view of the BS_EIGENSTATES variable of a ndb.BS_diago_Q* database
+
+    The netCDF variable is kept open and only the exciton rows being indexed
+    are read from disk, e.g. eigenvectors[[0,3,7]] reads three rows.
+    The real and imaginary parts are merged for each slice separately.
+
+        Usage: eivs[i_exc]          -> [ntransitions]
+               eivs[i_exc,i_t]      -> complex
+               eivs[[i1,i2,...],:]  -> [len(excitons),ntransitions]
+               np.array(eivs)       -> full [nexcitons,ntransitions] array
+
+        Any numpy index gives the same result as on the full array.
+    """
+    ndim = 2
+
+    def __init__(self,filename,varname='BS_EIGENSTATES'):
+        self.filename = filename
+        self.varname  = varname
+        self._database = None
+        self.shape = tuple(self.variable.shape[:2])
+
+    @property
+    def variable(self):
+        """ Open netCDF variable (the file is opened at first access)
+        """
+        if self._database is None or not self._database.isopen():
+            self._database = Dataset(self.filename)
+            self._database.set_auto_mask(False)
+        return self._database.variables[self.varname]
+
+    @property
+    def dtype(self): return np.result_type(self.variable.dtype,I)
+
+    def __len__(self): return self.shape[0]
+
+    def close(self):
+        if self._database is not None and self._database.isopen(): self._database.close()
+        self._database = None
+
+    def __del__(self):
+        try: self.close()
+        except Exception: pass
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_database'] = None
+        return state
+
+    def _read_rows(self,rows):
+        """ Read the exciton rows (a forward slice or a sorted array of indices)
+            and merge real and imaginary parts
+        """
+        if not isinstance(rows,slice) and len(rows)==0:
+            return np.zeros((0,self.shape[1]),dtype=self.dtype)
+        eiv = self.variable[rows]
+        return eiv[...,0] + eiv[...,1]*I
+
+    def __getitem__(self,index):
+        # numpy indexing: only the exciton rows needed are read, the full index is then
+        # applied to them with the exciton entry rewritten for the rows read
+        entries, axes = expand_index(index,self.ndim)
+        rows, entries[axes[0]] = gather_index(entries[axes[0]],self.shape[0])
+        return self._read_rows(rows)[tuple(entries)]
+
+    def __array__(self,dtype=None,copy=None):
+        eiv = self[:]
+        if dtype is not None: eiv = eiv.astype(dtype)
+        return eiv
+
+    def __iter__(self):
+        for i_exc in range(len(self)): yield self[i_exc]
+
+    def __repr__(self):
+        return '%s(%s, shape=%s)'%(self.__class__.__name__,self.filename,self.shape)
+
 class YamboExcitonDB(object):
     """ Read the excitonic states database from yambo
 
         Exciton eigenvectors are arranged as eigenvectors[i_exc, i_kvc]
         Transitions are unpacked in table[ i_k, i_v, i_c, i_s_c, i_s_v ] (last two are spin indices)
     """
+    #maximum size in bytes of the temporary arrays used to compute spectra in chunks of excitons
+    spectra_memory = 2**27
+    spectra_precision = {'single':(np.float32,np.complex64),'double':(np.float64,np.complex128)}
+
     def __init__(self,lattice,Qpt,eigenvalues,l_residual,r_residual,spin_pol='no',car_qpoint=None,q_cutoff=None,table=None,eigenvectors=None):
         if not isinstance(lattice,YamboLatticeDB):
             raise ValueError('Invalid type for lattice argument. It must be YamboLatticeDB')
@@ -83,8 +214,12 @@ class YamboExcitonDB(object):
         self.spin_pol = spin_pol
 
     @classmethod
-    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q1',folder='.'):
+    def from_db_file(cls,lattice,filename='ndb.BS_diago_Q1',folder='.',lazy=False):
         """ initialize this class from a file
+
+            lazy -> if True the eigenvectors are not loaded in memory:
+                    an ExcitonEigenvectors view is used instead, reading from file
+                    only the excitons being indexed
         """
         path_filename = os.path.join(folder,filename)
         if not os.path.isfile(path_filename):
@@ -120,9 +255,12 @@ class YamboExcitonDB(object):
             table = None
             eigenvectors = None
             if 'BS_EIGENSTATES' in database.variables:
-                eiv = database.variables['BS_EIGENSTATES'][:]
-                eiv = eiv[:,:,0] + eiv[:,:,1]*I
-                eigenvectors = eiv
+                if lazy:
+                    eigenvectors = ExcitonEigenvectors(path_filename)
+                else:
+                    eiv = database.variables['BS_EIGENSTATES'][:]
+                    eiv = eiv[:,:,0] + eiv[:,:,1]*I
+                    eigenvectors = eiv
                 table = database.variables['BS_TABLE'][:].T.astype(int)
 
             table = table
@@ -201,6 +339,34 @@ class YamboExcitonDB(object):
     @property
     def start_band(self): return min(self.unique_vbands)
 
+    @property
+    def table_indexes(self):
+        """ Zero-based index arrays (k, v, c, spin_c, spin_v) of the transitions in BS_TABLE
+            The spin indices are zero if the table does not contain them
+        """
+        if hasattr(self,"_table_indexes"): return self._table_indexes
+        table = np.asarray(self.table)-1
+        k,v,c = table[:,0], table[:,1], table[:,2]
+        if table.shape[1] >= 5: s_c, s_v = table[:,3], table[:,4]
+        else:                   s_c = s_v = np.zeros_like(k)
+        self._table_indexes = (k,v,c,s_c,s_v)
+        return self._table_indexes
+
+    def get_transition_weights(self,excitons,check_norm=False):
+        """ Get the weights |A^l_t|^2 of each transition t in the excitons l
+
+            excitons -> exciton indices (starting from 1)
+            Returns an array [len(excitons),ntransitions]
+        """
+        if np.ndim(excitons)==0: excitons = (excitons,)
+        excitons = np.asarray(excitons,dtype=int)-1
+        weights = abs2(self.eigenvectors[excitons][:,:self.ntransitions])
+        if check_norm:
+            sum_weights = np.sum(weights,axis=1)
+            for sum_weight in sum_weights:
+                if abs(sum_weight - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weight)
+        return weights
+
     def write_sorted(self,prefix='yambo'):
         """
         Write the sorted energies and intensities to a file
@@ -473,15 +639,10 @@ class YamboExcitonDB(object):
 
         FP: To be moved in yambopy/bse module
         """
-
-        n_excitons = len(excitons)
-        omega_vkl = np.zeros([self.nkpoints, self.nvbands,n_excitons])
-        for i_l,exciton in enumerate(excitons):
-            for i_k in range(self.nkpoints):
-                for i_v in range(self.nvbands):
-                    i_v2 = self.unique_vbands[i_v]
-                    # omega_vk,lambda      = e_(v,k-q) + omega_(lambda,q)
-                    omega_vkl[i_k,i_v,i_l] = energies[i_k,i_v2] + self.eigenvalues.real[exciton-1]
+        excitons = np.asarray(excitons,dtype=int)-1
+        # omega_vk,lambda      = e_(v,k-q) + omega_(lambda,q)
+        energies_v = np.asarray(energies)[:self.nkpoints][:,self.unique_vbands]
+        omega_vkl  = energies_v[:,:,np.newaxis] + self.eigenvalues.real[excitons][np.newaxis,np.newaxis,:]
          
         return omega_vkl
 
@@ -492,26 +653,15 @@ class YamboExcitonDB(object):
         FP: To be moved in yambopy/bse module
         """
         n_excitons = len(excitons)
-        print('self.nkpoints, self.nvbands, n_excitons')
-        print(self.nkpoints, self.nvbands, n_excitons)
-        print('self.unique_vbands')
-        print(self.unique_vbands)
-        print('self.unique_cbands')
-        print(self.unique_cbands)
+        k,v = self.table_indexes[:2]
+        i_v = v - self.unique_vbands[0] # index de VB bands (start at 0)
         rho = np.zeros([self.nkpoints, self.nvbands, n_excitons])
-        for i_exc, exciton in enumerate(excitons):
-            # get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            for t,kvc in enumerate(self.table):
-                k,v,c = kvc[0:3]-1    # This is bug's source between yambo 4.4 and 5.0 check all this part of the class
-                i_v = v - self.unique_vbands[0] # index de VB bands (start at 0)
-                #i_c = c - self.unique_cbands[0] # index de CB bands (start at 0)
-                rho[k,i_v,i_exc] += abs2(eivec[t])
+        np.add.at(rho,(k,i_v),self.get_transition_weights(excitons).T)
 
         return rho
 
     #def arpes_interpolate(self,energies,path,excitons,lpratio=5,f=None,size=1,verbose=True,**kwargs):
-    def arpes_intensity_interpolated(self,energies_db,path,excitons,lpratio=5,f=None,size=1,verbose=True,**kwargs):
+    def arpes_intensity_interpolated(self,energies_db,path,excitons,lpratio=5,f=None,size=1,verbose=True,cache=None,**kwargs):
         """ 
             Interpolate arpes bandstructure using SKW interpolation from Abipy (version 1)
             Change to the Fourier Transform Interpolation
@@ -520,6 +670,8 @@ class YamboExcitonDB(object):
             (something to change)
 
             FP: To be moved in yambopy/bse module
+
+            cache -> see get_skw_interpolator
         """
 
         Im = 1.0j # Imaginary
@@ -586,21 +738,20 @@ class YamboExcitonDB(object):
         nkpoints_path = kpoints_path.shape[0]
 
         na = np.newaxis
-        rho_path   = np.zeros([1, nkpoints_path, self.nvbands, n_excitons])
-        omega_path = np.zeros([1, nkpoints_path, self.nvbands, n_excitons])
-
-        for i_exc in range(n_excitons):
+        # the fit is linear in the data: all the excitons are interpolated at once as extra bands
+        ibz_rho   = ibz_rho.reshape(1,ibz_nkpoints,self.nvbands*n_excitons)
+        ibz_omega = ibz_omega.reshape(1,ibz_nkpoints,self.nvbands*n_excitons)
 
-            # interpolate rho along the k-path
-            skw_rho   = SkwInterpolator(lpratio,ibz_kpoints,ibz_rho[na,:,:,i_exc],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-            rho_path[0,:,:,i_exc] = skw_rho.interp_kpts(kpoints_path).eigens
+        # interpolate rho along the k-path
+        skw_rho   = get_skw_interpolator(lpratio,ibz_kpoints,ibz_rho,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+        rho_path  = skw_rho.interp_kpts(kpoints_path).eigens.reshape(1,nkpoints_path,self.nvbands,n_excitons)
 
-            # interpolate omega along the k-path
-            skw_omega = SkwInterpolator(lpratio,ibz_kpoints,ibz_omega[na,:,:,i_exc],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-            omega_path[0,:,:,i_exc] = skw_omega.interp_kpts(kpoints_path).eigens
+        # interpolate omega along the k-path
+        skw_omega  = get_skw_interpolator(lpratio,ibz_kpoints,ibz_omega,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+        omega_path = skw_omega.interp_kpts(kpoints_path).eigens.reshape(1,nkpoints_path,self.nvbands,n_excitons)
 
         # interpolate energies
-        skw_energie = SkwInterpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw_energie = get_skw_interpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         energies_path = skw_energie.interp_kpts(kpoints_path).eigens
 
         top_valence_band = np.max(energies_path[0,:,0:self.nvbands])
@@ -657,59 +808,34 @@ class YamboExcitonDB(object):
 
     def get_exciton_weights(self,excitons):
         """get weight of state in each band"""
-        weights = np.zeros([self.nkpoints,self.mband])
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv[0:3]-1
-                this_weight = abs2(eivec[t])
-                weights[k,c] += this_weight
-                weights[k,v] += this_weight
-                sum_weights += this_weight
-            if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        k,v,c = self.table_indexes[:3]
+        nk, mband = self.nkpoints, self.mband
+        #sum over the excitons, each of them normalized to one
+        this_weight = np.sum(self.get_transition_weights(excitons,check_norm=True),axis=0)
 
-        return weights
+        #add the weights to both the valence and conduction bands of each transition
+        weights  = np.bincount(k*mband+c,weights=this_weight,minlength=nk*mband)
+        weights += np.bincount(k*mband+v,weights=this_weight,minlength=nk*mband)
+
+        return weights.reshape(nk,mband)
     
     def get_exciton_total_weights(self,excitons):
         """get weight of state in each band"""
-        total_weights = np.zeros(self.nkpoints)
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv[0:3]
-                total_weights[k-1] += abs2(eivec[t])
-            if abs(sum(total_weights) - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        k = self.table_indexes[0]
+        this_weight = np.sum(self.get_transition_weights(excitons,check_norm=True),axis=0)
+        total_weights = np.bincount(k,weights=this_weight,minlength=self.nkpoints)
  
         return total_weights
 
     def get_exciton_transitions(self,excitons):
-        """get weight of state in each band"""
-        # Double check the part of the array w_k_v_to_c
-        # We should comment more this part
-        #weights = np.zeros([self.nkpoints,self.mband])
-        w_k_v_to_c = np.zeros([self.nkpoints,self.nvbands,self.ncbands])
+        """get weight of state in each transition w_k_v_to_c[k,v,c]"""
+        k,v,c = self.table_indexes[:3]
         v_min = self.unique_vbands[0]
         c_min = self.unique_cbands[0]
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            #sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v = kcv-1                             
-                #k,v,c = kcv-1                 # bug?? Double-check
-                this_weight = abs2(eivec[t])
-                w_k_v_to_c[k,v-v_min,c-c_min] = this_weight   # new
-            #if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        w_k_v_to_c = np.zeros([self.nkpoints,self.nvbands,self.ncbands])
+        this_weight = np.sum(self.get_transition_weights(excitons),axis=0)
+        np.add.at(w_k_v_to_c,(k,v-v_min,c-c_min),this_weight)
  
-        #return weights, w_k_v_to_c
         return w_k_v_to_c
 
     def get_exciton_2D(self,excitons,f=None):
@@ -1010,10 +1136,12 @@ class YamboExcitonDB(object):
         self.plot_exciton_bs_ax(ax,energies_db,path,excitons,size=size,space=space,f=f,debug=debug)
         return fig
 
-    def interpolate(self,energies,path,excitons,lpratio=5,f=None,verbose=1,size=1,**kwargs):
+    def interpolate(self,energies,path,excitons,lpratio=5,f=None,verbose=1,size=1,cache=None,**kwargs):
         """ 
         Interpolate exciton bandstructure using SKW interpolation from Abipy
 
+        cache -> see get_skw_interpolator
+
         FP: the QPDB part needs to be tested
         """
 
@@ -1070,11 +1198,11 @@ class YamboExcitonDB(object):
         kpoints_path =  path.get_klist()[:,:3]
         
         #interpolate energies
-        skw = SkwInterpolator(lpratio,kpoints,eigs[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,kpoints,eigs[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         exc_energies = skw.interp_kpts(kpoints_path).eigens
 
         #interpolate weights
-        skw = SkwInterpolator(lpratio,kpoints,weights[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,kpoints,weights[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         exc_weights = skw.interp_kpts(kpoints_path).eigens
 
         # For the band plot (bandstructure object), we need to switch to cartesian coordinates
@@ -1088,8 +1216,10 @@ class YamboExcitonDB(object):
 
         return exc_bands
 
-    def interpolate_transitions(self,energies,path,excitons,lpratio=5,f=None,size=1,verbose=True,**kwargs):
+    def interpolate_transitions(self,energies,path,excitons,lpratio=5,f=None,size=1,verbose=True,cache=None,**kwargs):
         """ Interpolate exciton bandstructure using SKW interpolation from Abipy
+
+        cache -> see get_skw_interpolator
         """
 
         if verbose:
@@ -1130,13 +1260,13 @@ class YamboExcitonDB(object):
 
         #interpolate energies
         na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         energies = skw.interp_kpts(kpoints_path).eigens
      
         #interpolate transitions
         na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_transitions[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_transitions[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         exc_transitions = skw.interp_kpts(kpoints_path).eigens
 
@@ -1146,8 +1276,10 @@ class YamboExcitonDB(object):
 
         return exc_transitions
 
-    def interpolate_spin(self,energies,spin_proj,path,excitons,lpratio=5,f=None,size=1,verbose=True,**kwargs):
+    def interpolate_spin(self,energies,spin_proj,path,excitons,lpratio=5,f=None,size=1,verbose=True,cache=None,**kwargs):
         """ Interpolate exciton bandstructure using SKW interpolation from Abipy
+
+        cache -> see get_skw_interpolator
         """
 
         if verbose:
@@ -1199,13 +1331,13 @@ class YamboExcitonDB(object):
         na = np.newaxis
         print("na")
         print(na)
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_energies[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         energies = skw.interp_kpts(kpoints_path).eigens
      
         #interpolate weights
         na = np.newaxis
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_weights[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         exc_weights = skw.interp_kpts(kpoints_path).eigens
 
@@ -1213,7 +1345,7 @@ class YamboExcitonDB(object):
         na = np.newaxis
         print("na")
         print(na)
-        skw = SkwInterpolator(lpratio,ibz_kpoints,ibz_spin[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_spin[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         spin_inter   = skw.interp_kpts(kpoints_path).eigens
         print("spin_inter")
@@ -1234,21 +1366,17 @@ class YamboExcitonDB(object):
         if isinstance(excitons, int):
             excitons = (excitons,)
        
-        car_kpoints = self.lattice.car_kpoints
-        nkpoints = len(car_kpoints)
-        print(nkpoints)
-        amplitudes = np.zeros([nkpoints])
-        phases     = np.zeros([nkpoints],dtype=np.complex64)
-        for exciton in excitons:
-            #the the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-           
-            total = 0
-            for eh,kvc in enumerate(self.table):
-                ikbz, v, c = kvc-1
-                Acvk = eivec[eh]
-                phases[ikbz]     += Acvk
-                amplitudes[ikbz] += np.abs(Acvk)
+        nkpoints = len(self.lattice.car_kpoints)
+        ikbz = self.table_indexes[0]
+        #the eigenstates summed over the excitons
+        excitons = np.asarray(excitons,dtype=int)-1
+        eivecs = self.eigenvectors[excitons][:,:self.ntransitions]
+        Acvk = np.sum(eivecs,axis=0)
+        Acvk_abs = np.sum(np.abs(eivecs),axis=0)
+
+        amplitudes = np.bincount(ikbz,weights=Acvk_abs,minlength=nkpoints)
+        phases     = np.bincount(ikbz,weights=Acvk.real,minlength=nkpoints) + \
+                     np.bincount(ikbz,weights=Acvk.imag,minlength=nkpoints)*I
 
         #replicate kmesh
         red_kmesh,kindx = replicate_red_kmesh(self.lattice.red_kpoints,repx=repx,repy=repy,repz=repz)
@@ -1256,66 +1384,132 @@ class YamboExcitonDB(object):
 
         return car_kpoints, amplitudes[kindx], np.angle(phases)[kindx]
 
-    def get_chi(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,**kwargs):
-        """
-        Calculate the dielectric response function using excitonic states
+    def get_broadening(self,broad,nexcitons,chunk_size=None):
         """
-        if nexcitons == 'all': nexcitons = self.nexcitons
+        Get the broadening of each excitonic state
 
-        #energy range
-        w = np.arange(emin,emax,estep,dtype=np.float32)
-        nenergies = len(w)
-        
-        if verbose:
-            print("energy range: %lf -> +%lf -> %lf "%(emin,estep,emax))
-            print("energy steps: %lf"%nenergies)
-
-        #initialize the susceptibility intensity
-        chi = np.zeros([len(w)],dtype=np.complex64)
+            broad -> float: constant broadening (eV)
+                     tuple: (broad_min,broad_max) broadening growing linearly with the exciton energy
+                     array: broadening of each exciton
+                     string: 'gaussian: <value> eV' or 'lorentzian: <value> eV'
+                             broadening proportional to the excitonic density of states
 
-        if dipoles is None:
-            #get dipole
-            EL1 = self.l_residual
-            EL2 = self.r_residual
-        else:
-            #calculate exciton-light coupling
-            if verbose: print("calculate exciton-light coupling")
-            EL1,EL2 = self.project1(dipoles.dipoles[:,dir],nexcitons) 
+            Returns an array of size nexcitons
+        """
+        energies = self.eigenvalues[:nexcitons].real
 
-        if isinstance(broad,float): broad = [broad]*nexcitons
+        if isinstance(broad,str):
+            if not ("gaussian" in broad or "lorentzian" in broad):
+                raise ValueError('Unknown broadening %s'%broad)
+            i = broad.find(":")
+            if i == -1: raise ValueError('Broadening width missing in %s (e.g. "gaussian: 0.1 eV")'%broad)
+            value, eunit = broad[i+1:].split()
+            if eunit == "eV": sigma = float(value)
+            else: raise ValueError('Unknown unit %s'%eunit)
 
-        if isinstance(broad,tuple): 
+            f = gaussian if "gaussian" in broad else lorentzian
+            #sum the distribution centered at each exciton, in chunks of excitons
+            if chunk_size is None: chunk_size = max(1,self.spectra_memory//(8*max(nexcitons,1)))
+            broad_dos = np.zeros([nexcitons])
+            for start in range(0,nexcitons,chunk_size):
+                es = energies[start:start+chunk_size]
+                broad_dos += np.sum(f(energies[np.newaxis,:],es[:,np.newaxis],sigma),axis=0)
+            return 0.1*broad_dos/nexcitons
+
+        if isinstance(broad,tuple):
             broad_slope = broad[1]-broad[0]
             min_exciton = np.min(self.eigenvalues.real)
-            broad = [ broad[0]+(es-min_exciton)*broad_slope for es in self.eigenvalues[:nexcitons].real]
+            return broad[0]+(energies-min_exciton)*broad_slope
 
-        if "gaussian" in broad or "lorentzian" in broad:
-            i = broad.find(":")
-            if i != -1:
-                value, eunit = broad[i+1:].split()
-                if eunit == "eV": sigma = float(value)
-                else: raise ValueError('Unknown unit %s'%eunit)
+        broad = np.asarray(broad,dtype=float)
+        if broad.ndim == 0: return np.full(nexcitons,float(broad))
+        if len(broad) < nexcitons: raise ValueError('Broadening given for %d excitons, %d needed'%(len(broad),nexcitons))
+        return broad[:nexcitons]
+
+    def project1(self,dipoles,nexcitons,chunk_size=None):
+        """
+        Calculate the exciton-light coupling projecting the dipoles on the excitonic states
+
+            dipoles -> dipole matrix elements in the full BZ along one direction [nk,nbands,nbands]
+                       or several directions [nk,ndirections,nbands,nbands] (e.g. YamboDipolesDB.dipoles[:,dir])
+
+            Returns EL1 = sum_t A^s_t d_t and EL2 = conj(EL1) with shape [nexcitons] or [ndirections,nexcitons]
+        """
+        if self.eigenvectors is None:
+            raise ValueError('This database does not contain Excitonic states,'
+                             'please re-run the yambo BSE calculation with the WRbsWF option in the input file.')
+        if self.eigenvectors.shape[1] != self.ntransitions:
+            raise ValueError('Eigenvectors (%d) and BS_TABLE (%d) have different number of transitions'%(self.eigenvectors.shape[1],self.ntransitions))
+
+        #dipoles of each transition [ntransitions(,ndirections)]
+        k,v,c = (self.table[:,:3]-1).T
+        if dipoles.ndim == 3: dip_t = dipoles[k,c,v]
+        else:                 dip_t = dipoles[k,:,c,v]
+
+        #read the eigenvectors in chunks of excitons
+        if chunk_size is None: chunk_size = max(1,self.spectra_memory//(16*self.ntransitions))
+        EL1 = np.zeros((nexcitons,)+dip_t.shape[1:],dtype=np.result_type(dip_t,np.complex64))
+        for start in range(0,nexcitons,chunk_size):
+            stop = min(start+chunk_size,nexcitons)
+            EL1[start:stop] = np.dot(self.eigenvectors[start:stop],dip_t)
+        EL1 = EL1.T
+        return EL1, np.conj(EL1)
+
+    def get_green_functions_sum(self,w,residuals,broad,nexcitons,chunk_size=None,dtype=np.complex64):
+        """
+        Sum the resonant and anti-resonant Green's functions of the excitons
+
+            S_i(w) = sum_s r_is [ -1/(w-E_s+i*b_s) - 1/(-w-E_s-i*b_s) ]
+
+            w         -> frequencies [nfreqs]
+            residuals -> r_is for several sets i (directions, temperatures...) [nsets,nexcitons]
+            broad     -> broadening of each exciton [nexcitons]
+
+        The excitons are processed in chunks of chunk_size states at once,
+        by default chosen to keep each [chunk_size,nfreqs] array below spectra_memory bytes.
+        Returns an array [nsets,nfreqs] of type dtype.
+        """
+        na = np.newaxis
+        dtype = np.dtype(dtype)
+        residuals = np.atleast_2d(residuals)
+        w = np.asarray(w,dtype=dtype.type(0).real.dtype)
+        energies = self.eigenvalues[:nexcitons].astype(dtype)
+        broad = np.asarray(broad)[:nexcitons].astype(dtype)*I
+
+        if chunk_size is None: chunk_size = max(1,self.spectra_memory//(dtype.itemsize*max(len(w),1)))
+
+        spectra = np.zeros([residuals.shape[0],len(w)],dtype=dtype)
+        for start in range(0,nexcitons,chunk_size):
+            stop = min(start+chunk_size,nexcitons)
+            es = energies[start:stop,na]
+            bs = broad[start:stop,na]
 
-            f = gaussian if "gaussian" in broad else lorentzian
-            broad = np.zeros([nexcitons])
-            for s in range(nexcitons):
-                es = self.eigenvalues[s].real
-                broad += f(self.eigenvalues.real,es,sigma)
-            broad = 0.1*broad/nexcitons
-
-        #iterate over the excitonic states
-        for s in range(nexcitons):
-            #get exciton energy
-            es = self.eigenvalues[s]
- 
             #calculate the green's functions
-            G1 = -1/(   w - es + broad[s]*I)
-            G2 = -1/( - w - es - broad[s]*I)
+            G  = -1/(  w[na,:] - es + bs)
+            G -=  1/( -w[na,:] - es - bs)
 
-            r = EL1[s]*EL2[s]
-            chi += r*G1 + r*G2
+            spectra += np.dot(residuals[:,start:stop].astype(dtype),G)
+        return spectra
 
-        #dimensional factors
+    def get_exciton_light_coupling(self,dipoles,dir,nexcitons,verbose=0):
+        """
+        Get the products EL1*EL2 of the exciton-light couplings for one or several field directions
+
+            Returns an array [ndirections,nexcitons] (ndirections=1 if dipoles is None)
+        """
+        if dipoles is None:
+            #get dipole
+            EL1 = self.l_residual[:nexcitons]
+            EL2 = self.r_residual[:nexcitons]
+        else:
+            #calculate exciton-light coupling
+            if verbose: print("calculate exciton-light coupling")
+            EL1,EL2 = self.project1(dipoles.dipoles[:,np.atleast_1d(dir)],nexcitons)
+        return np.atleast_2d(EL1*EL2)
+
+    def get_q0norm(self,q0norm):
+        """ Norm of the transferred momentum entering the 1/q^2 factor
+        """
         try:
             if not self.Qpt=='1': q0norm = 2*np.pi*np.linalg.norm(self.car_qpoint)
         except:
@@ -1326,17 +1520,58 @@ class YamboExcitonDB(object):
         except:
             print("[WARNING] 1/q^2 set to 1 in eps2")
             q0norm=1
+        return q0norm
+
+    def get_chi(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,
+                chunk_size=None,precision='single',**kwargs):
+        """
+        Calculate the dielectric response function using excitonic states
+
+            dir        -> field direction (index of dipoles.dipoles), or list of directions computed in one pass
+                          (in this case chi has shape [ndirections,nfreqs])
+            broad      -> see get_broadening
+            chunk_size -> number of excitons processed at once (default: fixed by spectra_memory)
+            precision  -> 'single' (float32/complex64) or 'double' (float64/complex128)
+        """
+        if nexcitons == 'all': nexcitons = self.nexcitons
+        rtype, ctype = self.spectra_precision[precision]
+
+        #energy range
+        w = np.arange(emin,emax,estep,dtype=rtype)
+        nenergies = len(w)
+        
+        if verbose:
+            print("energy range: %lf -> +%lf -> %lf "%(emin,estep,emax))
+            print("energy steps: %lf"%nenergies)
+
+        #exciton-light coupling [ndirections,nexcitons]
+        residuals = self.get_exciton_light_coupling(dipoles,dir,nexcitons,verbose=verbose)
+
+        broad = self.get_broadening(broad,nexcitons)
 
+        #sum over the excitonic states
+        chi = self.get_green_functions_sum(w,residuals,broad,nexcitons,chunk_size=chunk_size,dtype=ctype)
+
+        #dimensional factors
+        q0norm = self.get_q0norm(q0norm)
         d3k_factor = self.lattice.rlat_vol/self.lattice.nkpoints
         cofactor = ha2ev*spin_degen/(2*np.pi)**3 * d3k_factor * (4*np.pi)  / q0norm**2
 
         chi = 1. + chi*cofactor #We are actually computing the epsilon, not the chi.
+        if dipoles is None or np.ndim(dir)==0: chi = chi[0]
 
-        return w,chi
+        return w,chi.astype(ctype)
     
-    def get_pl(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,Boltz_Temp=300,**kwargs):
+    def get_pl(self,dipoles=None,dir=0,emin=0,emax=10,estep=0.01,broad=0.1,q0norm=1e-5, nexcitons='all',spin_degen=2,verbose=0,Boltz_Temp=300,
+               chunk_size=None,precision='single',**kwargs):
         """
         Calculate PL_0  using excitonic states
+
+            dir        -> field direction, or list of directions
+            Boltz_Temp -> temperature (K), or list of temperatures
+                          Spectra for all directions and temperatures are computed in one pass,
+                          pl has shape [(ndirections,)(ntemperatures,)nfreqs]
+            chunk_size, precision -> see get_chi
         """
         SPEED_OF_LIGHT    =  137*0.529*27.21/(6.582119569e-16)# finestructureconst * bohr2ang*HartreetoeV/hbar in eVs
         #SPEED_OF_LIGHT = 2.99792458e8
@@ -1345,79 +1580,51 @@ class YamboExcitonDB(object):
         # All prefactors should be checked
         pl_prefactor = 32.0*np.pi**3*SPEED_OF_LIGHT*2.0/3.0*RL_vol/nqbz/(2.00*np.pi)**3
         if nexcitons == 'all': nexcitons = self.nexcitons
+        rtype, ctype = self.spectra_precision[precision]
 
         #energy range
-        w = np.arange(emin,emax,estep,dtype=np.float32)
+        w = np.arange(emin,emax,estep,dtype=rtype)
         nenergies = len(w)
         
         if verbose:
             print("energy range: %lf -> +%lf -> %lf "%(emin,estep,emax))
             print("energy steps: %lf"%nenergies)
 
-        #initialize the susceptibility intensity
-        pl = np.zeros([len(w)],dtype=np.complex64)
+        #exciton-light coupling [ndirections,nexcitons]
+        residuals = self.get_exciton_light_coupling(dipoles,dir,nexcitons,verbose=verbose)
+        ndirs = residuals.shape[0]
 
-        if dipoles is None:
-            #get dipole
-            EL1 = self.l_residual
-            EL2 = self.r_residual
-        else:
-            #calculate exciton-light coupling
-            if verbose: print("calculate exciton-light coupling")
-            EL1,EL2 = self.project1(dipoles.dipoles[:,dir],nexcitons) 
+        broad = self.get_broadening(broad,nexcitons)
 
-        if isinstance(broad,float): broad = [broad]*nexcitons
+        #boltzmann weights of the excitons [ntemperatures,nexcitons]
+        temperatures = np.atleast_1d(Boltz_Temp)
+        es   = self.eigenvalues[:nexcitons]
+        es_0 = self.eigenvalues[0] # first exciton level
+        pl_0_weights = np.array([ boltzman_f(es-es_0, T) for T in temperatures ])
 
-        if isinstance(broad,tuple): 
-            broad_slope = broad[1]-broad[0]
-            min_exciton = np.min(self.eigenvalues.real)
-            broad = [ broad[0]+(es-min_exciton)*broad_slope for es in self.eigenvalues[:nexcitons].real]
-
-        if "gaussian" in broad or "lorentzian" in broad:
-            i = broad.find(":")
-            if i != -1:
-                value, eunit = broad[i+1:].split()
-                if eunit == "eV": sigma = float(value)
-                else: raise ValueError('Unknown unit %s'%eunit)
-
-            f = gaussian if "gaussian" in broad else lorentzian
-            broad = np.zeros([nexcitons])
-            for s in range(nexcitons):
-                es = self.eigenvalues[s].real
-                broad += f(self.eigenvalues.real,es,sigma)
-            broad = 0.1*broad/nexcitons
-
-        #iterate over the excitonic states
-        for s in range(nexcitons):
-            #get exciton energy
-            es = self.eigenvalues[s]
-            es_0 = self.eigenvalues[0] # first exciton level
-            print(es_0)
-            pl_0_weight = boltzman_f(es-es_0, Boltz_Temp)
-            #calculate the green's functions
-            G1 = -1/(   w - es + broad[s]*I)
-            G2 = -1/( - w - es - broad[s]*I)
-
-            r = EL1[s]*EL2[s]*pl_0_weight#*pl_prefactor
-            pl += r*G1 + r*G2
+        #sum over the excitonic states for all directions and temperatures at once
+        residuals = (residuals[:,np.newaxis,:]*pl_0_weights[np.newaxis,:,:]).reshape(-1,nexcitons) #*pl_prefactor
+        pl = self.get_green_functions_sum(w,residuals,broad,nexcitons,chunk_size=chunk_size,dtype=ctype)
+        pl = pl.reshape(ndirs,len(temperatures),nenergies)
 
         #dimensional factors
-        if not self.Qpt=='1': q0norm = 2*np.pi*np.linalg.norm(self.car_qpoint)
-        if self.q_cutoff is not None: q0norm = self.q_cutoff
-
+        q0norm = self.get_q0norm(q0norm)
         d3k_factor = self.lattice.rlat_vol/self.lattice.nkpoints
         cofactor = ha2ev*spin_degen/(2*np.pi)**3 * d3k_factor * (4*np.pi)  / q0norm**2
         
         pl = 1. + pl*cofactor #We are actually computing the epsilon, not the chi.
+        if np.ndim(Boltz_Temp)==0: pl = pl[:,0]
+        if dipoles is None or np.ndim(dir)==0: pl = pl[0]
 
-        return w,pl
+        return w,pl.astype(ctype)
 
     def plot_chi_ax(self,ax,reim='im',n_brightest=-1,**kwargs):
         """Plot chi on a matplotlib axes"""
         w,chi = self.get_chi(**kwargs)
         #cleanup kwargs variables
         cleanup_vars = ['dipoles','dir','emin','emax','estep','broad',
-                        'q0norm','nexcitons','spin_degen','verbose']
+                        'q0norm','nexcitons','spin_degen','verbose',
+                        'chunk_size','precision']
         for var in cleanup_vars: kwargs.pop(var,None)
         if 're' in reim: ax.plot(w,chi.real,**kwargs)
         if 'im' in reim: ax.plot(w,chi.imag,**kwargs)
@@ -1586,18 +1793,12 @@ class YamboExcitonDB(object):
     def get_exciton_weights_spin_pol(self,excitons):
     
         """get weight of state in each band for spin-polarized case"""
-        table_up, table_dw, table_updw = [] , [], []
-        for t,kcv in enumerate(self.table):
-            k,c,v,c_s,v_s = kcv-1   # We substract 1 to be consistent with python numbering of arrays
-            if c_s == 0 and v_s == 0:
-               table_up.append(np.array(kcv[0:3]))
-            if c_s == 1 and v_s == 1:
-               table_dw.append(np.array(kcv[0:3]))
-            if c_s == 1 and v_s == 0:
-               table_updw.append(np.array(kcv[0:3]))
-        table_up=np.array(table_up)
-        table_dw=np.array(table_dw)
-        table_updw=np.array(table_updw)
+        k,v,c,c_s,v_s = self.table_indexes   # zero-based, consistent with python numbering of arrays
+        up = (c_s == 0) & (v_s == 0)
+        dw = (c_s == 1) & (v_s == 1)
+        table_up   = self.table[up,0:3]
+        table_dw   = self.table[dw,0:3]
+        table_updw = self.table[(c_s == 1) & (v_s == 0),0:3]
 
         self.unique_vbands_up = np.unique(table_up[:,1]-1)
         self.unique_cbands_up = np.unique(table_up[:,2]-1)
@@ -1608,31 +1809,23 @@ class YamboExcitonDB(object):
         self.start_band_up = min(self.unique_vbands_up)
         self.start_band_dw = min(self.unique_vbands_dw)
 
-        weights_up = np.zeros([self.nkpoints,self.mband_up])
-        weights_dw = np.zeros([self.nkpoints,self.mband_dw])
-        
-        for exciton in excitons:
-            #get the eigenstate
-            eivec = self.eigenvectors[exciton-1]
-            #add weights
-            sum_weights = 0
-            for t,kcv in enumerate(self.table):
-                k,c,v,c_s,v_s = kcv-1   # We substract 1 to be consistent with python numbering of arrays
-                this_weight = abs2(eivec[t])
-                if c_s == 0 and v_s == 0:
-                   weights_up[k,c] += this_weight
-                   weights_up[k,v] += this_weight
-                elif c_s == 1 and v_s == 1: 
-                   weights_dw[k,c] += this_weight
-                   weights_dw[k,v] += this_weight
-                sum_weights += this_weight
-            if abs(sum_weights - 1) > 1e-3: raise ValueError('Excitonic weights does not sum to 1 but to %lf.'%sum_weights)
+        this_weight = np.sum(self.get_transition_weights(excitons,check_norm=True),axis=0)
+
+        nk = self.nkpoints
+        weights_up  = np.bincount(k[up]*self.mband_up+c[up],weights=this_weight[up],minlength=nk*self.mband_up)
+        weights_up += np.bincount(k[up]*self.mband_up+v[up],weights=this_weight[up],minlength=nk*self.mband_up)
+        weights_dw  = np.bincount(k[dw]*self.mband_dw+c[dw],weights=this_weight[dw],minlength=nk*self.mband_dw)
+        weights_dw += np.bincount(k[dw]*self.mband_dw+v[dw],weights=this_weight[dw],minlength=nk*self.mband_dw)
+        weights_up  = weights_up.reshape(nk,self.mband_up)
+        weights_dw  = weights_dw.reshape(nk,self.mband_dw)
  
         return weights_up, weights_dw
 
-    def interpolate_spin_pol(self,energies,path,excitons,lpratio=5,f=None,size_up=1.0,size_dw=1.0,verbose=True,**kwargs):
+    def interpolate_spin_pol(self,energies,path,excitons,lpratio=5,f=None,size_up=1.0,size_dw=1.0,verbose=True,cache=None,**kwargs):
         """ Interpolate exciton bandstructure using SKW interpolation from
         Abipy and SPIN-POLARIZED CALCULATIONS
+
+        cache -> see get_skw_interpolator
         """
 
         if verbose:
@@ -1708,16 +1901,16 @@ class YamboExcitonDB(object):
         #interpolate energies
         na = np.newaxis
 
-        skw_up = SkwInterpolator(lpratio,ibz_kpoints_qp,ibz_energies_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        skw_dw = SkwInterpolator(lpratio,ibz_kpoints_qp,ibz_energies_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw_up = get_skw_interpolator(lpratio,ibz_kpoints_qp,ibz_energies_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+        skw_dw = get_skw_interpolator(lpratio,ibz_kpoints_qp,ibz_energies_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         energies_up = skw_up.interp_kpts(kpoints_path).eigens
         energies_dw = skw_dw.interp_kpts(kpoints_path).eigens
      
         #interpolate weights
         na = np.newaxis
-        skw_up = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-        skw_dw = SkwInterpolator(lpratio,ibz_kpoints,ibz_weights_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+        skw_up = get_skw_interpolator(lpratio,ibz_kpoints,ibz_weights_up[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+        skw_dw = get_skw_interpolator(lpratio,ibz_kpoints,ibz_weights_dw[na,:,:],fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
         kpoints_path = path.get_klist()[:,:3]
         exc_weights_up = skw_up.interp_kpts(kpoints_path).eigens
         exc_weights_dw = skw_dw.interp_kpts(kpoints_path).eigens
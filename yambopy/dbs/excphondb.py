@@ -12,6 +12,18 @@ import os
 import matplotlib.pyplot as plt
 from yambopy.units import ha2ev, I
 from yambopy.plot.plotting import add_fig_kwargs,BZ_hexagon,shifted_grids_2D
+from yambopy.dbs.fragments import read_fragments, get_nfragments
+
+def _read_qpoint_fragment(filename,iq):
+    with Dataset(filename) as database:
+        return database.variables['EXCPH_Q%d'%(iq+1)][:].T
+
+def _read_excph_fragment(filename,iq):
+    # (exc_in,exc_out,mode,2) -> complex (mode,exc_in,exc_out), see read_excph
+    with Dataset(filename) as database:
+        excph = database.variables['EXCITON_PH_GKKP_Q%d'%(iq+1)][:]
+        excph_sq = database.variables['EXCITON_PH_GKKP_SQUARED_Q%d'%(iq+1)][:]
+    return np.moveaxis( excph[:,:,:,0]+I*excph[:,:,:,1], -1,0 ), np.moveaxis( excph_sq, -1,0)
 
 class YamboExcitonPhononDB():
     """
@@ -22,6 +34,7 @@ class YamboExcitonPhononDB():
     - Input: YamboLatticeDB object
     - Input: paths of ndb.excph*
     - Input: if not read_all, read only header
+    - Input: nworkers, number of processes reading the fragments in parallel
 
     NB: So far we read G(exc_in_Q=0, exc_out_q, ph_q) 
 
@@ -48,7 +61,7 @@ class YamboExcitonPhononDB():
       Example, plot of |G(q)_{3,4,4}|:
            :: yexcph.plot_excph( np.abs(yexcph.excph[:,3,4,4]) )
     """
-    def __init__(self,lattice,save_excph="./",read_all=True):
+    def __init__(self,lattice,save_excph="./",read_all=True,nworkers=1):
         
         # Find databases
         if os.path.isfile("%s/ndb.excph_gkkp"%save_excph): filename='%s/ndb.excph_gkkp'%save_excph
@@ -73,11 +86,9 @@ class YamboExcitonPhononDB():
         database.close()
 
         #Check how many databases are present
-        self.nfrags = self.nqpoints
-        for iq in range(self.nqpoints):
-            if not os.path.isfile("%s%d"%(self.frag_filename,iq+1)): 
-                self.nfrags = iq
-                break
+        self.nfrags = get_nfragments(self.frag_filename,self.nqpoints)
+        self.frag_filenames = [ self.frag_filename + "%d"%(iq+1) for iq in range(self.nfrags) ]
+        self.nworkers = nworkers
         
         # Necessary lattice information
         self.lattice = lattice
@@ -102,14 +113,8 @@ class YamboExcitonPhononDB():
         """
         Read q points and return cartesian and reduced coordinates
         """
-        var_nm = "EXCPH_Q"
-        
         self.qpoints = np.zeros([self.nfrags,3])
-
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            self.qpoints[iq] = database.variables['%s%d'%(var_nm,iq+1)][:].T        
+        read_fragments(_read_qpoint_fragment,self.frag_filenames,out=self.qpoints,nworkers=self.nworkers)
     
         self.car_qpoints = np.array([ q/self.alat for q in self.qpoints ])
 
@@ -121,24 +126,10 @@ class YamboExcitonPhononDB():
             the *transpose* (exc_in,exc_out,mode,2).
             We want to change it to complex (iq,mode,exc_in,exc_out)
         """    
-        var_nm    = "EXCITON_PH_GKKP_Q"
-        var_sq_nm = "EXCITON_PH_GKKP_SQUARED_Q"
-            
         # excph[q][mode][iexc1][iexc2]
         excph_full    = np.zeros([self.nfrags,self.nmodes,self.nexc_i,self.nexc_o],dtype=np.complex64)  
         excph_sq_full = np.zeros([self.nfrags,self.nmodes,self.nexc_i,self.nexc_o])  
-        
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil)
-            excph = database.variables['%s%d'%(var_nm,iq+1)][:]
-            excph_full[iq] = np.moveaxis( excph[:,:,:,0]+I*excph[:,:,:,1], -1,0 )
-            #excph_full[iq] = np.swapaxes( np.swapaxes(excph[:,:,:,0] + I*excph[:,:,:,1],-1,0), -1,-2)
-            
-            excph_sq = database.variables['%s%d'%(var_sq_nm,iq+1)][:]
-            excph_sq_full[iq] = np.moveaxis( excph_sq, -1,0)
-            #excph_sq_full[iq] = np.swapaxes( np.swapaxes(excph_sq[:,:,:],-1,0), -1,-2)
-            database.close()
+        read_fragments(_read_excph_fragment,self.frag_filenames,out=(excph_full,excph_sq_full),nworkers=self.nworkers)
         
         # Check integrity of elph values
         if np.isnan(excph_full).any(): print('[WARNING] NaN values detected in elph database.')
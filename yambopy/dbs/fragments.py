@@ -0,0 +1,87 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# Authors: FP
+#
+# This file is part of the yambopy project
+#
+"""
+Read yambo databases split in fragments (ndb.*_fragment_N) with a pool of workers.
+
+The netCDF/HDF5 library is not thread safe, therefore the fragments are read
+by separate processes: each worker opens and reads one fragment while the others
+are doing the same, and the results are copied in a preallocated output array.
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+def get_nfragments(frag_filename,nmax=None,start=1,suffix=''):
+    """
+    Count the fragments frag_filename%d(suffix) present on disk (stops at the first missing one,
+    or at nmax if given)
+
+    The folder is listed once instead of checking each fragment separately,
+    which saves one metadata request per fragment on parallel filesystems.
+    """
+    folder, prefix = os.path.split(frag_filename)
+    try: present = set(os.listdir(folder if folder else '.'))
+    except FileNotFoundError: return 0
+    i = 0
+    while nmax is None or i < nmax:
+        if "%s%d%s"%(prefix,i+start,suffix) not in present: return i
+        i += 1
+    return nmax
+
+def read_fragments(read_fragment,filenames,out=None,nworkers=1,indices=None):
+    """
+    Read a list of database fragments, optionally in parallel
+
+        read_fragment -> function read_fragment(filename,index) returning the data of one fragment
+                         (or a tuple of data). With nworkers>1 it must be defined at module level
+                         so that it can be sent to the worker processes.
+        filenames     -> list of fragment files
+        out           -> preallocated array (or tuple of arrays) with first dimension len(filenames).
+                         It is filled in place as out[i] = read_fragment(filenames[i],indices[i]).
+                         If None, the list of results is returned instead.
+        nworkers      -> number of worker processes (1: serial reading in this process)
+        indices       -> index passed to read_fragment for each file (default: 0,1,2,...)
+    """
+    nfrags = len(filenames)
+    if indices is None: indices = range(nfrags)
+
+    def store(i,data):
+        if out is None: results[i] = data
+        elif isinstance(out,tuple):
+            for o,d in zip(out,data): o[i] = d
+        else: out[i] = data
+
+    results = [None]*nfrags
+    nworkers = max(1,min(int(nworkers),nfrags))
+    if nworkers == 1:
+        for i,(filename,index) in enumerate(zip(filenames,indices)): store(i,read_fragment(filename,index))
+    else:
+        with ProcessPoolExecutor(max_workers=nworkers) as pool:
+            for i,data in enumerate(pool.map(read_fragment,filenames,indices)): store(i,data)
+
+    if out is None: return results
+    return out
+
+def hyperslab(indices):
+    """
+    Index along one dimension of a netCDF variable
+
+        indices -> list of indices (None: whole dimension)
+
+    Evenly spaced indices are turned into a (strided) slice, so that netCDF reads them
+    as a single hyperslab; other lists are returned as integer arrays.
+    """
+    if indices is None: return slice(None)
+    indices = np.array(indices,dtype=int).ravel()
+    if len(indices)==0: return indices
+    if len(indices)==1: return slice(indices[0],indices[0]+1)
+    step = indices[1]-indices[0]
+    if step>0 and np.all(np.diff(indices)==step): return slice(indices[0],indices[-1]+1,step)
+    return indices
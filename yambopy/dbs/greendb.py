@@ -116,105 +116,64 @@ class YamboGreenDB(object):
     
         Arguments:
         e0 -> bare eigenvalues in eV
-        """
-        from scipy.optimize import bisect, newton
-        from scipy.interpolate import interp1d
-        from scipy.misc import derivative
+        secant -> if True the solution closest to e0 is taken,
+                  otherwise the one closest to e0 in [e0-braket,e0+braket] (whole grid if braket is None)
+
+        The Dyson equation Re[Se(E)] - E + e0 = 0 is solved for all the states at once
+        on the piecewise-linear interpolation of the self-energy on the energy grid of each state.
+        Z factors and lifetimes are obtained from the slope and the value of Se on the segment of the solution.
 
+        The states without solution are listed in self.failed (eqp and z are nan)
+        """
         #check if the eigenvalues have the correct dimensions
+        e0 = np.asarray(e0)
         if len(e0) != self.nqps:
             raise ValueError('Wrong dimensions in bare eigenvalues')
 
-        #in case something is strange we plot the stuff
-        def error(nqp):
-            ax = plt.gca()
-
-            #plot 0
-            ax.axhline(0,c='k',lw=1)
-            
-            #se limits
-            semin = min(self.se[nqp].real)
-            semax = max(self.se[nqp].real)
-            plt.ylim(semin,semax)
-
-            #plot self energy
-            self.plot(ax,nqp=nqp)
-
-            #plot omega-e0
-            emin = min(self.energies[nqp].real)
-            emax = max(self.energies[nqp].real)
-            x = np.linspace(emin,emax,100)
-            plt.plot(x,x-e0[nqp])
-
-            #plot imaginary part of greens funciton
-            x = self.energies[nqp].real
-            y = self.green[nqp].imag
-            plt.plot(x,y/max(y)*semax)
-    
-            #plot eqp
-            #plt.axvline(self.eqp[nqp],lw=1)
-            #plt.axvline(e0[nqp],lw=1)
-
-            plt.legend(frameon=False)
-            plt.show()
-
         if bandmin is None: bandmin = self.bandmin
         if bandmax is None: bandmax = self.bandmax
- 
+        states = (bandmin <= self.band1) & (self.band1 <= bandmax)
+
+        #real part of the Dyson equation on the energy grids [nqps,nenergies]
+        x = self.energies.real
+        f = self.se.real-x+e0[:,np.newaxis]
+
+        #zeros of the linear interpolation in each segment
+        fa, fb = f[:,:-1], f[:,1:]
+        cross = (fa*fb <= 0) & (fa != fb)
+        t = np.where(cross,fa/np.where(cross,fa-fb,1.),0.)
+        roots = x[:,:-1]+t*(x[:,1:]-x[:,:-1])
+
+        #take the solution closest to e0
+        dist = np.abs(roots-e0[:,np.newaxis])
+        if not secant and braket: cross &= dist <= braket
+        dist = np.where(cross,dist,np.inf)
+        nseg = np.argmin(dist,axis=1)
+        nqps = np.arange(self.nqps)
+        found = np.isfinite(dist[nqps,nseg])
+
+        #slope and value of the self-energy at the solution
+        dse = (self.se[nqps,nseg+1]-self.se[nqps,nseg])/(x[nqps,nseg+1]-x[nqps,nseg])
+        eqp = roots[nqps,nseg]
+        lif = (self.se[nqps,nseg]+t[nqps,nseg]*(self.se[nqps,nseg+1]-self.se[nqps,nseg])).imag
+
         self.eqp = np.zeros([self.nqps],dtype=complex) 
         self.z   = np.zeros([self.nqps],dtype=complex) 
-        for nqp in range(self.nqps):
-
-            band = self.band1[nqp]
-            kpt  = self.kindex[nqp]
-            if debug: print("%3d %3d %3d %8.4lf"%(nqp, kpt, band, e0[nqp]))
-
-            if not (bandmin <= band <= bandmax):
-                continue
-
-            #get x and y
-            x = self.energies[nqp].real
-            y = self.se[nqp]
-
-            #interpolate real part of function
-            f = interp1d(x,y.real-x+e0[nqp],kind='slinear')
-
-            #find zero
-            if secant:
-                try:
-                    eqp = newton(f,e0[nqp],maxiter=200)
-                except ValueError as msg:
-                    print(msg)
-                    if debug: error(nqp)
-            else:
-                if braket:
-                    emin = e0[nqp]-braket
-                    emax = e0[nqp]+braket
-                else:
-                    emin = min(x)
-                    emax = max(x)
-
-                eqp = bisect(f,emin,emax) 
-
-            #interpolate whole function
-            f = interp1d(x,y)
-
-            #calculate Z factors
-            dse = derivative(f,eqp,dx=1e-8)
-            z = 1./(1-dse)
-
-            #find Im(Se(EQP)) which corresponds to the lifetime
-            lif = f(eqp).imag
-            eqp += 1j*lif
-
-            #store values
-            self.eqp[nqp] = eqp
-            self.z[nqp] = z           
-
-            #cehck for potential errors
-            if z>1 and debug:
-                print(z)
-                error(nqp)            
+        self.eqp[states] = (eqp+1j*lif)[states]
+        self.z[states]   = (1./(1-dse))[states]
+
+        #states without solution
+        self.failed = np.nonzero(states & ~found)[0]
+        self.eqp[self.failed] = np.nan
+        self.z[self.failed]   = np.nan
+        if len(self.failed):
+            print("[WARNING] No quasiparticle solution found for %d states (see self.failed)"%len(self.failed))
+
+        if debug:
+            for nqp in np.nonzero(states)[0]:
+                print("%3d %3d %3d %8.4lf %8.4lf %8.4lf"%(nqp, self.kindex[nqp], self.band1[nqp], e0[nqp], self.eqp[nqp].real, self.z[nqp].real))
+            unphysical = np.nonzero(states & found & (self.z.real>1))[0]
+            if len(unphysical): print("[WARNING] Z>1 for states %s"%unphysical)
 
         return self.eqp, self.z
 
@@ -9,6 +9,55 @@ from yambopy.units import ha2ev,fs2aut,speed_of_light
 import numpy as np
 import sys
 import os
+from functools import partial
+from yambopy.dbs.fragments import read_fragments
+
+def _read_Efield(database,RT_step,n):
+     efield={}
+     efield["name"]       =database.variables['Field_Name_'+str(n)][...].tostring().decode().strip()
+     efield["versor"]     =database.variables['Field_Versor_'+str(n)][:].astype(np.double)
+     efield["intensity"]  =database.variables['Field_Intensity_'+str(n)][0].astype(np.double)
+     efield["damping"]    =database.variables['Field_Damping_'+str(n)][0].astype(np.double)
+     efield["freq_range"] =database.variables['Field_Freq_range_'+str(n)][:].astype(np.double)
+     efield["freq_steps"] =database.variables['Field_Freq_steps_'+str(n)][:].astype(np.double)
+     efield["freq_step"]  =database.variables['Field_Freq_step_'+str(n)][0].astype(np.double)
+     efield["initial_time"]  =database.variables['Field_Initial_time_'+str(n)][0].astype(np.double)
+     #
+     # set t_initial according to Yambo 
+     #
+     efield["initial_indx"] =max(round(efield["initial_time"]/RT_step)+1,2)
+     efield["initial_time"] =(efield["initial_indx"]-1)*RT_step
+     #
+     # define the field amplitude
+     #
+     efield["amplitude"]    =np.sqrt(efield["intensity"]*4.0*np.pi/speed_of_light)
+
+     return efield
+
+def _read_nl_fragment(filename,f,RT_step):
+    #
+    # Read polarization, current and fields of run f
+    # (returns None if the fragment is missing)
+    #
+    try:
+        data_p_and_j= Dataset(filename)
+    except:
+        return None
+    pol  = data_p_and_j.variables['NL_P_freq_'+str(f+1).zfill(4)][:,:].astype(np.double)
+    curr = data_p_and_j.variables['NL_J_freq_'+str(f+1).zfill(4)][:,:].astype(np.double)
+    e_ext= data_p_and_j.variables['E_ext_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
+    e_ext_c=e_ext[:,:,0]+1j*e_ext[:,:,1]
+    e_tot= data_p_and_j.variables['E_tot_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
+    e_tot_c=e_tot[:,:,0]+1j*e_tot[:,:,1]
+    e_ks = data_p_and_j.variables['E_ks_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
+    e_ks_c=e_ks[:,:,0]+1j*e_ks[:,:,1]
+
+    # Read only the first field for SHG
+    # I don't need it in the pump-probe configuration
+    efield=_read_Efield(data_p_and_j,RT_step,1)
+    data_p_and_j.close()
+
+    return pol, curr, e_ext_c, e_tot_c, e_ks_c, efield
 
 #
 # This class reads all data from the ndb.Nonlinear database
@@ -24,9 +73,10 @@ class YamboNLDB(object):
     Open the NL databases and store it in a NLDB class.
     """
 
-    def __init__(self,folder='.',calc='SAVE',nl_db='ndb.Nonlinear'):
+    def __init__(self,folder='.',calc='SAVE',nl_db='ndb.Nonlinear',nworkers=1):
         # Find path with RT data
         self.nl_path = '%s/%s/%s'%(folder,calc,nl_db)
+        self.nworkers = nworkers
 
         try:
             data_obs= Dataset(self.nl_path)
@@ -39,26 +89,7 @@ class YamboNLDB(object):
         data_obs.close()
 
     def read_Efield(self,database,RT_step,n):
-         efield={}
-         efield["name"]       =database.variables['Field_Name_'+str(n)][...].tostring().decode().strip()
-         efield["versor"]     =database.variables['Field_Versor_'+str(n)][:].astype(np.double)
-         efield["intensity"]  =database.variables['Field_Intensity_'+str(n)][0].astype(np.double)
-         efield["damping"]    =database.variables['Field_Damping_'+str(n)][0].astype(np.double)
-         efield["freq_range"] =database.variables['Field_Freq_range_'+str(n)][:].astype(np.double)
-         efield["freq_steps"] =database.variables['Field_Freq_steps_'+str(n)][:].astype(np.double)
-         efield["freq_step"]  =database.variables['Field_Freq_step_'+str(n)][0].astype(np.double)
-         efield["initial_time"]  =database.variables['Field_Initial_time_'+str(n)][0].astype(np.double)
-         #
-         # set t_initial according to Yambo 
-         #
-         efield["initial_indx"] =max(round(efield["initial_time"]/RT_step)+1,2)
-         efield["initial_time"] =(efield["initial_indx"]-1)*RT_step
-         #
-         # define the field amplitude
-         #
-         efield["amplitude"]    =np.sqrt(efield["intensity"]*4.0*np.pi/speed_of_light)
-
-         return efield
+         return _read_Efield(database,RT_step,n)
 
     def read_observables(self,database):
         """
@@ -113,31 +144,20 @@ class YamboNLDB(object):
             sys.exit(0)
             
         #
-        for f in range(self.n_runs):
-            try:
-                data_p_and_j= Dataset(self.nl_path+"_fragment_"+str(f+1))
-            except:
-                print("Error reading database: %s" % self.nl_path+"_fragment_"+str(f+1))
+        filenames = [ self.nl_path+"_fragment_"+str(f+1) for f in range(self.n_runs) ]
+        runs = read_fragments(partial(_read_nl_fragment,RT_step=self.RT_step),filenames,nworkers=self.nworkers)
+        for filename,run in zip(filenames,runs):
+            if run is None:
+                print("Error reading database: %s" % filename)
                 continue
-            pol  = data_p_and_j.variables['NL_P_freq_'+str(f+1).zfill(4)][:,:].astype(np.double)
-            curr = data_p_and_j.variables['NL_J_freq_'+str(f+1).zfill(4)][:,:].astype(np.double)
-            e_ext= data_p_and_j.variables['E_ext_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
-            e_ext_c=e_ext[:,:,0]+1j*e_ext[:,:,1]
-            e_tot= data_p_and_j.variables['E_tot_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
-            e_tot_c=e_tot[:,:,0]+1j*e_tot[:,:,1]
-            e_ks = data_p_and_j.variables['E_ks_freq_'+str(f+1).zfill(4)][:,:,:].astype(np.double)
-            e_ks_c=e_ks[:,:,0]+1j*e_ks[:,:,1]
-
-            self.Polarization.append(pol.copy())
-            self.Current.append(curr.copy())
-            self.E_ext.append(e_ext_c.copy())
-            self.E_tot.append(e_tot_c.copy())
-            self.E_ks.append(e_ks_c.copy())
-
-            # Read only the first field for SHG
-            # I don't need it in the pump-probe configuration
-            efield=self.read_Efield(data_p_and_j,self.RT_step,1)
-            self.Efield.append(efield.copy())
+            pol, curr, e_ext_c, e_tot_c, e_ks_c, efield = run
+
+            self.Polarization.append(pol)
+            self.Current.append(curr)
+            self.E_ext.append(e_ext_c)
+            self.E_tot.append(e_tot_c)
+            self.E_ks.append(e_ks_c)
+            self.Efield.append(efield)
 
     def __str__(self):
         """
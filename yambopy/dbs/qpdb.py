@@ -42,28 +42,31 @@ class YamboQPDB():
             self.spin_pol = qps['Spin_pol']
             self.spin     = True
 
-    @property
-    def eigenvalues_qp(self):
+    def _load_qps(self):
+        """
+        Compute once the per-k arrays of QP energies, lifetimes and Z factors (see get_qps)
+        """
         if not hasattr(self,'_eigenvalues_qp'):
             self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
+
+    @property
+    def eigenvalues_qp(self):
+        self._load_qps()
         return self._eigenvalues_qp
 
     @property
     def eigenvalues_dft(self):
-        if not hasattr(self,'_eigenvalues_dft'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
+        self._load_qps()
         return self._eigenvalues_dft
 
     @property
     def lifetimes(self):
-        if not hasattr(self,'_lifetimes'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
+        self._load_qps()
         return self._lifetimes
 
     @property
     def z(self):
-        if not hasattr(self,'_z'):
-            self._eigenvalues_dft, self._eigenvalues_qp, self._lifetimes, self._z = self.get_qps()
+        self._load_qps()
         return self._z
 
     @classmethod
@@ -82,7 +85,9 @@ class YamboQPDB():
     
     def get_qps(self):
         """
-        Get quasiparticle energies in a list
+        Get quasiparticle energies in arrays [k,band] or [k,band,spin]
+
+        The values of all the QP states are scattered at once with fancy indexing
         """
         #start arrays
 
@@ -90,52 +95,34 @@ class YamboQPDB():
 
         # I have shifted 
         ncalculatedkpoints = self.max_kpoint - self.min_kpoint + 1
-        if self.spin is True:
-           eigenvalues_dft = np.zeros([ncalculatedkpoints,self.nbands,2])
-           eigenvalues_qp  = np.zeros([ncalculatedkpoints,self.nbands,2])
-           linewidths      = np.zeros([ncalculatedkpoints,self.nbands,2])
-           z               = np.zeros([self.nkpoints,self.nbands,2])
-
-           for ei,e0i,li,zi,ki,ni,s_pol in zip(self.e,self.e0,self.linewidths,self.qpz,self.kpoint_index,self.band_index,self.spin_pol):
-                # position in array
-                nkpoint = ki - self.min_kpoint 
-                nband   = ni - self.min_band
-                spol    = int(s_pol - 1)
-
-                eigenvalues_dft[nkpoint,nband,spol] = e0i
-                eigenvalues_qp[nkpoint,nband,spol]  = ei
-                linewidths[nkpoint,nband,spol]      = li
-                z[nkpoint,nband,spol]               = zi
+        shape  = [ncalculatedkpoints,self.nbands]
+        zshape = [self.nkpoints,self.nbands]
 
-        else:
-            eigenvalues_dft = np.zeros([ncalculatedkpoints,self.nbands])
-            eigenvalues_qp  = np.zeros([ncalculatedkpoints,self.nbands])
-            linewidths      = np.zeros([ncalculatedkpoints,self.nbands])
-            z               = np.zeros([self.nkpoints,self.nbands])
+        # position in array
+        index = (self.kpoint_index - self.min_kpoint, self.band_index - self.min_band)
+        if self.spin is True:
+            shape, zshape = shape+[2], zshape+[2]
+            index = index + (np.array(self.spin_pol,dtype=int)-1,)
 
-            for ei,e0i,li,zi,ki,ni in zip(self.e,self.e0,self.linewidths,self.qpz,self.kpoint_index,self.band_index):
+        eigenvalues_dft = np.zeros(shape)
+        eigenvalues_qp  = np.zeros(shape)
+        linewidths      = np.zeros(shape)
+        z               = np.zeros(zshape)
 
-                # position in array
-                nkpoint = ki - self.min_kpoint 
-                nband   = ni - self.min_band
+        eigenvalues_dft[index] = self.e0
+        eigenvalues_qp[index]  = self.e
+        linewidths[index]      = self.linewidths
+        z[index]               = self.qpz
 
-                eigenvalues_dft[nkpoint,nband] = e0i
-                eigenvalues_qp[nkpoint,nband]  = ei
-                linewidths[nkpoint,nband]      = li
-                z[nkpoint,nband]               = zi
         return eigenvalues_dft, eigenvalues_qp, linewidths, z
 
 
     def get_filtered_qps(self,min_band=None,max_band=None):
-        """Return selected QP energies as a flat list"""
-        e0=[]; qp=[]; lw=[]
-        for ei,e0i,li,ki,ni in zip(self.e,self.e0,self.linewidths,self.kpoint_index,self.band_index):
-            if min_band and ni < min_band: continue
-            if max_band and ni > max_band: continue
-            e0.append(e0i)
-            qp.append(ei)
-            lw.append(lw)
-        return e0,qp,lw
+        """Return selected QP energies as flat arrays"""
+        selected = np.ones(self.nqps,dtype=bool)
+        if min_band: selected &= self.band_index >= min_band
+        if max_band: selected &= self.band_index <= max_band
+        return self.e0[selected], self.e[selected], self.linewidths[selected]
 
     def get_direct_gaps(self,valence):
         """
@@ -281,11 +268,13 @@ class YamboQPDB():
 
         return ks_bandstructure, qp_bandstructure
 
-    def interpolate(self,lattice,path,what='QP+KS',lpratio=5,valence=None,verbose=1,**kwargs):
+    def interpolate(self,lattice,path,what='QP+KS',lpratio=5,valence=None,verbose=1,cache=None,**kwargs):
         """
         Interpolate the QP corrections on a k-point path, requires the lattice structure
+
+        cache -> see get_skw_interpolator
         """
-        from yambopy.tools.skw import SkwInterpolator
+        from yambopy.tools.skw import get_skw_interpolator
 
         if verbose:
             print("This interpolation is provided by the SKW interpolator implemented in Abipy")
@@ -323,8 +312,8 @@ class YamboQPDB():
               print('Spin-polarized bands DFT')
               eigens_up = self.eigenvalues_dft[np.newaxis,:,:,0]
               eigens_dw = self.eigenvalues_dft[np.newaxis,:,:,1]
-              skw_up = SkwInterpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-              skw_dw = SkwInterpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+              skw_up = get_skw_interpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+              skw_dw = get_skw_interpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
               dft_eigens_up_kpath = skw_up.interp_kpts(band_kpoints_rlu).eigens[0]
               dft_eigens_dw_kpath = skw_dw.interp_kpts(band_kpoints_rlu).eigens[0]
 
@@ -336,7 +325,7 @@ class YamboQPDB():
            else:
               print('No spin-polarized bands DFT')
               eigens  = self.eigenvalues_dft[np.newaxis,:]
-              skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+              skw = get_skw_interpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
               #kpoints_path = path.get_klist()[:,:3]
               dft_eigens_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
               if valence: kwargs['fermie'] = np.max(dft_eigens_kpath[:,:valence])
@@ -355,8 +344,8 @@ class YamboQPDB():
                    eigens_up[0,ik,:], eigens_dw[0,ik,:] = sorted(aux_up[0,ik,:]), sorted(aux_dw[0,ik,:])
                #end sorting
 
-               skw_up = SkwInterpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
-               skw_dw = SkwInterpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+               skw_up = get_skw_interpolator(lpratio,kpoints,eigens_up,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
+               skw_dw = get_skw_interpolator(lpratio,kpoints,eigens_dw,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
                #kpoints_path = path.get_klist()[:,:3]
                qp_eigens_up_kpath = skw_up.interp_kpts(band_kpoints_rlu).eigens[0]
                qp_eigens_dw_kpath = skw_dw.interp_kpts(band_kpoints_rlu).eigens[0]
@@ -373,7 +362,7 @@ class YamboQPDB():
                for ik in range(self.nkpoints):
                    eigens[0,ik,:] = sorted(aux[0,ik,:])
                #end sorting
-               skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+               skw = get_skw_interpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
                #kpoints_path = path.get_klist()[:,:3]
                qp_eigens_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
                if valence: kwargs['fermie'] = np.max(qp_eigens_kpath[:,:valence])
@@ -384,7 +373,7 @@ class YamboQPDB():
             qp_z_kpath = None
             if 'Z' in what:
                 eigens = self.z[np.newaxis,:]
-                skw = SkwInterpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose)
+                skw = get_skw_interpolator(lpratio,kpoints,eigens,fermie,nelect,cell,symrel,time_rev,verbose=verbose,cache=cache)
                 #kpoints_path = path.get_klist()[:,:3]
                 qp_z_kpath = skw.interp_kpts(band_kpoints_rlu).eigens[0]
                 
@@ -398,12 +387,8 @@ class YamboQPDB():
         """ Expand QP values in full BZ
             - Input: YamboLatticeDB object with expanded kpts
         """
-        nkbz   = lattice.nkpoints
-        bz2ibz = lattice.kpoints_indexes
-
-        eigenvalues_qp_expanded = np.zeros((nkbz,self.nbands))
-        for ikbz in range(nkbz): eigenvalues_qp_expanded[ikbz,:] = self.eigenvalues_qp[bz2ibz[ikbz],:] 
-        return eigenvalues_qp_expanded
+        bz2ibz = np.array(lattice.kpoints_indexes)
+        return self.eigenvalues_qp[bz2ibz]
 
 
     @add_fig_kwargs
@@ -421,11 +406,11 @@ class YamboQPDB():
 
     @property
     def min_kpoint(self):
-        return min(self.kpoint_index)
+        return np.min(self.kpoint_index)
 
     @property
     def max_kpoint(self):
-        return max(self.kpoint_index)
+        return np.max(self.kpoint_index)
 
     @property
     def nbands(self):
@@ -433,11 +418,11 @@ class YamboQPDB():
 
     @property
     def min_band(self):
-        return min(self.band_index)
+        return np.min(self.band_index)
 
     @property
     def max_band(self):
-        return max(self.band_index)
+        return np.max(self.band_index)
 
     @property
     def nkpoints(self):
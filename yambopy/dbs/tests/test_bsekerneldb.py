@@ -0,0 +1,81 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.excitondb import YamboExcitonDB
+from yambopy.dbs.bsekerneldb import YamboBSEKernelDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
+
+def write_kernel_db(filename,kernel):
+    """
+    ndb.BS_PAR_Q1 with the upper triangle of the kernel (the rest of the matrix is not written)
+    """
+    N = len(kernel)
+    upper = np.triu(kernel).T
+    with Dataset(filename,'w') as database:
+        database.createDimension('BS_K_dim',N)
+        database.createDimension('complex',2)
+        database.createVariable('BSE_RESONANT','f4',('BS_K_dim','BS_K_dim','complex'))[:] = np.stack([upper.real,upper.imag],axis=-1)
+
+def random_hermitian(N,rng):
+    kernel = rng.normal(size=(N,N)) + 1j*rng.normal(size=(N,N))
+    return (kernel + np.conj(kernel.T)).astype(np.complex64)
+
+class TestYamboBSEKernelDB(unittest.TestCase):
+
+    def test_packed_kernel(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        nk, vbands, cbands = 4, [3,4], [5,6]
+        table = np.array([ [k,v,c] for k in range(1,nk+1) for v in vbands for c in cbands ])
+        N = len(table)
+        rng = np.random.default_rng(0)
+        kernel = random_hermitian(N,rng)
+
+        with tempfile.TemporaryDirectory() as folder:
+            write_kernel_db(os.path.join(folder,'ndb.BS_PAR_Q1'),kernel)
+            bsk = YamboBSEKernelDB.from_db_file(lat,folder=folder,block_size=5,check_hermitian=True)
+        self.assertEqual(bsk.ntransitions,N)
+        self.assertEqual(bsk.packed_kernel.shape,(N*(N+1)//2,))
+        np.testing.assert_array_equal(bsk.kernel,kernel)
+        np.testing.assert_array_equal(YamboBSEKernelDB(lat,kernel).packed_kernel,bsk.packed_kernel)
+
+        #products by blocks of columns
+        vectors = rng.normal(size=(N,3)) + 1j*rng.normal(size=(N,3))
+        for block_size in [1,5,N]:
+            np.testing.assert_allclose(bsk.matvec(vectors,block_size),kernel@vectors,rtol=1e-10,atol=1e-10)
+        np.testing.assert_allclose(bsk.matvec(vectors[:,0]),kernel@vectors[:,0],rtol=1e-10,atol=1e-10)
+
+        #projection on the excitons
+        eivs = rng.normal(size=(N,N)) + 1j*rng.normal(size=(N,N))
+        energies = np.sort(rng.random(N)).astype(complex)
+        exc = YamboExcitonDB(lat,'1',energies,energies,energies,table=table,eigenvectors=eivs)
+        kernel_exc_ref = np.einsum('ij,kj,ki->k', kernel, eivs, np.conj(eivs))
+        np.testing.assert_allclose(bsk.get_kernel_exciton_basis(exc,chunk_size=3),kernel_exc_ref,rtol=1e-10)
+
+        #kernel for fixed bands, reference from the loop over transitions
+        Wcv_ref = np.zeros((lat.nkpoints,lat.nkpoints),dtype=complex)
+        for t1,(k1,v1,c1) in enumerate(table):
+            for t2,(k2,v2,c2) in enumerate(table):
+                if (v1,c1)==(v2,c2)==(4,6): Wcv_ref[k1-1,k2-1] = kernel[t1,t2]
+        np.testing.assert_array_equal(bsk.get_kernel_value_bands(exc,[4,6]),Wcv_ref)
+
+        #complex diagonal
+        kernel[0,0] += 1j
+        with tempfile.TemporaryDirectory() as folder:
+            write_kernel_db(os.path.join(folder,'ndb.BS_PAR_Q1'),kernel)
+            with self.assertRaises(ValueError):
+                YamboBSEKernelDB.from_db_file(lat,folder=folder,check_hermitian=True)
+
+if __name__ == '__main__':
+    unittest.main()
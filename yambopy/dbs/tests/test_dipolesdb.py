@@ -5,6 +5,8 @@
 #
 import unittest
 import os
+import numpy as np
+from yambopy.tools.funcs import lorentzian
 from yambopy.dbs.dipolesdb import YamboDipolesDB
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
@@ -30,7 +32,92 @@ class TestYamboDipolesDB(unittest.TestCase):
         #calculate epsilon
         dipoles.ip_eps2(electrons)
 
-        print(dipoles)
+    def test_expand_normalize(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+        electrons = YamboElectronsDB.from_db_file(folder=test_path,Expand=True)
+        dipoles = YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',dip_type='iR')
+        dip_ibz = dipoles.dipoles_ibz
+        v, c = dipoles.index_firstv, dipoles.indexc
+
+        #reference from the rotation of each k-point
+        for ik in [0,5,77,143]:
+            sym = lat.symmetry_indexes[ik]
+            dip = dip_ibz[lat.kpoints_indexes[ik]]
+            if lat.time_rev_list[sym]: dip = np.conjugate(dip)
+            tra = dipoles.field_dir[:,np.newaxis]*lat.sym_car[sym]
+            dip_ref = np.einsum('ij,jcv->icv',tra,dip)
+            np.testing.assert_allclose(dipoles.dipoles[ik,:,c:c+dipoles.nbandsc,v:v+dipoles.nbandsv],dip_ref,atol=1e-6)
+            np.testing.assert_allclose(dipoles.dipoles[ik,:,v:v+dipoles.nbandsv,c:c+dipoles.nbandsc],-np.conjugate(dip_ref).swapaxes(1,2),atol=1e-6)
+
+        #expansion in chunks of k-points
+        expanded = dipoles.dipoles.copy()
+        dipoles.expandDipoles(dip_ibz,chunk_size=7)
+        np.testing.assert_array_equal(dipoles.dipoles,expanded)
+
+        #normalization with the eigenvalue differences
+        eiv = electrons.eigenvalues[0,:,:expanded.shape[-1]]
+        norm = eiv[:,np.newaxis,:,np.newaxis]-eiv[:,np.newaxis,np.newaxis,:]
+        normalized = np.where(norm==0,0,expanded/np.where(norm==0,1,norm))
+        dipoles.normalize(electrons,chunk_size=10)
+        np.testing.assert_allclose(dipoles.dipoles,normalized,atol=1e-6)
+
+    def test_ip_eps2(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+        electrons = YamboElectronsDB.from_db_file(folder=test_path,Expand=True)
+        dipoles = YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',dip_type='iR')
+
+        #reference from the sum over transitions
+        nv = electrons.nbandsv
+        eiv = electrons.eigenvalues[0]
+        w = np.linspace(0,10,200)
+        wk = electrons.weights*dipoles.nk_ibz/len(eiv)
+        eps_ref, eps_ar = np.zeros_like(w), np.zeros_like(w)
+        for c in range(nv,nv+2):
+            for v in range(nv-2,nv):
+                dip2 = np.abs(np.sum(dipoles.dipoles[:,:,c,v],axis=1))**2
+                eps_ref += np.sum(wk*dip2*lorentzian(w[:,np.newaxis],eiv[:,c]-eiv[:,v],0.1),axis=1)
+                eps_ar  += np.sum(wk*dip2*lorentzian(w[:,np.newaxis],eiv[:,v]-eiv[:,c],0.1),axis=1)
+        cofactor = 2*8*np.pi/lat.rlat_vol
+        eps_ref *= cofactor
+        eps_ar  *= cofactor
+
+        for chunk_size in [None,100]:
+            w, eps, epskres = dipoles.ip_eps2(electrons,nbnds=[2,2],esteps=200,res_k=True,chunk_size=chunk_size)
+            np.testing.assert_allclose(eps,eps_ref,rtol=1e-10)
+            np.testing.assert_allclose(np.sum(epskres,axis=1)*cofactor,eps_ref,rtol=1e-10)
+
+        #complex dielectric function: resonant and antiresonant parts
+        w, eps = dipoles.ip_eps2(electrons,mode='full',nbnds=[2,2],esteps=200,chunk_size=100)
+        self.assertEqual(eps.dtype,np.complex64)
+        np.testing.assert_allclose(eps.imag,eps_ref-eps_ar,rtol=1e-5,atol=1e-6*np.max(eps_ref))
+
+    def test_windows(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+        electrons = YamboElectronsDB.from_db_file(folder=test_path,Expand=True)
+        dipoles = YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',dip_type='iR')
+        window = YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',dip_type='iR',
+                                bands=[2,6],directions=[2],kpoints=[0,3,4,10])
+
+        #the expansion is done on first access
+        self.assertFalse(hasattr(window,'_dipoles'))
+        self.assertEqual(window.dipoles_ibz.shape,(4,1,3,2))
+        np.testing.assert_array_equal(window.read_directions,[2])
+        np.testing.assert_array_equal(window.kpoints_bz,np.nonzero(np.isin(lat.kpoints_indexes,[0,3,4,10]))[0])
+        self.assertEqual(window.dipoles.shape,(len(window.kpoints_bz),1,7,7))
+        np.testing.assert_array_equal(window.dipoles[:,:,2:,2:],dipoles.dipoles[window.kpoints_bz][:,[2],2:7,2:7])
+
+        #the spectrum is the contribution of the k-points read
+        w, eps, epskres = dipoles.ip_eps2(electrons,nbnds=[2,2],esteps=100,res_k=True)
+        window = YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',dip_type='iR',bands=[2,6],kpoints=[0,3,4,10])
+        w, eps_window = window.ip_eps2(electrons,nbnds=[2,2],esteps=100)
+        cofactor = 2*8*np.pi/lat.rlat_vol
+        np.testing.assert_allclose(eps_window,np.sum(epskres[:,window.kpoints_bz],axis=1)*cofactor,rtol=1e-10)
+
+        with self.assertRaises(ValueError):
+            YamboDipolesDB(lat,save=test_path,filename='ndb.dip_iR_and_P',bands=[4,10])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+#
+# License-Identifier: GPL
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import math
+import numpy as np
+from scipy.optimize import bisect
+from yambopy.tools.funcs import fermi, fermi_array, smeared_occupations
+from yambopy.dbs.electronsdb import YamboElectronsDB
+from yambopy.plot.spectra import get_spectra
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','ip','SAVE')
+
+class TestYamboElectronsDB(unittest.TestCase):
+
+    def test_smeared_occupations(self):
+
+        e = np.linspace(-3,3,61)
+        with np.errstate(all='raise'):
+            np.testing.assert_allclose(fermi_array(e,0.5,0.2),[ fermi(x) for x in (e-0.5)/0.2 ],rtol=1e-12,atol=1e-16)
+            np.testing.assert_array_equal(fermi_array([-1e5,1e5],0.,1e-3),[1.,0.])
+
+            #gaussian and first order Methfessel-Paxton
+            x = (0.5-e)/0.2
+            gauss = np.array([ 0.5*math.erfc(-xi) for xi in x ])
+            np.testing.assert_allclose(smeared_occupations(e,0.5,0.2,'gaussian'),gauss,rtol=1e-12)
+            np.testing.assert_allclose(smeared_occupations(e,0.5,0.2,'methfessel-paxton'),gauss+x*np.exp(-x**2)/(2*np.sqrt(np.pi)),rtol=1e-12,atol=1e-16)
+
+        #the Methfessel-Paxton occupations integrate to the step function
+        e = np.linspace(-8,8,4000)
+        for order in [1,2]:
+            occ = smeared_occupations(e,0.,1.,'methfessel-paxton',order=order)
+            self.assertAlmostEqual(np.trapezoid(np.where(e<0,1.,0.)-occ,e),0.,places=6)
+
+    def test_fermi(self):
+
+        electrons = YamboElectronsDB.from_db_file(folder=test_path)
+        electrons.expand_kpoints(verbose=0)
+        eigenvalues = electrons.eigenvalues_ibz.copy()
+        weights = electrons.weights_ibz[:electrons.nkpoints_ibz]
+        nv = electrons.nbandsv
+
+        #insulator: Fermi level in the gap
+        ef = electrons.GetFermi(inv_smear=0.01,setfermi=False)
+        self.assertTrue(np.max(eigenvalues[:,:,nv-1]) < ef < np.min(eigenvalues[:,:,nv]))
+
+        #metal: reference from the scalar Fermi-Dirac function
+        electrons.nelectrons -= 1
+        def occupation_minus_ne(ef):
+            return sum([ 2*sum(fermi_array(eigenvalues[0,nk],ef,0.1))*weights[nk] for nk in range(len(weights)) ])-electrons.nelectrons
+        ef_ref = bisect(occupation_minus_ne,np.min(eigenvalues),np.max(eigenvalues),xtol=1e-12)
+        for smearing in ['fermi-dirac','gaussian','methfessel-paxton']:
+            ef = electrons.GetFermi(inv_smear=0.1,setfermi=False,smearing=smearing)
+            self.assertAlmostEqual(electrons.occupations_minus_ne(ef,0.1,smearing),0.,places=8)
+            if smearing=='fermi-dirac': self.assertAlmostEqual(ef,ef_ref,places=8)
+
+        #occupations with the bands shifted to the Fermi level
+        ef = electrons.GetFermi(inv_smear=0.1)
+        self.assertEqual(electrons.efermi,ef)
+        np.testing.assert_allclose(electrons.eigenvalues_ibz,eigenvalues-ef,atol=1e-5)
+        self.assertEqual(electrons.occupations_ibz.shape,eigenvalues.shape)
+        self.assertAlmostEqual(2*np.einsum('skb,k->',electrons.occupations_ibz,weights),electrons.nelectrons,places=4)
+
+    def test_dos(self):
+
+        electrons = YamboElectronsDB.from_db_file(folder=test_path,Expand=True)
+        weights = electrons.weights_ibz[:electrons.nkpoints_ibz]
+
+        #binned spectra against the explicit sum over the poles
+        for broad in [0.1,0.02]:
+            w, dos = electrons.getDOS(broad=broad,emin=-10,emax=10)
+            w_ref, dos_ref = get_spectra(electrons.eigenvalues_ibz[0],weights=weights,broadening=broad,emin=-10,emax=10)
+            np.testing.assert_allclose(w,w_ref)
+            np.testing.assert_allclose(dos,dos_ref,atol=2e-3*np.max(dos_ref))
+
+        w, jdos = electrons.getJDOS(nconduction=4,broad=0.1)
+        w_ref, jdos_ref = get_spectra(electrons.get_transitions(nconduction=4),weights=weights,broadening=0.1)
+        np.testing.assert_allclose(jdos,jdos_ref,atol=2e-3*np.max(jdos_ref))
+
+        #lifetimes proportional to the dos at each eigenvalue
+        electrons.setLifetimesDOS(broad=0.1)
+        eigenvalues = electrons.eigenvalues_ibz
+        w, dos = electrons.getDOS(emin=np.min(eigenvalues)-0.1,emax=np.max(eigenvalues)+0.1,estep=0.01,broad=0.1)
+        lifetimes = np.interp(eigenvalues,w,dos/np.max(dos)*0.1)
+        self.assertEqual(electrons.lifetimes_ibz.shape,eigenvalues.shape)
+        np.testing.assert_allclose(electrons.lifetimes_ibz,lifetimes,rtol=1e-5)
+        np.testing.assert_allclose(electrons.lifetimes,electrons.lifetimes_ibz[:,electrons.kpoints_indexes])
+
+if __name__ == '__main__':
+    unittest.main()
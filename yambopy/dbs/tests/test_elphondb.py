@@ -0,0 +1,163 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from yambopy.units import ha2ev
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.elphondb import scale_gkkp, YamboElectronPhononDB
+from yambopy.letzelphc_interface.lelphcdb import LetzElphElectronPhononDB
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
+
+def write_letzelph_db(filename,nq=3,nk=4,nm=6,nb=2):
+    """
+    Small LetzElPhC-like ndb.elph with random frequencies and matrix elements
+    """
+    rng = np.random.default_rng(0)
+    with Dataset(filename,'w') as database:
+        for dim,size in [('initial_band',nb),('final_band_PH_abs',nb),('nmodes',nm),('atom',nm//3),
+                         ('nk',nk),('nq',nq),('nspin',1),('nsym_ph',1),('three',3),('two',2)]:
+            database.createDimension(dim,size)
+        database.createVariable('kpoints','f8',('nk','three'))[:] = rng.random((nk,3))
+        database.createVariable('qpoints','f8',('nq','three'))[:] = rng.random((nq,3))
+        database.createVariable('bands','i4',('two',))[:] = [1,nb]
+        database.createVariable('FREQ','f4',('nq','nmodes'))[:] = rng.random((nq,nm))*1e-3+1e-4
+        database.createVariable('POLARIZATION_VECTORS','f4',('nq','nmodes','atom','three','two'))[:] = rng.random((nq,nm,nm//3,3,2))
+        database.createVariable('elph_mat','f4',('nq','nk','nmodes','nspin','initial_band','final_band_PH_abs','two'))[:] = rng.random((nq,nk,nm,1,nb,nb,2))
+
+def write_yambo_elph_db(folder,nq=3,nk=8,nm=6,bands=(3,6)):
+    """
+    Small yambo ndb.elph_gkkp header and fragments with random frequencies,
+    dressed and bare matrix elements
+    """
+    rng = np.random.default_rng(0)
+    nb = bands[1]-bands[0]+1
+    with Dataset(os.path.join(folder,'ndb.elph_gkkp'),'w') as database:
+        database.createDimension('three',3)
+        database.createDimension('nq',nq)
+        database.createDimension('nk',nk)
+        database.createDimension('npars',5)
+        database.createVariable('PH_Q','f4',('three','nq'))[:] = rng.random((3,nq))
+        database.createVariable('HEAD_KPT','f4',('three','nk'))[:] = rng.random((3,nk))
+        database.createVariable('PARS','f4',('npars',))[:] = [nm,nq,nk,bands[0],bands[1]]
+    for iq in range(nq):
+        with Dataset(os.path.join(folder,'ndb.elph_gkkp_fragment_%d'%(iq+1)),'w') as database:
+            for dim,size in [('three',3),('atom',nm//3),('nmodes',nm),('nk',nk),('nb',nb),('complex',2)]:
+                database.createDimension(dim,size)
+            database.createVariable('PH_FREQS%d'%(iq+1),'f4',('nmodes',))[:] = rng.random(nm)*1e-5+1e-6
+            database.createVariable('POLARIZATION_VECTORS','f4',('three','atom','nmodes','complex'))[:] = rng.random((3,nm//3,nm,2))
+            for var in ['ELPH_GKKP_Q','ELPH_GKKP_BARE_Q']:
+                database.createVariable('%s%d'%(var,iq+1),'f4',('nk','nb','nb','nmodes','complex'))[:] = rng.random((nk,nb,nb,nm,2))
+
+class TestElectronPhononDB(unittest.TestCase):
+
+    def test_scale_gkkp(self):
+
+        rng = np.random.default_rng(1)
+        nq, nk, nm, nb = 3, 4, 6, 2
+        dvscf = (rng.random((nq,nk,nm,nb,nb)) + 1j*rng.random((nq,nk,nm,nb,nb))).astype(np.complex64)
+        ph_energies = rng.random((nq,nm))*0.1+0.01
+        acoustic = np.zeros((nq,nm),dtype=bool)
+        acoustic[0,:3] = True
+
+        #reference from the explicit loop over q-points and modes
+        g_ref = np.zeros_like(dvscf)
+        for iq in range(nq):
+            for inu in range(nm):
+                if not acoustic[iq,inu]: g_ref[iq,:,inu] = dvscf[iq,:,inu]/np.sqrt(2.*ph_energies[iq,inu]/ha2ev)
+
+        #the scaling is done in place
+        g = scale_gkkp(dvscf,ph_energies,acoustic=acoustic)
+        self.assertIs(g,dvscf)
+        np.testing.assert_allclose(g,g_ref,rtol=1e-6)
+
+    def test_letzelph_scale_g(self):
+
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder,'ndb.elph')
+            write_letzelph_db(filename)
+            dvscf = LetzElphElectronPhononDB(filename,div_by_energies=False)
+            lph = LetzElphElectronPhononDB(filename)
+
+        #the scaled matrix elements are the ones kept in the database object
+        ph_E = lph.ph_energies/(ha2ev/2.)
+        g_ref = dvscf.gkkp/np.sqrt(2.*ph_E)[:,np.newaxis,:,np.newaxis,np.newaxis,np.newaxis]
+        g_ref[0,:,:3] = 0.
+        np.testing.assert_allclose(lph.gkkp,g_ref,rtol=1e-6)
+        np.testing.assert_allclose(lph.gkkp_sq,np.abs(g_ref)**2,rtol=1e-5)
+
+    def test_letzelph_subsets(self):
+
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder,'ndb.elph')
+            write_letzelph_db(filename,nq=4,nk=5,nb=3)
+            full = LetzElphElectronPhononDB(filename)
+            qpoints, kpoints, modes, bands = [0,2], [1,2,4], [1,3,4,5], [2,3]
+            lph = LetzElphElectronPhononDB(filename,qpoints=qpoints,kpoints=kpoints,modes=modes,bands=bands)
+
+            #subsets read from disk are slices of the full database
+            b = slice(bands[0]-1,bands[1])
+            np.testing.assert_array_equal(lph.qpoints,full.qpoints[qpoints])
+            np.testing.assert_array_equal(lph.kpoints,full.kpoints[kpoints])
+            np.testing.assert_array_equal(lph.ph_energies,full.ph_energies[np.ix_(qpoints,modes)])
+            np.testing.assert_array_equal(lph.ph_eigenvectors,full.ph_eigenvectors[np.ix_(qpoints,modes)])
+            np.testing.assert_array_equal(lph.gkkp,full.gkkp[np.ix_(qpoints,kpoints,modes)][...,b,b])
+            self.assertEqual((lph.nq,lph.nk,lph.nm,lph.nb1,lph.nb2),(2,3,4,2,2))
+
+            #|g|^2 is recomputed when the matrix elements are read again
+            np.testing.assert_array_equal(lph.gkkp_sq,np.abs(lph.gkkp)**2)
+            with Dataset(filename) as database: lph.read_elph(database,scale_g_with_ph_energies=False)
+            np.testing.assert_array_equal(lph.gkkp_sq,np.abs(lph.gkkp)**2)
+            lph.gkkp = 2*lph.gkkp
+            np.testing.assert_array_equal(lph.gkkp_sq,np.abs(lph.gkkp)**2)
+
+            with self.assertRaises(ValueError):
+                LetzElphElectronPhononDB(filename,kpoints=[5])
+
+    def test_yambo_subsets(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        with tempfile.TemporaryDirectory() as folder:
+            write_yambo_elph_db(folder,bands=(3,6))
+            full = YamboElectronPhononDB(lat,folder_gkkp=folder,save=folder)
+            qpoints, kpoints, modes, bands = [2,0], [1,3,5,6], [0,2,4], [4,5]
+            yph = YamboElectronPhononDB(lat,folder_gkkp=folder,save=folder,qpoints=qpoints,kpoints=kpoints,modes=modes,bands=bands)
+
+            #subsets read from the fragments are slices of the full database
+            b = slice(bands[0]-2,bands[1]-2+1)
+            self.assertTrue(yph.are_bare_there)
+            np.testing.assert_array_equal(yph.qpoints,full.qpoints[qpoints])
+            np.testing.assert_array_equal(yph.car_kpoints,full.car_kpoints[kpoints])
+            np.testing.assert_array_equal(yph.ph_energies,full.ph_energies[np.ix_(qpoints,modes)])
+            np.testing.assert_array_equal(yph.ph_eigenvectors,full.ph_eigenvectors[np.ix_(qpoints,modes)])
+            for g, g_full in [(yph.gkkp,full.gkkp),(yph.gkkp_bare,full.gkkp_bare)]:
+                np.testing.assert_array_equal(g,g_full[np.ix_(qpoints,kpoints,modes)][...,b,b])
+            self.assertEqual((yph.nq_read,yph.nkpoints,yph.nmodes,yph.nbands,yph.b_in,yph.b_out),(2,4,3,2,4,5))
+
+            #derived couplings are rebuilt from the current matrix elements
+            gkkp_sq, gkkp_mixed = yph.gkkp_sq, yph.gkkp_mixed
+            np.testing.assert_array_equal(gkkp_sq,np.abs(yph.gkkp)**2)
+            yph.gkkp = 2*yph.gkkp
+            np.testing.assert_allclose(yph.gkkp_sq,4*gkkp_sq,rtol=1e-6)
+            np.testing.assert_allclose(yph.gkkp_mixed,2*gkkp_mixed,rtol=1e-6)
+            gkkp_mixed = yph.gkkp_mixed
+            yph.gkkp_bare = 3*yph.gkkp_bare
+            np.testing.assert_allclose(yph.gkkp_mixed,3*gkkp_mixed,rtol=1e-6)
+            yph.gkkp *= 0.5
+            np.testing.assert_allclose(yph.gkkp_sq,gkkp_sq,rtol=1e-6)
+            yph.read_elph(scale_g_with_ph_energies=False)
+            np.testing.assert_array_equal(yph.gkkp_sq,np.abs(yph.gkkp)**2)
+
+            with self.assertRaises(ValueError):
+                YamboElectronPhononDB(lat,folder_gkkp=folder,save=folder,bands=[1,4])
+
+if __name__ == '__main__':
+    unittest.main()
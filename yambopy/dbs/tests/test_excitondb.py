@@ -6,9 +6,12 @@
 import numpy as np
 import unittest
 import os
+from types import SimpleNamespace
 from yambopy.dbs.excitondb import YamboExcitonDB
 from yambopy.dbs.latticedb import YamboLatticeDB
 from yambopy.dbs.electronsdb import YamboElectronsDB
+from yambopy.tools.funcs import abs2, gaussian, boltzman_f
+from yambopy.units import ha2ev
 from qepy.lattice import Path
 
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
@@ -50,6 +53,130 @@ class TestYamboExcitonDB(unittest.TestCase):
         #exciton_bandstructure
         exc.plot_exciton_bs(electrons, path, (1,2,), args_plot={'c':'g'},space='bands',show=False)
 
+    def test_lazy_eigenvectors(self):
+
+        lat  = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        folder = os.path.join(test_path,'yambo')
+        exc  = YamboExcitonDB.from_db_file(lat,filename='ndb.BS_diago_Q01',folder=folder)
+        lazy = YamboExcitonDB.from_db_file(lat,filename='ndb.BS_diago_Q01',folder=folder,lazy=True)
+
+        #compare slices of the lazy view with the eigenvectors in memory
+        self.assertEqual(lazy.eigenvectors.shape,exc.eigenvectors.shape)
+        for index in [3,-1,np.int64(2),slice(2,9,3),slice(9,2,-3),[7,0,3],[],(5,2),([0,3],slice(0,4)),
+                      ([0,2],[1,3]),(slice(1,4),[0,2]),(np.array([[1,2],[3,0]]),2),(2,...),(...,3),(None,2),
+                      exc.eigenvectors[:,0].real>0]:
+            self.assertEqual(np.shape(lazy.eigenvectors[index]),np.shape(exc.eigenvectors[index]))
+            np.testing.assert_array_equal(lazy.eigenvectors[index],exc.eigenvectors[index])
+        np.testing.assert_array_equal(np.array(lazy.eigenvectors),exc.eigenvectors)
+        for index in [(2,...,...),(1,2,3),len(exc.eigenvectors),[0,len(exc.eigenvectors)]]:
+            with self.assertRaises(IndexError):
+                lazy.eigenvectors[index]
+
+        #quantities built on top of the eigenvectors
+        kpoints, amplitude, phase = exc.get_amplitudes_phases((1,2,))
+        kpoints, lazy_amplitude, lazy_phase = lazy.get_amplitudes_phases((1,2,))
+        np.testing.assert_allclose(lazy_amplitude,amplitude)
+        np.testing.assert_allclose(lazy_phase,phase)
+        lazy.eigenvectors.close()
+
+    def test_batched_spectra(self):
+
+        lat  = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        exc  = YamboExcitonDB.from_db_file(lat,filename='ndb.BS_diago_Q01',folder=os.path.join(test_path,'yambo'))
+        exc.Qpt = '1'
+        w = np.arange(0,10,0.01)
+        energies = exc.eigenvalues
+        residuals = exc.l_residual*exc.r_residual
+        cofactor = ha2ev*2/(2*np.pi)**3 * lat.rlat_vol/lat.nkpoints * (4*np.pi) / 1e-5**2
+
+        def spectrum_loop(residuals,broad):
+            """ sum over the excitonic states one at a time """
+            spectrum = np.zeros(len(w),dtype=complex)
+            for s in range(exc.nexcitons):
+                spectrum += residuals[s]*( -1/(w-energies[s]+broad[s]*1j) - 1/(-w-energies[s]-broad[s]*1j) )
+            return 1+spectrum*cofactor
+
+        #broadening of each exciton
+        e_min = np.min(energies.real)
+        gaussian_broad = 0.1*np.sum([ gaussian(energies.real,es,0.2) for es in energies.real ],axis=0)/exc.nexcitons
+        for broad,broad_ref in [(0.1,[0.1]*exc.nexcitons),
+                                ((0.05,0.2),[ 0.05+(es-e_min)*0.15 for es in energies.real ]),
+                                ('gaussian: 0.2 eV',gaussian_broad)]:
+            chi_ref = spectrum_loop(residuals,broad_ref)
+            for chunk_size in [None,3]:
+                w,chi = exc.get_chi(broad=broad,precision='double',chunk_size=chunk_size)
+                self.assertEqual(chi.dtype,np.complex128)
+                np.testing.assert_allclose(chi,chi_ref,rtol=1e-10)
+
+        #several temperatures in one pass, reference with the boltzmann weights of each exciton
+        temperatures = [1e4,2e4]
+        w,pl = exc.get_pl(Boltz_Temp=temperatures,precision='double',chunk_size=5)
+        self.assertEqual(pl.shape,(len(temperatures),len(w)))
+        for pl_T,T in zip(pl,temperatures):
+            weights = [ boltzman_f(es-energies[0],T) for es in energies ]
+            np.testing.assert_allclose(pl_T,spectrum_loop(residuals*weights,[0.1]*exc.nexcitons),rtol=1e-10)
+            np.testing.assert_allclose(exc.get_pl(Boltz_Temp=T)[1],pl_T,rtol=1e-5)
+
+    def test_exciton_light_coupling(self):
+
+        #build an excitonic database with random eigenvectors and dipoles
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        nk, vbands, cbands, nexcitons = lat.nkpoints, [3,4], [5,6,7], 6
+        table = np.array([ [k,v,c] for k in range(1,nk+1) for v in vbands for c in cbands ])
+        rng = np.random.default_rng(0)
+        eivs = rng.normal(size=(nexcitons,len(table))) + 1j*rng.normal(size=(nexcitons,len(table)))
+        energies = np.sort(1+rng.random(nexcitons)).astype(complex)
+        exc = YamboExcitonDB(lat,'1',energies,energies,energies,table=table,eigenvectors=eivs)
+        dipoles = SimpleNamespace(dipoles=rng.normal(size=(nk,3,8,8)) + 1j*rng.normal(size=(nk,3,8,8)))
+
+        #reference from the sum over transitions for each exciton
+        directions = [0,2]
+        coupling_ref = np.zeros((len(directions),nexcitons),dtype=complex)
+        for i_dir,dir in enumerate(directions):
+            for s in range(nexcitons):
+                EL1 = sum( eivs[s,t]*dipoles.dipoles[k,dir,c,v] for t,(k,v,c) in enumerate(table-1) )
+                coupling_ref[i_dir,s] = EL1*np.conj(EL1)
+
+        np.testing.assert_allclose(exc.get_exciton_light_coupling(dipoles,directions,nexcitons),coupling_ref,rtol=1e-10)
+        np.testing.assert_allclose(exc.get_exciton_light_coupling(dipoles,2,nexcitons),coupling_ref[[1]],rtol=1e-10)
+
+        #spectra for several directions in one pass
+        w,chi = exc.get_chi(dipoles=dipoles,dir=directions,precision='double')
+        self.assertEqual(chi.shape,(len(directions),len(w)))
+        for i_dir,dir in enumerate(directions):
+            np.testing.assert_allclose(chi[i_dir],exc.get_chi(dipoles=dipoles,dir=dir,precision='double')[1],rtol=1e-10)
+
+    def test_exciton_weights(self):
+
+        #build an excitonic database with random normalized eigenvectors
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        nk, vbands, cbands, nexcitons = 8, [3,4], [5,6,7], 6
+        table = np.array([ [k,v,c] for k in range(1,nk+1) for v in vbands for c in cbands ])
+        rng = np.random.default_rng(0)
+        eivs = rng.normal(size=(nexcitons,len(table))) + 1j*rng.normal(size=(nexcitons,len(table)))
+        eivs /= np.linalg.norm(eivs,axis=1)[:,np.newaxis]
+        energies = np.sort(rng.random(nexcitons)).astype(complex)
+        exc = YamboExcitonDB(lat,'1',energies,energies,energies,table=table,eigenvectors=eivs)
+
+        #reference from the explicit sum over transitions
+        excitons = (1,4,4)
+        weights_ref = np.zeros([nk,max(cbands)])
+        rho_ref = np.zeros([nk,len(vbands),len(excitons)])
+        for i_exc,exciton in enumerate(excitons):
+            for t,(k,v,c) in enumerate(table-1):
+                weights_ref[k,v] += abs(eivs[exciton-1,t])**2
+                weights_ref[k,c] += abs(eivs[exciton-1,t])**2
+                rho_ref[k,v-min(vbands)+1,i_exc] += abs(eivs[exciton-1,t])**2
+
+        np.testing.assert_allclose(exc.get_exciton_weights(excitons),weights_ref)
+        np.testing.assert_allclose(exc.calculate_rho(excitons),rho_ref)
+        np.testing.assert_allclose(exc.get_exciton_total_weights(excitons),np.sum(weights_ref,axis=1)/2)
+        np.testing.assert_allclose(exc.get_exciton_transitions(excitons).sum(axis=(1,2)),np.sum(weights_ref,axis=1)/2)
+
+        #a single exciton index, also as a numpy integer
+        for exciton in [4,np.int64(4)]:
+            np.testing.assert_allclose(exc.get_transition_weights(exciton),abs2(eivs[[3]]))
+
     def tearDown(self):
         if os.path.isfile('exc_I.dat'): os.remove('exc_I.dat')
         if os.path.isfile('exc_E.dat'): os.remove('exc_E.dat')
@@ -0,0 +1,50 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from yambopy.dbs.fragments import read_fragments, get_nfragments
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','ip','SAVE')
+
+def read_dipoles_fragment(filename,ik):
+    with Dataset(filename) as database:
+        dip = database.variables['DIP_iR_k_%04d_spin_0001'%(ik+1)][:]
+        return dip[...,0]+1j*dip[...,1]
+
+class TestFragments(unittest.TestCase):
+
+    def test_read_fragments(self):
+
+        frag_filename = os.path.join(test_path,'ndb.dip_iR_and_P_fragment_')
+        nfrags = get_nfragments(frag_filename,100)
+        self.assertEqual(nfrags,19)
+        self.assertEqual(get_nfragments(frag_filename),19)
+        self.assertEqual(get_nfragments(frag_filename,10),10)
+        self.assertEqual(get_nfragments(frag_filename,start=3),17)
+
+        #fragments with a suffix after the index (e.g. ns.wf_fragments_<ik>_1)
+        with tempfile.TemporaryDirectory() as folder:
+            for ik in [1,2,3,5]: open(os.path.join(folder,'ns.wf_fragments_%d_1'%ik),'w').close()
+            self.assertEqual(get_nfragments(os.path.join(folder,'ns.wf_fragments_'),suffix='_1'),3)
+            self.assertEqual(get_nfragments(os.path.join(folder,'ns.wf_fragments_')),0)
+        filenames = [ "%s%d"%(frag_filename,ik+1) for ik in range(nfrags) ]
+
+        #serial reading
+        dipoles = read_fragments(read_dipoles_fragment,filenames)
+        self.assertEqual(len(dipoles),nfrags)
+
+        #parallel reading in a preallocated array
+        out = np.zeros((nfrags,)+dipoles[0].shape,dtype=np.complex64)
+        read_fragments(read_dipoles_fragment,filenames,out=out,nworkers=3)
+        np.testing.assert_array_equal(out,np.array(dipoles))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from scipy.optimize import brentq
+from yambopy.dbs.greendb import YamboGreenDB
+
+def write_green_db(filename,energies,se,bands,kpoints):
+    """
+    Small ndb.G with the self-energies se on the grids energies [nqps,nenergies]
+    """
+    nqps, ne = energies.shape
+    with Dataset(filename,'w') as database:
+        for dim,size in [('two',2),('three',3),('ne',ne),('nqps',nqps),('nk',max(kpoints))]:
+            database.createDimension(dim,size)
+        database.createVariable('Green_Functions_Energies','f8',('two','ne','nqps'))[:] = [energies.T.real,energies.T.imag]
+        database.createVariable('Green_Functions','f8',('two','ne','nqps'))[:] = [(1./(energies-se)).T.real,(1./(energies-se)).T.imag]
+        database.createVariable('SE_Operator','f8',('two','ne','nqps'))[:] = [se.T.real,se.T.imag]
+        database.createVariable('QP_table','f8',('three','nqps'))[:] = [bands,bands,kpoints]
+        database.createVariable('QP_kpts','f8',('three','nk'))[:] = 0.
+
+class TestYamboGreenDB(unittest.TestCase):
+
+    def test_getqp(self):
+
+        #self-energies: linear with known solution, cubic, and without solution in the grid
+        nqps = 60
+        rng = np.random.default_rng(0)
+        e0 = rng.random(nqps)*4-2
+        energies = np.tile(np.linspace(-8,8,301),(nqps,1))+0j
+        a, b, c = rng.random(nqps)-0.5, -rng.random(nqps), rng.random(nqps)*0.1
+        se = a[:,np.newaxis]+b[:,np.newaxis]*energies.real-0.05*energies.real**3*(np.arange(nqps)%2)[:,np.newaxis] \
+             -1j*c[:,np.newaxis]*energies.real**2
+        se[-1] = 100.
+        bands = np.arange(nqps)%5+1
+        kpoints = np.arange(nqps)//5+1
+
+        with tempfile.TemporaryDirectory() as folder:
+            write_green_db(os.path.join(folder,'ndb.G'),energies,se,bands,kpoints)
+            green = YamboGreenDB(folder=folder)
+        eqp, z = green.getQP(e0)
+
+        #analytic solution of the linear self-energies
+        linear = np.arange(0,nqps-1,2)
+        eqp_ref = (a+e0)/(1-b)
+        np.testing.assert_allclose(eqp[linear].real,eqp_ref[linear],atol=1e-10)
+        np.testing.assert_allclose(z[linear],1./(1-b[linear]+2j*c[linear]*eqp_ref[linear]),atol=2e-3)
+        np.testing.assert_allclose(eqp[linear].imag,-c[linear]*eqp_ref[linear]**2,atol=2e-4)
+
+        #root of the interpolated self-energy
+        x = energies[0].real
+        for nqp in range(1,nqps-1,2):
+            f = lambda e: np.interp(e,x,se[nqp].real)-e+e0[nqp]
+            self.assertAlmostEqual(eqp[nqp].real,brentq(f,-8,8),places=10)
+
+        #state without solution and band window
+        np.testing.assert_array_equal(green.failed,[nqps-1])
+        self.assertTrue(np.isnan(eqp[-1]))
+        eqp, z = green.getQP(e0,bandmin=2,bandmax=3)
+        self.assertTrue(np.all(eqp[(bands<2)|(bands>3)]==0))
+        self.assertEqual(len(green.failed),0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,8 +5,12 @@
 #
 import unittest
 import os
+import numpy as np
+from unittest import mock
 from qepy.lattice import Path
-from yambopy.kpoints import get_path
+from yambopy import kpoints
+from yambopy.kpoints import get_path, expand_kpoints
+from yambopy.lattice import car_red, red_car, vec_in_list, isbetween
 from yambopy.dbs.latticedb import YamboLatticeDB
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw_conv')
 
@@ -37,8 +41,112 @@ class TestYamboLatticeDB(unittest.TestCase):
 
         print(ydb)
 
+    def test_expand_kpoints(self):
+        """ test the expansion of the kpoints in the full BZ """
+
+        filename = os.path.join(test_path,'..','ip','SAVE','ns.db1')
+        ydb = YamboLatticeDB.from_db_file(filename,Expand=False)
+        car_kpoints = ydb.car_kpoints
+        weights, kpoints_indexes, symmetry_indexes, kpoints_full = expand_kpoints(car_kpoints,ydb.sym_car,ydb.rlat)
+        nkpoints = len(car_kpoints)
+
+        #each kpoint is the rotation of its IBZ kpoint
+        rotated = np.einsum('kij,kj->ki',ydb.sym_car[symmetry_indexes],car_kpoints[kpoints_indexes])
+        np.testing.assert_allclose(kpoints_full,rotated,atol=1e-6)
+        np.testing.assert_allclose(np.sum(weights[:nkpoints]),1.)
+
+        #no kpoint appears twice in the full BZ
+        red_kpoints = np.round(car_red(kpoints_full,ydb.rlat),5)%1
+        self.assertEqual(len(np.unique(red_kpoints,axis=0)),len(kpoints_full))
+
+        #noise below atol on the kpoints does not change the expansion
+        red_full = car_red(kpoints_full,ydb.rlat)
+        expansion = expand_kpoints(kpoints_full,ydb.sym_car,ydb.rlat)
+        for seed in range(3):
+            noise = 1e-7*np.random.default_rng(seed).normal(size=red_full.shape)
+            noisy = expand_kpoints(red_car(red_full+noise,ydb.rlat),ydb.sym_car,ydb.rlat)
+            for array,noisy_array in zip(expansion[:3],noisy[:3]):
+                np.testing.assert_array_equal(noisy_array,array)
+
+        #kpoints closer than atol are merged even across the rounding boundaries
+        kpt_a = np.array([0.1+0.45e-6,0.2+0.95e-6,0.3])
+        kpt_b = np.array([0.1+0.55e-6,0.2+1.05e-6,0.3])
+        weights, kpoints_indexes, symmetry_indexes, kpoints_full = expand_kpoints([kpt_a],[np.eye(3),np.diag(kpt_b/kpt_a)],np.eye(3))
+        np.testing.assert_array_equal(symmetry_indexes,[0])
+        np.testing.assert_allclose(weights,[1.])
+
+    def test_coordinates(self):
+        """ test the batched coordinate conversions and checks """
+
+        ydb = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE/ns.db1'),Expand=False)
+        red_kpoints = np.random.default_rng(0).random((10,3))
+        car_kpoints = red_car(red_kpoints,ydb.rlat)
+        np.testing.assert_allclose(car_kpoints,[ k[0]*ydb.rlat[0]+k[1]*ydb.rlat[1]+k[2]*ydb.rlat[2] for k in red_kpoints ])
+        np.testing.assert_allclose(car_red(car_kpoints,ydb.rlat),red_kpoints)
+
+        #a single vector or a list of vectors
+        self.assertTrue(vec_in_list(car_kpoints[3],car_kpoints))
+        np.testing.assert_array_equal(vec_in_list([car_kpoints[2],car_kpoints[2]+1e-3],car_kpoints),[True,False])
+        np.testing.assert_array_equal(isbetween(car_kpoints[0],car_kpoints[1],[car_kpoints[0]*0.5+car_kpoints[1]*0.5,car_kpoints[2]]),[True,False])
+
+    def test_get_path(self):
+        """ test the projection of the kpoints on a path and the cache of the results """
+
+        ydb = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE/ns.db1'),Expand=False)
+        red_kpoints = np.array([ [i/6,j/6,0] for i in range(6) for j in range(6) ])
+        car_kpoints = red_car(red_kpoints,ydb.rlat)
+        p = Path([ [[0.0,0.0,0.0],'G'],
+                   [[0.5,0.0,0.0],'M'],
+                   [[1./3,1./3,0.0],'K'],
+                   [[0.0,0.0,0.0],'G']], [10,10,10])
+
+        #reference from the distance of each kpoint (and its images) to each segment
+        kpts_path_car = red_car(p.kpoints,ydb.rlat)
+        kpoints_ref, indexes_ref = [], []
+        for start,end in zip(kpts_path_car[:-1],kpts_path_car[1:]):
+            on_segment = []
+            for ik,kpt in enumerate(car_kpoints):
+                for shift in red_car([ [x,y,0] for x in range(-1,2) for y in range(-1,2) ],ydb.rlat):
+                    t = np.dot(kpt+shift-start,end-start)/np.dot(end-start,end-start)
+                    if -1e-8 < t < 1+1e-8 and np.linalg.norm(start+t*(end-start)-kpt-shift) < 1e-5:
+                        on_segment.append((t,kpt+shift,ik))
+            for t,kpt,ik in sorted(on_segment,key=lambda x: x[0]):
+                kpoints_ref.append(kpt)
+                indexes_ref.append(ik)
+
+        with mock.patch.dict(kpoints._path_cache,clear=True):
+            with mock.patch('yambopy.kpoints._project_on_path',wraps=kpoints._project_on_path) as project:
+                bands_kpoints, bands_indexes, path_car = get_path(car_kpoints,ydb.rlat,None,p)
+                np.testing.assert_allclose(bands_kpoints,kpoints_ref,atol=1e-10)
+                np.testing.assert_array_equal(bands_indexes,indexes_ref)
+                np.testing.assert_allclose(path_car.kpoints,kpts_path_car)
+
+                #a cache hit returns copies of the stored results
+                bands_kpoints[:] = 0
+                bands_indexes[:] = -1
+                cached_kpoints, cached_indexes, _ = get_path(car_kpoints,ydb.rlat,None,p)
+                self.assertEqual(project.call_count,1)
+                np.testing.assert_allclose(cached_kpoints,kpoints_ref,atol=1e-10)
+                np.testing.assert_array_equal(cached_indexes,indexes_ref)
+
+                #cache=False computes the projection and leaves the cache untouched
+                keys = list(kpoints._path_cache)
+                get_path(car_kpoints,ydb.rlat,None,p,cache=False)
+                self.assertEqual(project.call_count,2)
+                self.assertEqual(list(kpoints._path_cache),keys)
+
+                #the oldest result is evicted when the cache is full
+                with mock.patch.object(kpoints,'_path_cache_size',2):
+                    get_path(car_kpoints[:20],ydb.rlat,None,p)
+                    get_path(car_kpoints[:30],ydb.rlat,None,p)
+                    self.assertEqual(project.call_count,4)
+                    self.assertEqual(len(kpoints._path_cache),2)
+                    self.assertNotIn(keys[0],kpoints._path_cache)
+                    get_path(car_kpoints,ydb.rlat,None,p)
+                    self.assertEqual(project.call_count,5)
+
     def tearDown(self): 
-        os.remove('lattice.json')
+        if os.path.isfile('lattice.json'): os.remove('lattice.json')
 
 if __name__ == '__main__':
     unittest.main()
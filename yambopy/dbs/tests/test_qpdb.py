@@ -5,6 +5,8 @@
 #
 import unittest
 import os
+import numpy as np
+from yambopy.units import ha2ev
 from yambopy.dbs.qpdb import YamboQPDB
 test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','gw')
 
@@ -23,5 +25,32 @@ class TestYamboQPDB(unittest.TestCase):
 
         print(qpdb)
 
+    def test_get_qps(self):
+
+        #spin-polarized QP table in random order
+        rng = np.random.default_rng(0)
+        nk, nb = 6, 5
+        k, b, s = [ a.ravel() for a in np.meshgrid(np.arange(3,3+nk),np.arange(2,2+nb),[1,2],indexing='ij') ]
+        order = rng.permutation(len(k))
+        e = rng.random(len(k))+1j*rng.random(len(k))
+        qps = {'Kpoint':np.zeros((nk,3)),'Kpoint_index':k[order],'Band':b[order],'Spin_pol':s[order],
+               'Eo':e[order].real,'E':e[order],'Z':e[order].real}
+        qpdb = YamboQPDB(qps)
+
+        #reference from the loop over the QP states
+        eqp_ref, lw_ref = np.zeros([nk,nb,2]), np.zeros([nk,nb,2])
+        for ki,ni,si,ei in zip(k,b,s,e): 
+            eqp_ref[ki-3,ni-2,si-1] = ei.real*ha2ev
+            lw_ref[ki-3,ni-2,si-1]  = ei.imag*ha2ev
+        np.testing.assert_allclose(qpdb.eigenvalues_qp,eqp_ref)
+        np.testing.assert_allclose(qpdb.lifetimes,lw_ref)
+        self.assertIs(qpdb.eigenvalues_qp,qpdb.eigenvalues_qp)
+
+        #filtered states
+        e0, eqp, lw = qpdb.get_filtered_qps(3,4)
+        selected = (b[order]>=3) & (b[order]<=4)
+        np.testing.assert_array_equal(eqp,qpdb.e[selected])
+        np.testing.assert_array_equal(lw,qpdb.linewidths[selected])
+
 if __name__ == '__main__':
     unittest.main()
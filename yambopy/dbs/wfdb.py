@@ -10,6 +10,12 @@ from yambopy.tools.string import marquee
 from yambopy.units import I
 import shutil
 import os
+from yambopy.dbs.fragments import read_fragments, get_nfragments
+
+def _read_wf_fragment(filename,ik):
+    with Dataset(filename) as database:
+        aux = database.variables['WF_COMPONENTS_@_SP_POL1_K%d_BAND_GRP_1'%(ik+1)][:]
+        return aux[:,:,:,0]+I*aux[:,:,:,1]
 
 def abs2(x):
     return x.real**2 + x.imag**2
@@ -25,7 +31,7 @@ class YamboWFDB():
     :: Methods: read(), write(), get_spin_projection() 
     """
 
-    def __init__(self,path=None,save='SAVE',filename='ns.wf'):
+    def __init__(self,path=None,save='SAVE',filename='ns.wf',nworkers=1):
         """
         load wavefunction from yambo
 
@@ -36,6 +42,7 @@ class YamboWFDB():
         else:
             self.path = path+f'{save}' # Fix Bug here which made it impossible to read from save with different folder name
         self.filename = filename
+        self.nworkers = nworkers
         
         #read wf 
         self.read()
@@ -45,18 +52,12 @@ class YamboWFDB():
         path = self.path
         filename = self.filename
 
-        wf = []
-        nk = 1
-        while True:
-            try:
-                fname = "%s/%s_fragments_%d_1"%(path,filename,nk)
-                database = Dataset(fname)
-                aux = database.variables['WF_COMPONENTS_@_SP_POL1_K%d_BAND_GRP_1'%nk][:]
-                wf.append( aux[:,:,:,0]+I*aux[:,:,:,1]  )
-                nk+=1
-            except:
-                if nk==1: raise IOError('Could not read %s'%fname)
-                break
+        #count the k-point fragments
+        nk = get_nfragments("%s/%s_fragments_"%(path,filename),suffix='_1')
+        if nk==0: raise IOError('Could not read %s/%s_fragments_1_1'%(path,filename))
+
+        fnames = [ "%s/%s_fragments_%d_1"%(path,filename,ik+1) for ik in range(nk) ]
+        wf = read_fragments(_read_wf_fragment,fnames,nworkers=self.nworkers)
         self.wf = np.array(wf)
 
     def write(self,path):
@@ -12,7 +12,7 @@ import numpy as np
 import os
 import shutil
 from netCDF4 import Dataset
-from yambopy.lattice import car_red, vec_in_list
+from yambopy.lattice import car_red, vec_in_list, GvectorsMap
 from yambopy.kpoints import expand_kpoints
 from yambopy.tools.string import marquee
 
@@ -95,7 +95,7 @@ class YamboEm1sRotate():
         # Get symmetries in CC and real-space atomic positions
         if not os.path.isfile('%s/%s'%(save_path,db1)): raise FileNotFoundError("File %s not found."%db1)
         database = Dataset("%s/%s"%(save_path,db1), 'r')
-        self.sym_car = np.transpose( database.variables['SYMMETRY'][:], (0,2,1) ), # transpose leaving first axis as symm index
+        self.sym_car = np.transpose( database.variables['SYMMETRY'][:], (0,2,1) ) # transpose leaving first axis as symm index
         n_atoms =  database.variables['N_ATOMS'][:].astype(int)
         atom_pos = database.variables['ATOM_POS'][:]
         if verbose: iku_kpoints_ibz = database.variables['K-POINTS'][:].T
@@ -153,25 +153,25 @@ class YamboEm1sRotate():
 
         return expanded_car_kpoints,kpoints_indices,symmetry_indices,weights_ibz
 
-    def inverse_Gvector_table(self,tol=1e-5):
+    def inverse_Gvector_table(self,tol=1e-4):
         """
         Build table Sm1G_table such as:
 
         if ig_S = Sm1G_table[ig,iS], then S^{-1}G[ig]=G[ig_S]
 
-        - kwargs are atol and rtol for np.isclose
+        - tol is the maximum distance of the reduced coordinates of S^{-1}G from integers
+
+        All the rotated G-vectors are looked up at once in a GvectorsMap of the G-vectors
         """
         inv_syms = np.linalg.inv(self.sym_car)
-        Sm1G_table = np.zeros((self.ngvectors,len(inv_syms)),dtype=int)
 
-        self.rotated_gvectors = np.zeros([len(self.sym_car),len(self.gvectors),3])
-        for iG,G in enumerate(self.gvectors):
-            for i_S,sym in enumerate(inv_syms):
-                check = np.sum( (self.gvectors - np.dot(sym,G))**2., axis=1) < tol
-                if np.sum(check) == 1.0: # One G-vector G' has been found to correspond to sym^{-1}G
-                    Sm1G_table[iG,i_S]=int(np.where(check==1.0)[0])
-                elif np.sum(check)!= 1.0: #None or multiple G-vectors have been found
-                    raise ValueError("\n[ERROR] Problem in mapping inverse G-vectors. Try:\n - (i) reducing isclose() tolerance in get_g_index (easy case) \n - (ii) check that yambo packs G-shells correctly for your lattice type and G-cutoff (difficult case)")
+        #S^{-1}G for all the G-vectors and symmetries: [ng,nsym,3]
+        rotated_gvectors = np.einsum('sij,gj->gsi',inv_syms,self.gvectors)
+        self.rotated_gvectors = rotated_gvectors.swapaxes(0,1)
+        Sm1G_table = GvectorsMap(self.red_gvectors,tol=tol)(car_red(rotated_gvectors,self.rlat))
+
+        if np.any(Sm1G_table<0): #G-vectors not found in the list
+            raise ValueError("\n[ERROR] Problem in mapping inverse G-vectors. Try:\n - (i) increasing the tolerance tol of inverse_Gvector_table (easy case) \n - (ii) check that yambo packs G-shells correctly for your lattice type and G-cutoff (difficult case)")
 
         return Sm1G_table
 
@@ -193,22 +193,20 @@ class YamboEm1sRotate():
 
             :math:  D_{g1,g2}(ISq) = [ D_{(IS)^-1g1,(IS)^-1g2}(q) ]^*
 
+        Each q-matrix is permuted with fancy indexing (rows, then columns)
+        and conjugated in place if the q-point is obtained with time reversal
         """
         X = np.zeros([self.nqpoints,self.ngvectors,self.ngvectors],dtype=np.complex64)
-        
+
+        # index of G' such as G'=S-1G for each q-point: [nq,ng]
+        Sm1_ig = self.Sm1G_table[:,self.syms_indices].T
+        # TR
+        trev = (self.inv_type=='trev') & (np.array(self.syms_indices)>=self.inv_index)
+
         for iq in range(self.nqpoints):
             iq_ibz = self.qpoints_indices[iq] # Index of untransformed q_ibz
-            iS     = self.syms_indices[iq]    # Index of symmetry Sq=q_ibz
-            for ig1 in range(self.ngvectors):
-                Sm1_ig1 = self.Sm1G_table[ig1,iS] # index of G' such as G'=S-1G    
-                for ig2 in range(self.ngvectors):
-                    Sm1_ig2 = self.Sm1G_table[ig2,iS] 
-                    # No TR
-                    if self.inv_type=='spatial' or iS<self.inv_index:
-                        X[iq,ig1,ig2]=self.X_ibz[iq_ibz,Sm1_ig1,Sm1_ig2]
-                    # TR
-                    if self.inv_type=='trev' and iS>=self.inv_index:
-                        X[iq,ig1,ig2]=np.conj(self.X_ibz[iq_ibz,Sm1_ig1,Sm1_ig2])
+            np.take(self.X_ibz[iq_ibz][Sm1_ig[iq]],Sm1_ig[iq],axis=1,out=X[iq])
+            if trev[iq]: np.conjugate(X[iq],out=X[iq])
 
         self.X = X                   
 
@@ -0,0 +1,137 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from itertools import product, permutations
+from netCDF4 import Dataset
+from yambopy.lattice import GvectorsMap
+from yambopy.dbs.em1sdb import YamboStaticScreeningDB
+from yambopy.em1s.em1s_rotate import YamboEm1sRotate
+
+def cubic_group():
+    """ Rotations of the cubic point group (the identity is the first one) """
+    return [ np.diag(signs)[list(perm)] for perm in permutations(range(3)) for signs in product([1,-1],repeat=3) ]
+
+def sphere_gvectors(gmax=2):
+    return np.array([ g for g in product(range(-gmax,gmax+1),repeat=3) if np.dot(g,g)<=gmax**2 ],dtype=float)
+
+def write_em1s_dbs(folder,qpoints,gmax=2):
+    """
+    ns.db1, ndb.em1s and fragments with random screening for a simple cubic lattice (alat=1)
+    with one atom out of the origin (no spatial inversion), the 48 symmetries and a sphere of G-vectors
+    """
+    rng = np.random.default_rng(0)
+    syms = np.array(cubic_group(),dtype=float)
+    gvectors = sphere_gvectors(gmax)
+    ng, nq = len(gvectors), len(qpoints)
+    with Dataset(os.path.join(folder,'ns.db1'),'w') as database:
+        for dim,size in [('one',1),('three',3),('nsym',len(syms)),('ng',ng)]:
+            database.createDimension(dim,size)
+        database.createVariable('LATTICE_PARAMETER','f8',('three',))[:] = np.ones(3)
+        database.createVariable('LATTICE_VECTORS','f8',('three','three'))[:] = np.eye(3)
+        database.createVariable('G-VECTORS','f8',('three','ng'))[:] = gvectors.T
+        database.createVariable('SYMMETRY','f8',('nsym','three','three'))[:] = np.transpose(syms,(0,2,1))
+        database.createVariable('N_ATOMS','f8',('one',))[:] = [1]
+        database.createVariable('ATOM_POS','f8',('one','one','three'))[:] = [[[0.1,0.2,0.3]]]
+    with Dataset(os.path.join(folder,'ndb.em1s'),'w') as database:
+        for dim,size in [('one',1),('three',3),('nq',nq),('ng',ng),('strlen',10)]:
+            database.createDimension(dim,size)
+        database.createVariable('X_PARS_1','f8',('three',))[:] = [ng,1,10]
+        database.createVariable('X_RL_vecs','f8',('three','ng'))[:] = gvectors.T
+        database.createVariable('HEAD_QPT','f8',('three','nq'))[:] = np.array(qpoints).T
+        database.createVariable('CUTOFF','S1',('one','strlen'))[:] = np.array([list('none'.ljust(10))],dtype='S1')
+    for iq in range(nq):
+        with Dataset(os.path.join(folder,'ndb.em1s_fragment_%d'%(iq+1)),'w') as database:
+            for dim,size in [('one',1),('complex',2),('ng',ng)]:
+                database.createDimension(dim,size)
+            database.createVariable('X_Q_%d'%(iq+1),'f4',('one','complex','ng','ng'))[:] = rng.random((1,2,ng,ng))
+
+def cubic_rotation(nq=5,gmax=2):
+    """
+    YamboEm1sRotate with the cubic point group, a sphere of G-vectors and random IBZ screening
+    (built without the databases)
+    """
+    syms = cubic_group()
+    gvectors = sphere_gvectors(gmax)
+
+    rng = np.random.default_rng(0)
+    yrot = YamboEm1sRotate.__new__(YamboEm1sRotate)
+    yrot.sym_car      = np.array(syms,dtype=float)
+    yrot.rlat         = np.eye(3)
+    yrot.gvectors     = gvectors
+    yrot.red_gvectors = gvectors
+    yrot.ngvectors    = len(gvectors)
+    yrot.X_ibz        = (rng.random((nq,len(gvectors),len(gvectors)))+1j*rng.random((nq,len(gvectors),len(gvectors)))).astype(np.complex64)
+    yrot.qpoints_indices = np.repeat(np.arange(nq),4)
+    yrot.syms_indices    = rng.integers(len(syms),size=4*nq)
+    yrot.nqpoints     = 4*nq
+    yrot.inv_type     = 'trev'
+    yrot.inv_index    = len(syms)//2
+    return yrot
+
+class TestYamboEm1sRotate(unittest.TestCase):
+
+    def test_gvectors_map(self):
+
+        yrot = cubic_rotation()
+        gmap = GvectorsMap(yrot.red_gvectors)
+        np.testing.assert_array_equal(gmap(yrot.red_gvectors+1e-6),np.arange(yrot.ngvectors))
+        np.testing.assert_array_equal(gmap([[3,0,0],[0.5,0,0],[0,0,-2]]),[-1,-1,np.argmax(np.all(yrot.gvectors==[0,0,-2],axis=1))])
+
+    def test_rotate_em1s(self):
+
+        yrot = cubic_rotation()
+        table = yrot.inverse_Gvector_table()
+
+        #reference from the explicit search of each rotated G-vector
+        for ig,G in enumerate(yrot.gvectors):
+            for i_S,sym in enumerate(np.linalg.inv(yrot.sym_car)):
+                self.assertTrue(np.allclose(yrot.gvectors[table[ig,i_S]],np.dot(sym,G)))
+
+        #reference from the loop over q-points and G-vectors
+        yrot.Sm1G_table = table
+        yrot.rotate_em1s()
+        for iq,(iq_ibz,iS) in enumerate(zip(yrot.qpoints_indices,yrot.syms_indices)):
+            X = np.zeros([yrot.ngvectors,yrot.ngvectors],dtype=np.complex64)
+            for ig1 in range(yrot.ngvectors):
+                for ig2 in range(yrot.ngvectors):
+                    X[ig1,ig2] = yrot.X_ibz[iq_ibz,table[ig1,iS],table[ig2,iS]]
+            if iS>=yrot.inv_index: X = np.conj(X)
+            np.testing.assert_array_equal(yrot.X[iq],X)
+
+        #G-vectors not closed under the symmetries
+        yrot.red_gvectors = yrot.gvectors = yrot.gvectors[1:]
+        with self.assertRaises(ValueError):
+            yrot.inverse_Gvector_table()
+
+    def test_from_dbs(self):
+
+        qpoints = [[0.,0.,0.],[0.25,0.,0.],[0.25,0.25,0.]]
+        with tempfile.TemporaryDirectory() as folder:
+            write_em1s_dbs(folder,qpoints)
+            yem1s = YamboStaticScreeningDB(save=folder,em1s=folder)
+            yrot = YamboEm1sRotate(yem1s,save_path=folder)
+
+        #symmetries read from ns.db1 (as an array, not a tuple)
+        self.assertIsInstance(yrot.sym_car,np.ndarray)
+        np.testing.assert_array_equal(yrot.sym_car,np.array(cubic_group(),dtype=float))
+        self.assertEqual((yrot.inv_type,yrot.inv_index),('trev',[ np.allclose(S,-np.eye(3)) for S in cubic_group() ].index(True)))
+
+        #the stars of the q-points of the IBZ and the screening rotated on them
+        self.assertEqual(yrot.nqpoints,1+6+12)
+        table = yrot.Sm1G_table
+        for iq,(iq_ibz,iS) in enumerate(zip(yrot.qpoints_indices,yrot.syms_indices)):
+            np.testing.assert_allclose(yrot.qpoints[iq],yrot.sym_car[iS]@yem1s.car_qpoints[iq_ibz],atol=1e-8)
+            X = yem1s.X[iq_ibz][np.ix_(table[:,iS],table[:,iS])]
+            if iS>=yrot.inv_index: X = np.conj(X)
+            np.testing.assert_array_equal(yrot.X[iq],X)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ import os
 from yambopy.plot.plotting import BZ_Wigner_Seitz
 from yambopy.kpoints import expand_kpoints
 from yambopy.units import ha2ev, ev2cm1
+from yambopy.dbs.fragments import read_fragments, get_nfragments
+from yambopy.dbs.elphondb import _read_frequencies_fragment, _read_eigenmodes_fragment
 
 def phonon_overlap(mode1,mode2):
     """
@@ -108,11 +110,7 @@ class YamboRefineElphDB():
             database.close()
 
         #Check how many databases are present
-        self.nfrags = self.nqpoints
-        for iq in range(self.nqpoints):
-            if not os.path.isfile("%s%d"%(self.frag_filename,iq+1)):
-                self.nfrags = iq
-                break
+        self.nfrags = get_nfragments(self.frag_filename,self.nqpoints)
         if self.nfrags!=self.nqpoints: raise FileNotFoundError("Found: %d fragments. Needed: %d"%(self.nfrags,self.nqpoints))
 
         #Check presence of matdyn output
@@ -140,12 +138,8 @@ class YamboRefineElphDB():
         Read phonon frequencies in eV
         """
         self.ph_energies  = np.zeros([self.nfrags,self.nmodes])
-
-        for iq in range(self.nfrags):
-            fil = self.frag_filename + "%d"%(iq+1)
-            database = Dataset(fil,'r')
-            self.ph_energies[iq] = np.sqrt(database.variables['PH_FREQS%d'%(iq+1)][:])*ha2ev
-            database.close()
+        filenames = [ self.frag_filename + "%d"%(iq+1) for iq in range(self.nfrags) ]
+        read_fragments(_read_frequencies_fragment,filenames,out=self.ph_energies)
 
     def read_eigenvectors(self,iq,mode='matdyn'):
         """ Wrapper for either matdyn or yambo reading 
@@ -158,15 +152,7 @@ class YamboRefineElphDB():
         """
         Read phonon eigenvectors
         """
-        ph_eigenvectors = np.zeros([self.nmodes,self.natoms,3],dtype=np.complex64)
-
-        fil = self.frag_filename + "%d"%(iq+1)
-        database= Dataset(fil)
-        eigs_q = database.variables['POLARIZATION_VECTORS'][:].T
-        ph_eigenvectors = eigs_q[0,:,:,:] + eigs_q[1,:,:,:]*1j
-        database.close()
-        
-        return ph_eigenvectors
+        return _read_eigenmodes_fragment(self.frag_filename + "%d"%(iq+1),iq)
 
     def read_matdyn(self):
         """ Read prefix.freq file
@@ -200,18 +186,17 @@ class YamboRefineElphDB():
 
         weights, kpoints_indexes, symmetry_indexes, kpoints_full = expand_kpoints(self.qpts_matdyn,self.sym_car,self.rlat,atol=atol)
 
-        if verbose: print("%d kpoints expanded to %d"%(len(self.car_kpoints),len(kpoints_full)))
+        if verbose: print("%d kpoints expanded to %d"%(len(self.qpts_matdyn),len(kpoints_full)))
 
         #set the variables
         self.weights_ibz        = weights
         self.qpoints_indices    = kpoints_indexes
         self.symmetry_indices   = symmetry_indexes
-        self.iku_matdyn_qpoints = np.array([k*self.alat for k in kpoints_full])
+        self.iku_matdyn_qpoints = kpoints_full*self.alat
         self.car_matdyn_qpoints = kpoints_full
 
     def expand_frequencies(self):
-        self.matdyn_ph_energies = np.zeros([self.nqpoints,self.nmodes])
-        for iq in range(self.nqpoints): self.matdyn_ph_energies[iq] = self.freqs_matdyn[self.qpoints_indices[iq]]
+        self.matdyn_ph_energies = self.freqs_matdyn[self.qpoints_indices[:self.nqpoints]]
     
     def read_eigenvectors_matdyn(self,iq):
         """
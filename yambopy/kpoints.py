@@ -8,10 +8,29 @@
 # This file is part of the yambopy project
 #
 import numpy as np
+import hashlib
 from itertools import product
 from yambopy.lattice import red_car, vec_in_list, isbetween, car_red
 from qepy.lattice import Path
 
+def _first_unique(rows):
+    """
+    Indices of the first occurrence of each distinct row of an integer array (in increasing order)
+    """
+    return np.sort(np.unique(rows,axis=0,return_index=True)[1])
+
+def kpoints_hash(red_kpoints,atol=1.e-6):
+    """
+    Integer keys of kpoints in reduced coordinates, folded in the first Brillouin zone
+
+    The coordinates are rounded on a grid of spacing atol: kpoints with the same keys are
+    equal within atol (modulo a reciprocal lattice vector), but kpoints closer than atol
+    can still get different keys if they lie on both sides of a rounding boundary.
+    """
+    red_kpoints = np.asarray(red_kpoints)/atol
+    nmod = int(round(1./atol))
+    return np.rint(red_kpoints).astype(np.int64)%nmod
+
 def expand_kpoints(car_kpoints,sym_car,rlat,atol=1.e-6):
     """
     Take a list of kpoints and symmetry operations and return the full brillouin zone
@@ -28,45 +47,47 @@ def expand_kpoints(car_kpoints,sym_car,rlat,atol=1.e-6):
     * kpoints_indexes: indexes of the kpoints in the irreducible brillouin zone
     * symmetry_indexes: indexes of the symmetries used to generate the kpoints
     * kpoints_full: kpoints in the full brillouin zone
-    """
-
-    #check if the kpoints were already exapnded
-    kpoints_indexes  = []
-    kpoints_full     = []
-    symmetry_indexes = []
-
-    #kpoints in the full brillouin zone organized per index
-    kpoints_full_i = {}
 
-    #expand using symmetries
-    for nk,k in enumerate(car_kpoints):
-        #if the index in not in the dicitonary add a list
-        if nk not in kpoints_full_i:
-            kpoints_full_i[nk] = []
-
-        for ns,sym in enumerate(sym_car):
-
-            new_k = np.dot(sym,k)
-            #check if the point is inside the bounds
-            k_red = car_red([new_k],rlat)[0]
-            k_red[np.abs(k_red) < atol] = 0. # Set to zero values < atol to avoid mistakes
-            k_bz = (k_red+atol)%1
-
-            #if the vector is not in the list of this index add it
-            if not vec_in_list(k_bz,kpoints_full_i[nk],atol=atol):
-                kpoints_full_i[nk].append(k_bz)
-                kpoints_full.append(new_k)
-                kpoints_indexes.append(nk)
-                symmetry_indexes.append(ns)
-                continue
+    All the symmetry operations are applied at once. For each IBZ kpoint the first
+    symmetry producing a new point of the star is kept: the rotated kpoints are first
+    merged by integer keys (see kpoints_hash) and the remaining pairs closer than atol
+    (modulo a reciprocal lattice vector) are found with a KD-tree.
+    """
+    from scipy.spatial import cKDTree
+    car_kpoints = np.array(car_kpoints).reshape(-1,3)
+    sym_car = np.array(sym_car)
+    nkpoints, nsym = len(car_kpoints), len(sym_car)
+
+    #rotated[k,s] = S_s k
+    rotated = np.einsum('sij,kj->ksi',sym_car,car_kpoints).reshape(-1,3)
+    red_rotated = car_red(rotated,rlat)
+    red_rotated[np.abs(red_rotated) < atol] = 0. # Set to zero values < atol to avoid mistakes
+
+    #keep the first occurrence of each point in the star of each IBZ kpoint
+    kpoints_indexes  = np.repeat(np.arange(nkpoints),nsym)
+    symmetry_indexes = np.tile(np.arange(nsym),nkpoints)
+    keys = kpoints_hash(red_rotated,atol=atol)
+    full = _first_unique(np.column_stack([kpoints_indexes,keys]))
+
+    #points of the same star closer than atol but with different keys
+    tree = cKDTree(red_rotated[full]%1,boxsize=1)
+    pairs = np.sort(tree.query_pairs(atol,p=np.inf,output_type='ndarray'),axis=1)
+    pairs = pairs[kpoints_indexes[full[pairs[:,0]]]==kpoints_indexes[full[pairs[:,1]]]]
+    keep = np.ones(len(full),dtype=bool)
+    for i,j in pairs[np.argsort(pairs[:,1],kind='stable')]:
+        if keep[i]: keep[j] = False
+    full = full[keep]
+
+    kpoints_indexes  = kpoints_indexes[full]
+    symmetry_indexes = symmetry_indexes[full]
+    kpoints_full     = rotated[full]
 
     #calculate the weights of each of the kpoints in the irreducible brillouin zone
     nkpoints_full = len(kpoints_full)
     weights = np.zeros([nkpoints_full])
-    for nk in kpoints_full_i:
-        weights[nk] = float(len(kpoints_full_i[nk]))/nkpoints_full
+    weights[:nkpoints] = np.bincount(kpoints_indexes,minlength=nkpoints)/nkpoints_full
 
-    return np.array(weights), np.array(kpoints_indexes), np.array(symmetry_indexes), np.array(kpoints_full)
+    return weights, kpoints_indexes, symmetry_indexes, kpoints_full
 
 def get_path_car(kpts_path_car,path):
     """
@@ -74,7 +95,62 @@ def get_path_car(kpts_path_car,path):
     """
     return Path( [[kpts_path_car[i],path.klabels[i]] for i in range(len(kpts_path_car))],path.intervals )
 
-def get_path(car_kpoints,rlat,sym_car,path,debug=False):
+#results of get_path for the last paths and k-point lists
+_path_cache = {}
+_path_cache_size = 16
+
+def _path_key(*arrays):
+    """
+    Hash of the arrays defining a path projection
+    """
+    sha = hashlib.sha1()
+    for array in arrays:
+        if array is None: 
+            sha.update(b'None')
+            continue
+        array = np.ascontiguousarray(array)
+        sha.update(str((array.shape,array.dtype.str)).encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()
+
+def _project_on_path(car_kpoints,nks,kpts_path_car,rlat):
+    """
+    Find the kpoints (and their periodic images in the neighbouring BZs) lying on each segment of a path
+
+    Returns the kpoints along the path (Cartesian coordinates) and their indexes
+    """
+    #repetitions of the brillouin zone: candidates[r,k] = k + G_r
+    shifts = red_car(np.array([ [x,y,z] for x,y,z in product(range(-1,2),range(-1,2),range(1)) ]),rlat)
+    candidates = (car_kpoints[np.newaxis,:,:]+shifts[:,np.newaxis,:]).reshape(-1,3)
+    indexes = np.tile(nks,len(shifts))
+
+    bands_kpoints = []
+    bands_indexes = []
+    for start_kpt,end_kpt in zip(kpts_path_car[:-1],kpts_path_car[1:]):
+
+        #points between start and end (collinear)
+        on_path = np.where(isbetween(start_kpt,end_kpt,candidates))[0]
+        if len(on_path)==0: continue
+        kpts = candidates[on_path]
+
+        #points with the same coordinates (rounded to 4 decimal places) are counted once:
+        #the last one found is kept, at the position of the first one
+        keys = np.round(kpts,4)+0.
+        _, first, inverse = np.unique(keys,axis=0,return_index=True,return_inverse=True)
+        inverse = inverse.ravel()
+        last = np.zeros(len(first),dtype=int)
+        last[inverse] = np.arange(len(kpts))
+        
+        #sort the points acoording to distance to the start of the path
+        distances = np.linalg.norm(start_kpt-kpts[last],axis=1)
+        order = np.lexsort((first,distances))
+        bands_kpoints.append(kpts[last[order]])
+        bands_indexes.append(indexes[on_path[last[order]]])
+
+    if len(bands_kpoints)==0: return np.zeros([0,3]), np.zeros([0],dtype=int)
+    return np.vstack(bands_kpoints), np.hstack(bands_indexes)
+
+def get_path(car_kpoints,rlat,sym_car,path,debug=False,cache=True):
     """
     Obtain a list kpoints along a specific high-symmetry path
 
@@ -83,63 +159,33 @@ def get_path(car_kpoints,rlat,sym_car,path,debug=False):
     * rlat: reciprocal lattice vectors
     * sym_car [symmetry ops. if car_kpoints given in IBZ] | None [if car_kpoints in fulll BZ]
     * path: Path object with the high-symmetry path (points in reduced coordinates)
+    * cache: reuse the result of a previous call with the same kpoints, lattice and path
 
     Output:
     * bands_kpoints: kpoints Cartesian coordinates along the path
     * bands_indexes: indexes of the kpoints in the path
     * path_car: path in Cartesian coordinates
     """
-
-    # expand if symmetries are provided, otherwise the kpoints are considered already expanded
-    if sym_car is None: nks = list(range(len(car_kpoints)))
-    else:               _, nks, _, car_kpoints = expand_kpoints(car_kpoints,sym_car,rlat)
+    key = _path_key(car_kpoints,rlat,sym_car,path.kpoints)
 
     # high-symmetry points in cartesian coordinates
     kpts_path_car = red_car(path.kpoints, rlat)
     # Path object in cartesian coordinates (for later plotting)
     path_car = get_path_car(kpts_path_car,path)
 
-    #find the points along the high symmetry lines
-    bands_kpoints = []
-    bands_indexes = []
+    if cache and key in _path_cache:
+        bands_kpoints, bands_indexes = _path_cache[key]
+    else:
+        # expand if symmetries are provided, otherwise the kpoints are considered already expanded
+        if sym_car is None: nks = np.arange(len(car_kpoints))
+        else:               _, nks, _, car_kpoints = expand_kpoints(car_kpoints,sym_car,rlat)
 
-    #for all the paths
-    for k in range(len(path.kpoints)-1):
-
-        # store here all the points in the path
-        # key:   has the coordinates of the kpoint rounded to 4 decimal places
-        # value: index of the kpoint
-        #        distance to the starting kpoint
-        #        the kpoint cordinate
-        kpoints_in_path = {}
-
-        start_kpt = kpts_path_car[k]   #start point of the path
-        end_kpt   = kpts_path_car[k+1] #end point of the path
-
-        #generate repetitions of the brillouin zone
-        for x,y,z in product(list(range(-1,2)),list(range(-1,2)),list(range(1))):
-
-            #shift the brillouin zone
-            shift = red_car([np.array([x,y,z])],rlat)[0]
-
-            #iterate over all the kpoints
-            for index, kpt in zip(nks,car_kpoints):
-
-                kpt_shift = kpt+shift #shift the kpoint
-
-                #if the point is collinear we add it
-                if isbetween(start_kpt,end_kpt,kpt_shift):
-                    key = tuple([round(kpt,4) for kpt in kpt_shift])
-                    value = [ index, np.linalg.norm(start_kpt-kpt_shift), kpt_shift ]
-                    kpoints_in_path[key] = value
-
-        #sort the points acoording to distance to the start of the path
-        kpoints_in_path = sorted(list(kpoints_in_path.values()),key=lambda i: i[1])
+        bands_kpoints, bands_indexes = _project_on_path(np.array(car_kpoints),nks,kpts_path_car,rlat)
+        if cache:
+            if len(_path_cache) >= _path_cache_size: _path_cache.pop(next(iter(_path_cache)))
+            _path_cache[key] = (bands_kpoints, bands_indexes)
 
-        #for all the kpoints in the path
-        for index, disp, kpt in kpoints_in_path:
-            bands_kpoints.append( kpt )
-            bands_indexes.append( index )
-            if debug: print(("%12.8lf "*3)%tuple(kpt), index)
+    if debug:
+        for kpt,index in zip(bands_kpoints,bands_indexes): print(("%12.8lf "*3)%tuple(kpt), index)
 
-    return bands_kpoints, bands_indexes, path_car
\ No newline at end of file
+    return bands_kpoints.copy(), bands_indexes.copy(), path_car
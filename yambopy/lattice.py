@@ -40,26 +40,86 @@ def expand_kpts(kpts,syms):
 def vec_in_list(veca,vec_list,atol=1e-6):
     """
     Check if a vector exists in a list of vectors
+
+    If veca is a list of vectors, return an array telling which of them are in vec_list
+    (the search uses a KD-tree of vec_list)
     """
-    return np.array([ np.allclose(veca,vecb,rtol=atol,atol=atol) for vecb in vec_list ]).any()
+    veca = np.asarray(veca)
+    vec_list = np.asarray(vec_list)
+    if len(vec_list)==0: 
+        return False if veca.ndim==1 else np.zeros(len(veca),dtype=bool)
+    vec_list = vec_list.reshape(len(vec_list),-1)
+
+    # same test as np.allclose(veca,vecb,rtol=atol,atol=atol)
+    def close(a,b): return np.all(np.abs(a-b) <= atol+atol*np.abs(b),axis=-1)
 
+    if veca.ndim==1: return bool(close(veca,vec_list).any())
+
+    from scipy.spatial import cKDTree
+    distance, index = cKDTree(vec_list).query(veca,k=1,p=np.inf)
+    return close(veca,vec_list[index])
 
 def isbetween(a,b,c,eps=1e-5):
     """ Check if c is between a and b
+
+    c can be a list of points: an array of booleans is returned
     """
-    return np.isclose(np.linalg.norm(a-c)+np.linalg.norm(b-c)-np.linalg.norm(a-b),0,atol=eps)
+    a, b, c = np.asarray(a), np.asarray(b), np.asarray(c)
+    nrm = lambda v: np.linalg.norm(v,axis=-1)
+    return np.isclose(nrm(a-c)+nrm(b-c)-nrm(a-b),0,atol=eps)
 
 def red_car(red,lat):
     """
     Convert reduced coordinates to cartesian
     """
-    return np.array([coord[0]*lat[0]+coord[1]*lat[1]+coord[2]*lat[2] for coord in red])
+    return np.asarray(red)@np.asarray(lat)
 
 def car_red(car,lat):
     """
     Convert cartesian coordinates to reduced
     """
-    return np.array([np.linalg.solve(np.array(lat).T,coord) for coord in car])
+    car = np.asarray(car)
+    return np.linalg.solve(np.asarray(lat).T,car.reshape(-1,3).T).T.reshape(car.shape)
+
+class GvectorsMap():
+    """
+    Map from the integer reduced coordinates of a list of G-vectors to their indices
+
+    The coordinates of each G-vector are packed in one integer key and the keys are sorted once,
+    so that any number of G-vectors is looked up at once with a binary search.
+
+        red_gvectors -> G-vectors in reduced coordinates [ng,3]
+        tol          -> maximum distance of the reduced coordinates from integers
+    """
+    def __init__(self,red_gvectors,tol=1e-4):
+        red_gvectors = np.asarray(red_gvectors).reshape(-1,3)
+        self.tol  = tol
+        self.nmax = int(np.max(np.abs(np.rint(red_gvectors)))) if len(red_gvectors) else 0
+        keys = self.keys(red_gvectors)
+        self.order = np.argsort(keys,kind='stable')
+        self.sorted_keys = keys[self.order]
+        if np.any(np.diff(self.sorted_keys)==0): raise ValueError('Repeated G-vectors in GvectorsMap')
+
+    def keys(self,red_gvectors):
+        """
+        Integer keys of G-vectors with components in [-nmax,nmax]
+        """
+        n = 2*self.nmax+1
+        g = np.rint(red_gvectors).astype(np.int64)+self.nmax
+        return (g[...,0]*n+g[...,1])*n+g[...,2]
+
+    def __call__(self,red_gvectors):
+        """
+        Indices of the G-vectors red_gvectors [...,3] in the list (-1 if not present)
+        """
+        red_gvectors = np.asarray(red_gvectors,dtype=float)
+        integers = np.rint(red_gvectors)
+        valid = np.all((np.abs(red_gvectors-integers)<=self.tol) & (np.abs(integers)<=self.nmax),axis=-1)
+        if len(self.sorted_keys)==0: return np.full(valid.shape,-1)
+        keys = self.keys(np.where(valid[...,np.newaxis],integers,0))
+        position = np.minimum(np.searchsorted(self.sorted_keys,keys),len(self.sorted_keys)-1)
+        found = valid & (self.sorted_keys[position]==keys)
+        return np.where(found,self.order[position],-1)
 
 def vol_lat(lat):
     """
@@ -2,6 +2,8 @@ import numpy as np
 from netCDF4 import Dataset
 from yambopy.tools.string import marquee
 from yambopy.units import ha2ev
+from yambopy.dbs.fragments import hyperslab
+from yambopy.dbs.elphondb import scale_gkkp
 
 class LetzElphElectronPhononDB():
     """
@@ -14,6 +16,9 @@ class LetzElphElectronPhononDB():
     - Input: path of ndb.elph
     - Input: read_all (default True), read ph. eigenvectors and el-ph matrix elements
     - Input: div_by_energies (default True), divide el-ph mat. el. by sqrt(2* ph. energies)
+    - Input: bands, [b_first,b_last] subset of the bands to be kept (same convention as lph.bands, counting from 1)
+    - Input: modes, kpoints, qpoints, lists of mode, k- and q-point indices to be kept
+      (only the selected slices of elph_mat are read from disk)
 
     - Usage and main variables: 
     
@@ -24,16 +29,17 @@ class LetzElphElectronPhononDB():
       :: lph.ph_energies     #Phonon energies (eV)      
       :: lph.ph_eigenvectors #Phonon modes
       :: lph.gkkp            #El-ph matrix elements (by default normalised with ph. energies):
-      :: lph.gkkp_sq         #Couplings (square)
+      :: lph.gkkp_sq         #Couplings (square, computed when first accessed)
 
-       
+      With subsets, lph.kpoints, lph.qpoints, lph.ph_energies only contain the selected points/modes
+      (lph.k_indices, lph.q_indices, lph.modes give their position in the full database)
    
     Formats:
     - modes[iq][il][iat][ix]
     - gkkp[iq][ik][il][is][ib1][ib2]              
     """
 
-    def __init__(self,filename,read_all=True,div_by_energies=True):
+    def __init__(self,filename,read_all=True,div_by_energies=True,bands=None,modes=None,kpoints=None,qpoints=None):
 
         # Open database
         try: database = Dataset(filename)
@@ -57,6 +63,9 @@ class LetzElphElectronPhononDB():
         self.ph_energies = database.variables['FREQ'][:]*(ha2ev/2.) # Energy units are in Rydberg
         self.check_energies()
 
+        # Subsets
+        self.select(bands,modes,kpoints,qpoints)
+
         if read_all: 
  
             self.read_eigenmodes(database)
@@ -67,6 +76,36 @@ class LetzElphElectronPhononDB():
 
         database.close()
 
+    def select(self,bands=None,modes=None,kpoints=None,qpoints=None):
+        """
+        Restrict bands, modes, k- and q-points to the requested subsets and prepare the
+        corresponding hyperslabs of the netCDF variables
+        """
+        def indices(subset,n,name):
+            if subset is None: return np.arange(n)
+            subset = np.array(subset,dtype=int)
+            if np.any(subset<0) or np.any(subset>=n):
+                raise ValueError("%s indices out of range (%d available)"%(name,n))
+            return subset
+
+        self.q_indices = indices(qpoints,self.nq,'Q-point')
+        self.k_indices = indices(kpoints,self.nk,'K-point')
+        self.modes     = indices(modes,self.nm,'Mode')
+        self.q_slice, self.k_slice, self.mode_slice = [ hyperslab(sub) for sub in (qpoints,kpoints,modes) ]
+        self.nq, self.nk, self.nm = len(self.q_indices), len(self.k_indices), len(self.modes)
+        self.kpoints = self.kpoints[self.k_indices]
+        self.qpoints = self.qpoints[self.q_indices]
+        self.ph_energies = self.ph_energies[self.q_indices][:,self.modes]
+
+        if bands is None:
+            self.band_slice = slice(None)
+        else:
+            if bands[0]<self.bands[0] or bands[1]>self.bands[0]+self.nb2-1 or bands[0]>bands[1]:
+                raise ValueError("Band range %s not contained in database bands %s"%(str(bands),str(self.bands)))
+            self.band_slice = slice(bands[0]-self.bands[0],bands[1]-self.bands[0]+1)
+            self.bands = np.array(bands)
+            self.nb1 = self.nb2 = bands[1]-bands[0]+1
+
     def check_energies(self):
         """
         Inform the user about unexpected negative frequencies and set them to positive
@@ -87,9 +126,8 @@ class LetzElphElectronPhononDB():
         Read phonon eigenmodes
         """
 
-        self.ph_eigenvectors = np.zeros([self.nq,self.nm,self.nat,3],dtype=np.complex64)
         #eivs_tmp[qpt][mode][atom][coord][cmplx]
-        eivs_tmp = database.variables['POLARIZATION_VECTORS'][:]
+        eivs_tmp = database.variables['POLARIZATION_VECTORS'][self.q_slice,self.mode_slice]
         self.ph_eigenvectors = eivs_tmp[:,:,:,:,0] + 1j*eivs_tmp[:,:,:,:,1]
 
     def read_elph(self,database,scale_g_with_ph_energies=True):
@@ -98,8 +136,8 @@ class LetzElphElectronPhononDB():
         
         - If scale_g_with_ph_energies they are divided by sqrt(2*ph_E)
         """    
-        gkkp_full = np.zeros([self.nq,self.nk,self.nm,self.ns,self.nb1,self.nb2],dtype=np.complex64)
-        gkkp_tmp  = database.variables['elph_mat'][:]
+        #gkkp_tmp[qpt][kpt][mode][spin][bnd1][bnd2][cmplx]
+        gkkp_tmp  = database.variables['elph_mat'][self.q_slice,self.k_slice,self.mode_slice,:,self.band_slice,self.band_slice]
         gkkp_full = gkkp_tmp[:,:,:,:,:,:,0]+1j*gkkp_tmp[:,:,:,:,:,:,1]
         
         # Check integrity of elph values
@@ -109,24 +147,41 @@ class LetzElphElectronPhononDB():
         if scale_g_with_ph_energies: gkkp_full = self.scale_g(gkkp_full) 
 
         self.gkkp = gkkp_full
-        self.gkkp_sq = np.abs(gkkp_full)**2. 
+
+    @property
+    def gkkp(self):
+        return self._gkkp
+
+    @gkkp.setter
+    def gkkp(self,gkkp):
+        self._gkkp = gkkp
+        self.reset_couplings()
+
+    @property
+    def gkkp_sq(self):
+        """
+        Couplings |g|^2, computed on first access and again when gkkp is reassigned
+        (call reset_couplings() after changing gkkp in place)
+        """
+        if not hasattr(self,'_gkkp_sq'): self._gkkp_sq = np.abs(self.gkkp)**2.
+        return self._gkkp_sq
+
+    def reset_couplings(self):
+        """
+        Discard |g|^2 so that it is recomputed from the current gkkp
+        """
+        if hasattr(self,'_gkkp_sq'): del self._gkkp_sq
 
     def scale_g(self,dvscf):
         """
-        Normalise matrix elements by the phonon energy as: 
+        Normalise matrix elements by the phonon energy (in place) as: 
        
         g_qnu = dvscf_qnu/sqrt(2*w_qnu)
+
+        The acoustic modes at q=0 are set to zero.
         """
-        
-        g = np.zeros([self.nq,self.nk,self.nm,self.ns,self.nb1,self.nb2],dtype=np.complex64)
-        for iq in range(self.nq):
-            for inu in range(self.nm): 
-                if iq==0 and inu in [0,1,2]: 
-                    g[iq,:,inu,:,:,:] = 0. # Remove acoustic branches
-                else:
-                    ph_E = self.ph_energies[iq,inu]/(ha2ev/2.) # Put back the energies in Rydberg units
-                    g[iq,:,inu,:,:,:] = dvscf[iq,:,inu,:,:,:]/np.sqrt(2.*ph_E)
-        return dvscf
+        acoustic = np.logical_and.outer(self.q_indices==0,self.modes<3)
+        return scale_gkkp(dvscf,self.ph_energies,acoustic=acoustic,energy_unit=ha2ev/2.) # Energy units are in Rydberg
 
     def __str__(self,verbose=False):
 
@@ -144,9 +199,9 @@ class LetzElphElectronPhononDB():
             if hasattr(self, 'ph_eigenvectors'):                 
                 app('-----------------------------------')
                 for iq in range(self.nq):
-                    app('nqpoint %d'%iq)
+                    app('nqpoint %d'%self.q_indices[iq])
                     for n,mode in enumerate(self.ph_eigenvectors[iq]):
-                        app('mode %d freq: %lf meV'%(n,self.ph_energies[iq,n]*1000.))
+                        app('mode %d freq: %lf meV'%(self.modes[n],self.ph_energies[iq,n]*1000.))
                         for a in range(self.nat):
                             app(("%12.8lf "*3)%tuple(mode[a].real))
                     app('-----------------------------------')
@@ -19,6 +19,7 @@ class YamboQPRotate():
     - save_path       -> [OPTIONAL] Location of ns.db1 database (default is inside SAVE)
     - path_output_DBs -> [OPTIONAL] Print expanded databases at location (default: do not print)
     - verbose         -> [OPTIONAL] If True, prints a list of kpoints for QE calculation of nosym system
+    - compression     -> [OPTIONAL] If True, the QP variables of the expanded database are compressed (zlib)
 
     :: Output
     - numpy array with expanded quasiparticle energies
@@ -26,7 +27,7 @@ class YamboQPRotate():
     - [OPTIONAL] data file 'kpoints_bz.dat' containing expanded rlu kpoint coordinates in PW format
 
     """
-    def __init__(self,yqp,save_path="SAVE",db1='ns.db1',path_output_DBs=None,verbose=0):
+    def __init__(self,yqp,save_path="SAVE",db1='ns.db1',path_output_DBs=None,verbose=0,compression=False):
 
         # Quantities to store from QPDB
         self.nkibz, self.nbands = yqp.eigenvalues_qp.shape
@@ -44,6 +45,9 @@ class YamboQPRotate():
 
         self.nstates     = self.nkbz*self.nbands
 
+        # IBZ QP state of each BZ QP state (ordered as k-point,band)
+        self.map_states  = self.get_states_map()
+
         print("=== Rotating ndb.QP... ===")
 
         print(" * QP kpts and table... ")
@@ -65,7 +69,7 @@ class YamboQPRotate():
         if path_output_DBs is not None:
             print(" * Saving databases... ")
             self.outpath = path_output_DBs
-            self.saveDBS()
+            self.saveDBS(compression=compression)
         else: print(" [!] Enter value for path_output_DBs to print expanded ndb.QP")
 
         # Print kpts for PW nosym run
@@ -73,44 +77,43 @@ class YamboQPRotate():
 
         print("===      Done.       ===")
 
+    def get_states_map(self):
+        """
+        Index of the IBZ QP state corresponding to each BZ QP state:
+        state ib+ikbz*nbands in the BZ is state ib+map_bz2ibz[ikbz]*nbands in the IBZ
+        """
+        map_bz2ibz = np.array(self.map_bz2ibz)
+        return (map_bz2ibz[:,np.newaxis]*self.nbands+np.arange(self.nbands)[np.newaxis,:]).ravel()
+
     def expand_QP(self,values_ibz):
         """
         Expand a QP quantity
         """
-
-        values_bz = np.zeros((self.nkbz*self.nbands),dtype=values_ibz.dtype)
-        for ib in range(self.nbands):
-            for ikbz in range(self.nkbz): 
-                bz_index  = ib+ikbz*self.nbands
-                ibz_index = ib+self.map_bz2ibz[ikbz]*self.nbands
-                values_bz[bz_index]= values_ibz[ibz_index]
-
-        return values_bz
+        return np.asarray(values_ibz)[self.map_states]
 
     def expand_QPtable(self,table):
         """
         QP table works like this:
         table[0][i_QP]=i_band1
         table[1][i_QP]=i_band2 (= i_band1 since SE is diagonal)
-        table[2][i_QP]=i_kpt
+        table[2][i_QP]=i_kpt (starting from 1)
         """
         table_b1  = self.expand_QP(table[0])
         table_b2  = self.expand_QP(table[1])
-        table_kpt = np.zeros(self.nstates)
-
-        for ib in range(self.nbands):
-            for ikbz in range(self.nkbz):
-                bz_index  = ib+ikbz*self.nbands
-                table_kpt[bz_index]=ikbz
+        table_kpt = np.repeat(np.arange(1,self.nkbz+1),self.nbands)
 
-        table_bz = np.array([table_b1,table_b2,table_kpt])
+        table_bz = np.array([table_b1,table_b2,table_kpt],dtype=float)
 
         return table_bz
 
-    def saveDBS(self):
+    def saveDBS(self,compression=False,complevel=4,chunk_states=None):
         """
         Write yambo-compatible ndb.QP databases containing the expanded quasiparticles.
 
+        Each variable is written with a single hyperslab, without prefilling the file.
+        The variables running over the QP states can be compressed (compression, complevel)
+        and stored in chunks of chunk_states states.
+
         WARNING:
             There are many quirks and special rules and version-dependent ifs in the yambo IO 
             of ndb.QP.
@@ -174,6 +177,7 @@ class YamboQPRotate():
 
         # New database
         dbs = Dataset(path+'/ndb.QP',mode='w',format='NETCDF4')
+        dbs.set_fill_off()
 
         # Old database
         dbs_ibz = Dataset(self.qp_path+'/ndb.QP')
@@ -215,14 +219,26 @@ class YamboQPRotate():
         QP_E = np.stack((self.E.real, self.E.imag),axis=1)
         QP_Z = np.stack((self.Z.real, self.Z.imag),axis=1)
 
+        # Compression and chunking of the expanded variables
+        qp_dim = 'D_%.10d'%self.nstates
+        def options(dims):
+            opts = {}
+            if compression: opts.update(zlib=True,complevel=complevel)
+            if chunk_states is not None and qp_dim in dims:
+                opts['chunksizes'] = [ min(chunk_states,self.nstates) if d==qp_dim else dbs.dimensions[d].size for d in dims ]
+            return opts
+
         # Create variables
         for var in ibz_vars:
-            if var.name=='QP_table': dbs.createVariable('QP_table',netcdftype(var.dtype), ('D_%.10d'%3, 'D_%.10d'%self.nstates))
-            elif var.name=='QP_kpts': dbs.createVariable('QP_kpts',netcdftype(var.dtype), ('D_%.10d'%3, 'D_%.10d'%self.nkbz))
-            elif var.name=='QP_E': dbs.createVariable('QP_E',netcdftype(var.dtype), ('D_%.10d'%self.nstates, 'D_%.10d'%2))
-            elif var.name=='QP_Eo': dbs.createVariable('QP_Eo',netcdftype(var.dtype), ('D_%.10d'%self.nstates))
-            elif var.name=='QP_Z': dbs.createVariable('QP_Z',netcdftype(var.dtype), ('D_%.10d'%self.nstates, 'D_%.10d'%2))
-            else: dbs.createVariable(var.name, var.dtype, var.dimensions)
+            if var.name=='QP_table': dims = ('D_%.10d'%3, qp_dim)
+            elif var.name=='QP_kpts': dims = ('D_%.10d'%3, 'D_%.10d'%self.nkbz)
+            elif var.name=='QP_E': dims = (qp_dim, 'D_%.10d'%2)
+            elif var.name=='QP_Eo': dims = (qp_dim,)
+            elif var.name=='QP_Z': dims = (qp_dim, 'D_%.10d'%2)
+            else:
+                dbs.createVariable(var.name, var.dtype, var.dimensions)
+                continue
+            dbs.createVariable(var.name,netcdftype(var.dtype),dims,**options(dims))
 
         # Store values in new DB, including new qpt coords in iku
         for var in ibz_vars:
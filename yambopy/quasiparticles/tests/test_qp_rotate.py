@@ -0,0 +1,127 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.qpdb import YamboQPDB
+from yambopy.quasiparticles.QP_rotate import YamboQPRotate
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','bse')
+
+def write_qp_db(filename,nkibz,nbands,kpoints=None):
+    """
+    Small ndb.QP in the IBZ with the dimensions of the recent yambo versions
+    (kpoints: IBZ k-points in iku, random by default)
+    """
+    nqp = nkibz*nbands
+    rng = np.random.default_rng(0)
+    with Dataset(filename,'w') as database:
+        for dim,size in [('D_0000000001',1),('D_0000000003',3),('D_0000000002',2),('D_0000000100',100),
+                         ('D_0000000006',6),('QP_desc_size',24),('QP_string_len',100),
+                         ('D_%010d'%nqp,nqp),('D_%010d'%nkibz,nkibz)]:
+            database.createDimension(dim,size)
+        database.createVariable('PARS','f8',('D_0000000006',))[:] = [nbands,nkibz,nqp,0,0,24]
+        database.createVariable('QP_GW_solver','S1',('D_0000000100',))[:] = np.array(list('Newton'.ljust(100)),dtype='S1')
+        database.createVariable('QP_table','f4',('D_0000000003','D_%010d'%nqp))[:] = [np.tile(np.arange(1,nbands+1),nkibz),
+                                                                                         np.tile(np.arange(1,nbands+1),nkibz),
+                                                                                         np.repeat(np.arange(1,nkibz+1),nbands)]
+        database.createVariable('QP_kpts','f4',('D_0000000003','D_%010d'%nkibz))[:] = (rng.random((3,nkibz)) if kpoints is None else np.array(kpoints).T)
+        database.createVariable('QP_E','f4',('D_%010d'%nqp,'D_0000000002'))[:] = rng.random((nqp,2))
+        database.createVariable('QP_Eo','f4',('D_%010d'%nqp,))[:] = rng.random(nqp)
+        database.createVariable('QP_Z','f4',('D_%010d'%nqp,'D_0000000002'))[:] = rng.random((nqp,2))
+        database.createVariable('QP_QP_@_state_1_K_range','f4',('D_0000000002',))[:] = [1,nkibz]
+
+def qp_rotation(nkibz=4,nbands=3,nkbz=10):
+    """
+    YamboQPRotate with random IBZ quasiparticles (built without the databases)
+    """
+    rng = np.random.default_rng(1)
+    yrot = YamboQPRotate.__new__(YamboQPRotate)
+    yrot.nkibz, yrot.nbands, yrot.nkbz = nkibz, nbands, nkbz
+    yrot.nstates    = nkbz*nbands
+    yrot.map_bz2ibz = np.concatenate([np.arange(nkibz),rng.integers(nkibz,size=nkbz-nkibz)])
+    yrot.iku_kpoints = rng.random((nkbz,3))
+    yrot.map_states = yrot.get_states_map()
+    return yrot
+
+class TestYamboQPRotate(unittest.TestCase):
+
+    def test_expand_QP(self):
+
+        yrot = qp_rotation()
+        rng = np.random.default_rng(2)
+        values_ibz = rng.random(yrot.nkibz*yrot.nbands)+1j*rng.random(yrot.nkibz*yrot.nbands)
+        table_ibz = np.array([np.tile(np.arange(1,yrot.nbands+1),yrot.nkibz)]*2)
+
+        #reference from the loop over BZ k-points and bands
+        values_ref = np.zeros(yrot.nstates,dtype=complex)
+        table_ref = np.zeros((3,yrot.nstates))
+        for ikbz in range(yrot.nkbz):
+            for ib in range(yrot.nbands):
+                values_ref[ib+ikbz*yrot.nbands] = values_ibz[ib+yrot.map_bz2ibz[ikbz]*yrot.nbands]
+                table_ref[:,ib+ikbz*yrot.nbands] = [ib+1,ib+1,ikbz+1]
+
+        np.testing.assert_array_equal(yrot.expand_QP(values_ibz),values_ref)
+        np.testing.assert_array_equal(yrot.expand_QPtable(table_ibz),table_ref)
+
+    def test_saveDBS(self):
+
+        yrot = qp_rotation()
+        with tempfile.TemporaryDirectory() as folder:
+            yrot.qp_path = folder
+            write_qp_db(os.path.join(folder,'ndb.QP'),yrot.nkibz,yrot.nbands)
+            with Dataset(os.path.join(folder,'ndb.QP')) as database:
+                E_ibz = database['QP_E'][:]
+                yrot.qp_table = yrot.expand_QPtable(database['QP_table'][:])
+                yrot.Eo = yrot.expand_QP(database['QP_Eo'][:])
+                yrot.E  = yrot.expand_QP(E_ibz[:,0]+1j*E_ibz[:,1])
+                yrot.Z  = yrot.expand_QP(database['QP_Z'][:,0]+1j*database['QP_Z'][:,1])
+
+            for compression,chunk_states in [(False,None),(True,7)]:
+                yrot.outpath = os.path.join(folder,'Expanded')
+                yrot.saveDBS(compression=compression,chunk_states=chunk_states)
+                with Dataset(os.path.join(yrot.outpath,'ndb.QP')) as database:
+                    np.testing.assert_array_equal(database['PARS'][:],[yrot.nbands,yrot.nkbz,yrot.nstates,0,0,24])
+                    np.testing.assert_array_equal(database['QP_table'][:],yrot.qp_table)
+                    np.testing.assert_array_equal(database['QP_E'][:],E_ibz[yrot.map_states])
+                    np.testing.assert_array_equal(database['QP_Eo'][:],yrot.Eo)
+                    np.testing.assert_array_equal(database['QP_QP_@_state_1_K_range'][:],[1,yrot.nkbz])
+                    np.testing.assert_array_equal(database['QP_GW_solver'][:6],np.array(list('Newton'),dtype='S1'))
+                    filters = database['QP_E'].filters()
+                    self.assertEqual(filters['zlib'],compression)
+                    if chunk_states: self.assertEqual(database['QP_E'].chunking(),[chunk_states,2])
+
+    def test_from_dbs(self):
+
+        lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'SAVE','ns.db1'))
+        nbands = 2
+        with tempfile.TemporaryDirectory() as folder:
+            write_qp_db(os.path.join(folder,'ndb.QP'),lat.ibz_nkpoints,nbands,kpoints=lat.ibz_kpoints)
+            yqp = YamboQPDB.from_db(folder=folder)
+            outpath = os.path.join(folder,'Expanded')
+            yrot = YamboQPRotate(yqp,save_path=os.path.join(test_path,'SAVE'),path_output_DBs=outpath,compression=True)
+
+            #map of the QP states from the lattice, reference from the loop over BZ k-points and bands
+            self.assertEqual((yrot.nkibz,yrot.nkbz,yrot.nbands),(lat.ibz_nkpoints,lat.nkpoints,nbands))
+            map_states = [ ib+lat.kpoints_indexes[ikbz]*nbands for ikbz in range(lat.nkpoints) for ib in range(nbands) ]
+            np.testing.assert_array_equal(yrot.map_states,map_states)
+            np.testing.assert_array_equal(yrot.E,yqp.qps['E'][map_states])
+            np.testing.assert_array_equal(yrot.qp_table[2],np.repeat(np.arange(1,lat.nkpoints+1),nbands))
+
+            #the expanded database is written compressed
+            with Dataset(os.path.join(outpath,'ndb.QP')) as database:
+                for var in ['QP_table','QP_E','QP_Eo','QP_Z']:
+                    self.assertTrue(database[var].filters()['zlib'])
+                np.testing.assert_array_equal(database['QP_E'][:,0],yrot.E.real.astype(np.float32))
+                np.testing.assert_array_equal(database['QP_kpts'][:].T,yrot.iku_kpoints.astype(np.float32))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,40 @@ def fermi(e,max_exp=50,min_exp=-100):
 def fermi_array(e_array,ef,invsmear):
     """
     Fermi dirac function for an array
+
+    Written as (1-tanh(x/2))/2, which does not overflow for any x=(e-ef)/invsmear
+    """
+    e_array = (np.asarray(e_array)-ef)/invsmear
+    return 0.5*(1.-np.tanh(0.5*e_array))
+
+def smeared_occupations(e_array,ef,smear,smearing='fermi-dirac',order=1):
+    """
+    Occupations (between 0 and 1) of the energies e_array (any shape) for the Fermi level ef
+
+        smear    -> smearing width (same units as e_array)
+        smearing -> 'fermi-dirac', 'gaussian' or 'methfessel-paxton'
+        order    -> order of the Methfessel-Paxton expansion
+                    (the occupations can be slightly outside [0,1] in this case)
     """
-    e_array = (e_array-ef)/invsmear
-    return [ fermi(e) for e in e_array]
+    from scipy.special import erfc
+    x = (ef-np.asarray(e_array))/smear
+
+    if smearing=='fermi-dirac': return 0.5*(1.+np.tanh(0.5*x))
+
+    occupations = 0.5*erfc(-x)
+    if smearing=='gaussian': return occupations
+    if smearing!='methfessel-paxton': raise ValueError("Unknown smearing %s"%smearing)
+
+    #Hermite polynomials H_{2n-1}(x) times exp(-x^2) with the recursion of Methfessel and Paxton
+    hp = np.exp(-np.minimum(x**2,200.))
+    hd = np.zeros_like(hp)
+    a  = 1./np.sqrt(np.pi)
+    ni = 0
+    for i in range(1,order+1):
+        hd  = 2.*x*hp-2.*ni*hd
+        ni += 1
+        a   = -a/(i*4.)
+        occupations -= a*hd
+        hp  = 2.*x*hd-2.*ni*hp
+        ni += 1
+    return occupations
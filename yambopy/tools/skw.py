@@ -9,13 +9,14 @@
 Shankland-Koelling-Wood Fourier interpolation scheme.
 For the theoretical background see :cite:`Euwema1969,Koelling1986,Pickett1988,Madsen2006`.
 """
-import itertools
+import os
+import hashlib
 import numpy as np
-import scipy
+import scipy.linalg
 import time
-from collections import deque
 from monty.termcolor import cprint
 from monty.collections import dict2namedtuple
+from yambopy.units import ha2ev
 
 class SkwInterpolator():
     """
@@ -26,6 +27,14 @@ class SkwInterpolator():
     the names of the variables are chosen assuming we are interpolating electronic eigenvalues
     but the same object can be used to interpolate other quantities. Just set the first dimension to 1.
     """
+    # Maximum size (bytes) of the temporary [nk, nsym, nr] phase array used by get_stark_many
+    stark_memory = 2**27
+
+    # Format of the files written by save(). Files with a different version are not read.
+    file_version = 1
+    _file_arrays = ("rpts", "coefs", "ptg_symrel", "ptg_symrec", "rmet")
+    _file_scalars = ("lpratio", "nsppol", "nkpt", "nband", "nr", "ptg_nsym", "has_timrev", "iscomplexobj",
+                     "original_fermie", "interpolated_fermie", "nelect", "mae", "rcut", "rsigma")
 
     def __init__(self, lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev,
                  filter_params=None, verbose=1):
@@ -106,56 +115,39 @@ class SkwInterpolator():
 
         # Construct star functions for the ab-initio k-points.
         nsppol, nband, nkpt, nr = self.nsppol, self.nband, self.nkpt, self.nr
-        self.skr = np.empty((nkpt, nr), dtype=complex)
-        for ik, kpt in enumerate(kpts):
-            self.skr[ik] = self.get_stark(kpt)
-
-        # Build H(k,k') matrix (Hermitian)
-        hmat = np.empty((nkpt-1, nkpt-1), dtype=complex)
-        for jk in range(nkpt-1):
-            v_jkr = self.skr[jk, 1:] - self.skr[nkpt-1, 1:]
-            #for ik in range(jk + 1):
-            for ik in range(nkpt-1):
-                v_ikr = inv_rhor[1:] * (self.skr[ik, 1:] - self.skr[nkpt-1, 1:])
-                hmat[ik, jk] = np.vdot(v_jkr, v_ikr)
-                if ik == jk: hmat[ik, jk] = hmat[ik, jk].real
+        self.skr = self.get_stark_many(kpts)
+
+        # Build H(k,k') matrix (Hermitian) as a weighted Gram matrix:
+        # H = D W D^H with D[k, r] = S_k(R) - S_nkpt(R) and W = diag(1/rho(R)), R != 0
+        dskr = self.skr[:nkpt-1, 1:] - self.skr[nkpt-1, 1:]
+        hmat = np.matmul(dskr * inv_rhor[1:], dskr.conj().T)
+        hmat[np.diag_indices(nkpt-1)] = hmat.diagonal().real
 
         # Solving system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)..."
-        de_kbs = np.empty((nkpt-1, nband, nsppol), dtype=complex)
-        for spin in range(nsppol):
-            for ib in range(nband):
-                de_kbs[:, ib, spin] = eigens[spin, 0:nkpt-1, ib] - eigens[spin, nkpt-1, ib]
-
-        # Solve all bands and spins at once
-        # FIXME: Portability problem with scipy 0.19 in which linalg.solve wraps the expert drivers
-        # http://scipy.github.io/devdocs/release.0.19.0.html#foreign-function-interface-improvements
-        if scipy.__version__ == "0.19.0":
-            import warnings
-            warnings.warn("linalg.solve in scipy 0.19.0 gives weird results. Use at your own risk!!!")
+        # de_kbs[k, band, spin]
+        de_kbs = np.transpose(eigens[:, 0:nkpt-1, :] - eigens[:, nkpt-1:nkpt, :], (1, 2, 0)).astype(complex)
 
+        # Solve all bands and spins at once. H is Hermitian positive-definite: use Cholesky.
         try:
-            lmb_kbs = scipy.linalg.solve(hmat, np.reshape(de_kbs, (-1, nband * nsppol)))
-            #lmb_kbs = scipy.linalg.solve(hmat, np.reshape(de_kbs, (-1, nband * nsppol)),
-                    #sym_pos=True, lower=False, overwrite_a=True, overwrite_b=True, check_finite=False)
-                    #sym_pos=False, lower=False, overwrite_a=False, overwrite_b=False, check_finite=True)
+            lmb_kbs = scipy.linalg.cho_solve(scipy.linalg.cho_factor(hmat, lower=False, check_finite=False),
+                                             np.reshape(de_kbs, (-1, nband * nsppol)), check_finite=False)
+
+        except scipy.linalg.LinAlgError:
+            # Not numerically positive-definite: fall back to the general solver
+            try:
+                lmb_kbs = scipy.linalg.solve(hmat, np.reshape(de_kbs, (-1, nband * nsppol)))
 
-        except scipy.linalg.LinAlgError as exc:
-            print("Cannot solve system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)")
-            print("This usually happens when there are symmetrical k-points passed to the interpolator.")
-            raise exc
+            except scipy.linalg.LinAlgError as exc:
+                print("Cannot solve system of linear equations to get lambda coeffients (eq. 10 of PRB 38 2721)")
+                print("This usually happens when there are symmetrical k-points passed to the interpolator.")
+                raise exc
 
         lmb_kbs = np.reshape(lmb_kbs, (-1, nband, nsppol))
 
-        # Compute coefficients.
+        # Compute coefficients: [NSPPOL, NB, NK-1] x [NK-1, NR-1]
         self.coefs = np.empty((nsppol, nband, nr), dtype=complex)
-        for spin in range(nsppol):
-            for ib in range(nband):
-                for ir in range(1, nr):
-                    self.coefs[spin, ib, ir] = inv_rhor[ir] \
-                        * np.vdot(self.skr[:nkpt-1, ir] - self.skr[nkpt-1, ir], lmb_kbs[:nkpt-1, ib, spin])
-
-                self.coefs[spin, ib, 0] = eigens[spin, nkpt-1, ib] \
-                    - np.dot(self.coefs[spin, ib, 1:nr], self.skr[nkpt-1, 1:nr])
+        self.coefs[:, :, 1:] = inv_rhor[1:] * np.matmul(np.transpose(lmb_kbs, (2, 1, 0)), dskr.conj())
+        self.coefs[:, :, 0] = eigens[:, nkpt-1, :] - np.matmul(self.coefs[:, :, 1:], self.skr[nkpt-1, 1:])
 
         # Filter high-frequency.
         self.rcut, self.rsigma = None, None
@@ -165,8 +157,7 @@ class SkwInterpolator():
             if self.verbose:
                 print("Applying filter (Eq 9 of PhysRevB.61.1639) with rcut:", self.rcut, ", rsigma", self.rsigma)
             from scipy.special import erfc
-            for ir in range(1, nr):
-                self.coefs[:, :, ir] *= 0.5 * erfc((np.sqrt(r2vals[ir]) - self.rcut) / self.rsigma)
+            self.coefs[:, :, 1:] *= 0.5 * erfc((np.sqrt(r2vals[1:]) - self.rcut) / self.rsigma)
 
         # Prepare workspace arrays for star functions.
         self.cached_kpt = np.ones(3) * np.inf
@@ -174,16 +165,16 @@ class SkwInterpolator():
         self.cached_kpt_dk2 = np.ones(3) * np.inf
 
         # Compare ab-initio data with interpolated results.
-        mae = 0.0
-        for spin in range(nsppol):
-            for ik, kpt in enumerate(kpts):
-                skw_eb = self.eval_sk(spin, kpt)
-                mae += np.abs(eigens[spin, ik] - skw_eb).sum()
-                if self.verbose >= 10:
-                    # print interpolated eigenvales
+        skw_eigens = np.matmul(self.skr, self.coefs.transpose(0, 2, 1))
+        if not self.iscomplexobj: skw_eigens = skw_eigens.real
+        mae = np.abs(eigens - skw_eigens).sum()
+        if self.verbose >= 10:
+            # print interpolated eigenvales
+            for spin in range(nsppol):
+                for ik in range(nkpt):
                     for band in range(self.nband):
                         e0 = eigens[spin, ik, band]
-                        eskw = skw_eb[band]
+                        eskw = skw_eigens[spin, ik, band]
                         print("spin", spin, "band", band, "ikpt", ik, "e0", e0, "eskw", eskw, "diff", e0 - eskw)
 
         mae *= 1e3 / (nsppol * nkpt * nband)
@@ -199,6 +190,57 @@ class SkwInterpolator():
 
         self.mae = mae
 
+    def save(self, filename, input_hash="") -> None:
+        """
+        Write the fitted model (star points, coefficients and symmetries) to a compressed .npz file.
+        The star functions of the ab-initio k-points (self.skr) are not saved.
+
+        Args:
+            filename: Name of the file. The file is first written with a temporary name and then renamed,
+                so that a partially written file is never read.
+            input_hash: Hash of the input data (see skw_input_hash) stored with the model.
+        """
+        data = {name: getattr(self, name) for name in self._file_arrays}
+        for name in self._file_scalars:
+            value = getattr(self, name)
+            data[name] = np.array(np.nan if value is None else value)
+        lattice, positions, numbers = self.cell
+        data.update(lattice=lattice, positions=positions, numbers=numbers,
+                    version=self.file_version, input_hash=input_hash)
+
+        tmp_filename = "%s.tmp%d" % (filename, os.getpid())
+        with open(tmp_filename, "wb") as fh:
+            np.savez_compressed(fh, **data)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def from_file(cls, filename, verbose=1):
+        """
+        Read a model written by save(). The object can be used to interpolate as if it was fitted again.
+
+        Args:
+            filename: Name of the .npz file.
+            verbose: Verbosity level.
+        """
+        new = cls.__new__(cls)
+        new.verbose = verbose
+        with np.load(filename) as data:
+            if int(data["version"]) != cls.file_version:
+                raise ValueError("%s has version %s, expected %s" % (filename, data["version"], cls.file_version))
+            for name in cls._file_arrays:
+                setattr(new, name, data[name])
+            for name in cls._file_scalars:
+                setattr(new, name, data[name].item())
+            new.cell = (data["lattice"], data["positions"], data["numbers"])
+            new.input_hash = str(data["input_hash"])
+
+        if np.isnan(new.rcut): new.rcut, new.rsigma = None, None
+        new.cached_kpt = np.ones(3) * np.inf
+        new.cached_kpt_dk1 = np.ones(3) * np.inf
+        new.cached_kpt_dk2 = np.ones(3) * np.inf
+
+        return new
+
     def __str__(self):
         return self.to_string()
 
@@ -233,28 +275,96 @@ class SkwInterpolator():
             hessian in dedk2[self.nsppol, len(kfrac_coords), self.nband, 3, 3))
 
             gradient and hessian are set to None if not computed.
+            Derivatives are taken wrt k in reduced coordinates.
         """
         start = time.time()
 
         kfrac_coords = np.reshape(kfrac_coords, (-1, 3))
         new_nkpt = len(kfrac_coords)
-        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband))
-
-        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3))
-        dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3))
+        order = 2 if dk2 else 1 if dk1 else 0
+        dtype = complex if self.iscomplexobj else float
+
+        new_eigens = np.empty((self.nsppol, new_nkpt, self.nband), dtype=dtype)
+        dedk = None if not dk1 else np.empty((self.nsppol, new_nkpt, self.nband, 3), dtype=dtype)
+        dedk2 = None if not dk2 else np.empty((self.nsppol, new_nkpt, self.nband, 3, 3), dtype=dtype)
+
+        # [NSPPOL, NK, NR] x [NSPPOL, NR, NB] (one matrix product per chunk of k-points)
+        coefs_t = self.coefs.transpose(0, 2, 1)
+        for ks in self._kpoint_chunks(new_nkpt, ncomp=(0, 4, 13)[order]):
+            if order == 0:
+                new_eigens[:, ks] = self._fix_dtype(np.matmul(self.get_stark_many(kfrac_coords[ks]), coefs_t))
+                continue
 
-        der1, der2 = None, None
-        for spin in range(self.nsppol):
-            for ik, newk in enumerate(kfrac_coords):
-                if dk1: der1 = dedk[spin, ik]
-                if dk2: der2 = dedk2[spin, ik]
-                new_eigens[spin, ik] = self.eval_sk(spin, newk, der1=der1, der2=der2)
+            skr, skr_dk1, skr_dk2 = self.get_stark_derivs(kfrac_coords[ks], order=order)
+            nk = len(skr)
+            new_eigens[:, ks] = self._fix_dtype(np.matmul(skr, coefs_t))
+            if dk1:
+                # [NK*3, NR] x [NSPPOL, NR, NB] -> [NSPPOL, NK, NB, 3]
+                values = np.matmul(np.reshape(skr_dk1, (nk * 3, self.nr)), coefs_t)
+                dedk[:, ks] = self._fix_dtype(np.reshape(values, (self.nsppol, nk, 3, self.nband)).transpose(0, 1, 3, 2))
+            if dk2:
+                values = np.matmul(np.reshape(skr_dk2, (nk * 9, self.nr)), coefs_t)
+                dedk2[:, ks] = self._fix_dtype(np.reshape(values, (self.nsppol, nk, 3, 3, self.nband)).transpose(0, 1, 4, 2, 3))
 
         if self.verbose:
             print("Interpolation completed in %.3f (s)" % (time.time() - start))
 
         return dict2namedtuple(eigens=new_eigens, dedk=dedk, dedk2=dedk2)
 
+    def get_velocities_masses(self, kfrac_coords, energy_unit=ha2ev):
+        """
+        Band velocities and effective-mass tensors from the analytic derivatives of the interpolant.
+        The lattice vectors of self.cell are assumed in bohr.
+
+        Args:
+            kfrac_coords: K-points in reduced coordinates.
+            energy_unit: Energy unit of the interpolated data in Hartree (ha2ev for eV, 1 for Hartree).
+
+        Return:
+            namedtuple with:
+            interpolated energies in eigens[nsppol, nk, nband]
+            cartesian band velocities dE/dk (atomic units) in velocities[nsppol, nk, nband, 3]
+            inverse effective-mass tensors d2E/dk2 (1/m_e) in inverse_masses[nsppol, nk, nband, 3, 3]
+            effective-mass tensors (m_e) in masses[nsppol, nk, nband, 3, 3]. They are the pseudo-inverse of
+            inverse_masses: directions without curvature (e.g. out of plane in 2D systems) are not meaningful.
+        """
+        if self.iscomplexobj:
+            raise ValueError("Velocities and effective masses require real interpolated data")
+
+        res = self.interp_kpts(kfrac_coords, dk1=True, dk2=True)
+
+        # k_red = k_car A^T / (2 pi) with the lattice vectors A along the rows
+        red_car = np.asarray(self.cell[0], dtype=float) / (2.0 * np.pi)
+        velocities = np.matmul(res.dedk, red_car) / energy_unit
+        inverse_masses = np.matmul(red_car.T, np.matmul(res.dedk2, red_car)) / energy_unit
+        masses = np.linalg.pinv(inverse_masses, hermitian=True)
+
+        return dict2namedtuple(eigens=res.eigens, velocities=velocities,
+                               inverse_masses=inverse_masses, masses=masses)
+
+    def interp_grid(self, ngkpt, shift=(0, 0, 0), energy_unit=ha2ev):
+        """
+        Energies, band velocities and effective-mass tensors of all bands on a regular k-point grid.
+
+        Args:
+            ngkpt: Number of divisions of the grid along the three reciprocal lattice vectors.
+            shift: Shift of the grid in units of the grid spacing.
+            energy_unit: Energy unit of the interpolated data in Hartree (ha2ev for eV, 1 for Hartree).
+
+        Return:
+            namedtuple of get_velocities_masses with also the [nk, 3] grid k-points in kpts (reduced coordinates).
+        """
+        axes = [(np.arange(n) + s) / n for n, s in zip(ngkpt, shift)]
+        kpts = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+        res = self.get_velocities_masses(kpts, energy_unit=energy_unit)
+
+        return dict2namedtuple(kpts=kpts, eigens=res.eigens, velocities=res.velocities,
+                               inverse_masses=res.inverse_masses, masses=res.masses)
+
+    def _fix_dtype(self, values):
+        """Drop the imaginary part of interpolated values if the input data are real."""
+        return values if self.iscomplexobj else values.real
+
     def interp_kpts_and_enforce_degs(self, kfrac_coords, ref_eigens, atol=1e-4):
         """
         Interpolate energies on an arbitrary set of k-points. Use `ref_eigens`
@@ -290,25 +400,20 @@ class SkwInterpolator():
         Return:
             oeigs[nband]
         """
-        # [NB, NR] x [NR]
-        oeigs = np.matmul(self.coefs[spin], self.get_stark(kpt))
-        if not self.iscomplexobj: oeigs = oeigs.real
+        if der1 is None and der2 is None:
+            # [NB, NR] x [NR]
+            return self._fix_dtype(np.matmul(self.coefs[spin], self.get_stark(kpt)))
+
+        skr, skr_dk1, skr_dk2 = self.get_stark_derivs(kpt, order=1 if der2 is None else 2)
+        oeigs = self._fix_dtype(np.matmul(self.coefs[spin], skr[0]))
 
         if der1 is not None:
-            skr_dk1 = self.get_stark_dk1(kpt)
-            for ii in range(3):
-                value = np.matmul(self.coefs[spin, :, :], skr_dk1[ii])
-                if not self.iscomplexobj: value = value.real
-                der1[:, ii] = value
+            # [NB, NR] x [NR, 3]
+            der1[:] = self._fix_dtype(np.matmul(self.coefs[spin], skr_dk1[0].T))
 
         if der2 is not None:
-            skr_dk2 = self.get_stark_dk2(kpt)
-            for jj in range(3):
-                for ii in range(jj + 1):
-                    value = np.matmul(self.coefs[spin, :, :], skr_dk2[ii,jj])
-                    if not self.iscomplexobj: value = value.real
-                    der2[:, ii, jj] = value
-                    if ii != jj: der2[jj, ii] = der2[ii, jj]
+            # [NB, NR] x [NR, 9]
+            der2[:] = self._fix_dtype(np.matmul(self.coefs[spin], np.reshape(skr_dk2[0], (9, self.nr)).T)).reshape(-1, 3, 3)
 
         return oeigs
 
@@ -367,16 +472,89 @@ class SkwInterpolator():
         Return:
             complex array of shape [self.nr]
         """
-        two_pi = 2.0 * np.pi
-        skr = np.zeros(self.nr, dtype=complex)
-        _np_exp = np.exp
-        for omat in self.ptg_symrel:
-            sk = two_pi * np.matmul(omat.T, kpt)
-            skr += _np_exp(1.j * np.matmul(self.rpts, sk))
+        return self.get_stark_many(np.reshape(kpt, (1, 3)))[0]
+
+    @property
+    def sym_rpts(self) -> np.ndarray:
+        """
+        Rotated star points S R for all the point-group operations: int array [ptg_nsym, nr, 3]
+        """
+        if not hasattr(self, "_sym_rpts") or len(self._sym_rpts[0]) != len(self.rpts):
+            self._sym_rpts = np.matmul(self.rpts, self.ptg_symrel.transpose(0, 2, 1))
+        return self._sym_rpts
+
+    def _kpoint_chunks(self, nkpt, chunk_size=None, ncomp=0):
+        """
+        Slices of at most chunk_size k-points. The default size keeps the
+        [nk, nsym + ncomp, nr] temporary arrays of get_stark_many and get_stark_derivs
+        below self.stark_memory bytes.
+        """
+        if chunk_size is None:
+            chunk_size = max(1, int(self.stark_memory // (16 * (self.ptg_nsym + ncomp) * self.nr)))
+        return [slice(ks, min(ks + chunk_size, nkpt)) for ks in range(0, nkpt, chunk_size)]
+
+    def get_stark_many(self, kpts, chunk_size=None) -> np.ndarray:
+        """
+        Return the star functions for a list of k-points.
+
+        Since (S^T k).R = k.(S R), all the point-group operations are applied at once
+        with one exponential for each chunk of k-points.
+
+        Args:
+            kpts: [nk, 3] K-points in reduced coordinates.
+            chunk_size: Number of k-points processed at once (default: from self.stark_memory).
+
+        Return:
+            complex array of shape [nk, self.nr]
+        """
+        kpts = np.reshape(np.asarray(kpts, dtype=float), (-1, 3))
+        sym_rpts = self.sym_rpts
+        skr = np.empty((len(kpts), self.nr), dtype=complex)
+        for ks in self._kpoint_chunks(len(kpts), chunk_size):
+            # [NK, 3] x [NSYM, 3, NR] -> [NSYM, NK, NR]
+            phases = np.matmul(2.0 * np.pi * kpts[ks], sym_rpts.transpose(0, 2, 1))
+            skr[ks] = np.exp(1.j * phases).sum(axis=0)
         skr /= self.ptg_nsym
 
         return skr
 
+    def get_stark_derivs(self, kpts, order=2, chunk_size=None) -> tuple:
+        """
+        Return the star functions and their derivatives wrt k for a list of k-points.
+
+        The derivatives of exp(i 2pi k.SR) are i 2pi (SR)_a and -4pi^2 (SR)_a (SR)_b times the phase,
+        so that all of them are obtained with one matrix product of the phases by these factors.
+
+        Args:
+            kpts: [nk, 3] K-points in reduced coordinates.
+            order: 1 for the first derivatives, 2 for first and second derivatives.
+            chunk_size: Number of k-points processed at once (default: from self.stark_memory).
+
+        Return:
+            (skr, skr_dk1, skr_dk2) complex arrays of shape [nk, nr], [nk, 3, nr] and [nk, 3, 3, nr]
+            with the derivatives wrt k in reduced coordinates. skr_dk2 is None if order is 1.
+        """
+        kpts = np.reshape(np.asarray(kpts, dtype=float), (-1, 3))
+        nkpt, nr, nsym = len(kpts), self.nr, self.ptg_nsym
+        sym_rpts = self.sym_rpts
+
+        # [NR, NSYM, NCOMP] factors multiplying the phases: 1, i 2pi SR and -(2pi)^2 SR SR
+        two_pi_sr = 2.0 * np.pi * sym_rpts.transpose(1, 0, 2)
+        factors = [np.ones((nr, nsym, 1)), 1.j * two_pi_sr]
+        if order > 1:
+            factors.append(-np.reshape(two_pi_sr[..., :, np.newaxis] * two_pi_sr[..., np.newaxis, :], (nr, nsym, 9)))
+        factors = np.concatenate(factors, axis=-1) / nsym
+        ncomp = factors.shape[-1]
+
+        work = np.empty((nkpt, ncomp, nr), dtype=complex)
+        for ks in self._kpoint_chunks(nkpt, chunk_size, ncomp=ncomp):
+            # [NR, NK, NSYM] x [NR, NSYM, NCOMP] -> [NR, NK, NCOMP]
+            phases = np.exp(1.j * np.matmul(2.0 * np.pi * kpts[ks], sym_rpts.transpose(0, 2, 1))).transpose(2, 1, 0)
+            work[ks] = np.matmul(phases, factors).transpose(1, 2, 0)
+
+        skr_dk2 = None if order == 1 else np.reshape(work[:, 4:], (nkpt, 3, 3, nr))
+        return work[:, 0], work[:, 1:4], skr_dk2
+
     def get_stark_dk1(self, kpt) -> np.ndarray:
         """
         Compute the 1st-order derivative of the star function wrt k
@@ -388,20 +566,7 @@ class SkwInterpolator():
             complex array [3, self.nr]  with the derivative of the
             star function wrt k in reduced coordinates.
         """
-        srk_dk1 = np.zeros((3, self.nr), dtype=complex)
-        two_pi = 2.0 * np.pi
-        rpts_t = self.rpts.T
-
-        for omat in self.ptg_symrel:
-            sk = two_pi * np.matmul(omat.T, kpt)
-            exp_skr = np.exp(1.j * np.matmul(self.rpts, sk))
-            for ir, rr in enumerate(self.rpts):
-                srk_dk1[:, ir] += exp_skr[ir] * np.matmul(omat, rr)
-            #for ir, or in enumerate(np.matmul(omat, rpts_t).T):
-            #    srk_dk1[:, ir] += exp_skr[ir] * or
-
-        srk_dk1 *= 1.j / self.ptg_nsym
-        return srk_dk1
+        return self.get_stark_derivs(kpt, order=1)[1][0]
 
     def get_stark_dk2(self, kpt) -> np.ndarray:
         """
@@ -414,26 +579,7 @@ class SkwInterpolator():
             Complex numpy array of shape [3, 3, self.nr] with the 2nd-order derivatives
             of the star function wrt k in reduced coordinates.
         """
-        srk_dk2 = np.zeros((3, 3, self.nr), dtype=complex)
-        raise NotImplementedError()
-        #work = zero
-        #do isym=1,self.ptg_nsym
-        #   sk = two_pi * matmul(transpose(self%ptg_symrel(:,:,isym)), kpt)
-        #   do ir=1,self%nr
-        #     sr = matmul(self%ptg_symrel(:,:,isym), self%rpts(:,ir))
-        #     eiskr = exp(j_dpc * dot_product(sk, self%rpts(:,ir)))
-        #     do jj=1,3
-        #        do ii=1,jj
-        #            work(ii,jj,ir) = work(ii,jj,ir) + eiskr * sr(ii) * sr(jj)
-
-        #work = - work / self.ptg_nsym
-
-        #do jj=1,3
-        #   do ii=1,jj
-        #       srk_dk2(:, ii, jj) = work(ii, jj, :)
-        #       if (ii /= jj) srk_dk2(:,jj,ii) = work(:,ii,jj)
-
-        return srk_dk2
+        return self.get_stark_derivs(kpt, order=2)[2][0]
 
     #def find_stationary_points(self, kmesh, bstart=None, bstop=None, is_shift=None)
     #    k = self.get_sampling(kmesh, is_shift)
@@ -453,6 +599,13 @@ class SkwInterpolator():
 
     #    return results
 
+    def _r2(self, rpts) -> np.ndarray:
+        """
+        ||R||**2 for a list of lattice points (summed in the same order as np.dot(R, rmet R))
+        """
+        rmet_r = sum(rpts[:, jj, np.newaxis] * self.rmet[:, jj] for jj in range(3))
+        return sum(rpts[:, ii] * rmet_r[:, ii] for ii in range(3))
+
     def _find_rstar_gen(self, nrwant, rmax) -> tuple:
         """
         Find all lattice points generating the stars inside the supercell defined by `rmax`
@@ -465,16 +618,13 @@ class SkwInterpolator():
             tuple: (rpts, r2vals, ok)
         """
         msize = (2 * rmax + 1).prod()
-        rtmp = np.empty((msize, 3), dtype=int)
-        r2tmp = np.empty(msize)
         if self.verbose: print("rmax", rmax, "msize:", msize)
 
         start = time.time()
-        for cnt, l in enumerate(itertools.product(range(-rmax[0], rmax[0] + 1),
-                                                  range(-rmax[1], rmax[1] + 1),
-                                                  range(-rmax[2], rmax[2] + 1))):
-            rtmp[cnt] = l
-            r2tmp[cnt] = np.dot(l, np.matmul(self.rmet, l))
+        rtmp = np.stack(np.meshgrid(np.arange(-rmax[0], rmax[0] + 1),
+                                    np.arange(-rmax[1], rmax[1] + 1),
+                                    np.arange(-rmax[2], rmax[2] + 1), indexing="ij"), axis=-1).reshape(-1, 3)
+        r2tmp = self._r2(rtmp)
 
         if self.verbose: print("gen points", time.time() - start)
 
@@ -483,71 +633,28 @@ class SkwInterpolator():
         iperm = np.argsort(r2tmp)
         r2tmp = r2tmp[iperm]
         rtmp = rtmp[iperm]
-        #return rtmp, r2tmp, True
-
-        # Find shells
-        r2sh = np.empty(msize, dtype=int)    # Correspondence between R and shell index.
-        shlim = np.empty(msize, dtype=int)   # For each shell, the index of the initial G-vector.
-        nsh = 1
-        r2sh[0] = 0
-        shlim[0] = 0
-        r2_prev = 0.0
-        for ir in range(1, msize):
-            if abs(r2tmp[ir] - r2_prev) > r2tmp[ir] * 1e-8:
-                r2_prev = r2tmp[ir]
-                shlim[nsh] = ir
-                nsh += 1
-            r2sh[ir] = nsh
-        shlim[nsh] = msize
-        if self.verbose:
-            print("nshells", nsh)
-            print("shells", time.time() - start)
 
         # Find R-points generating the stars.
-        # This is the most CPU critical part. I think it's difficult to do better than this without cython
-        start = time.time()
-        rgen = deque()
-
-        for ish in range(nsh):
-            ss, ee = shlim[ish], shlim[ish + 1]
-            if ss + 1 == ee:
-                rgen.append(rtmp[ss])
-                continue
-
-            if True:
-                # This is faster
-                rs = set([tuple(rtmp[ss])])
-                for ir in range(ss + 1, ee):
-                    rvec = rtmp[ir]
-                    if all(tuple(np.matmul(rot, rvec)) not in rs for rot in self.ptg_symrel):
-                        rs.add(tuple(rvec))
-            else:
-                rs = deque([rtmp[ss]])
-                for ir in range(ss + 1, ee):
-                    for rot in self.ptg_symrel:
-                        rot_r = np.matmul(rot, rtmp[ir])
-                        if any(np.all(rot_r == x) for x in rs): break
-                    else:
-                        # We have new R-point.
-                        #print("Adding new point")
-                        rs.append(rtmp[ir])
-
-            #print(len(rs), rs)
-            rgen.extend(rs)
-        #print(rgen)
+        # Points in the same star have the same key (the smallest code among their images S R),
+        # for each star the first point in the sorted list is kept.
+        rkeys = np.empty(msize, dtype=np.int64)
+        mcode = 2 * int(np.abs(self.ptg_symrel).sum(axis=2).max() * rmax.max()) + 1
+        chunk = max(1, 2**22 // self.ptg_nsym)
+        for rs in range(0, msize, chunk):
+            # [NSYM, NR, 3] images of the points, encoded as integers
+            srpts = np.matmul(rtmp[rs:rs+chunk], self.ptg_symrel.transpose(0, 2, 1)) + mcode // 2
+            rkeys[rs:rs+chunk] = ((srpts[..., 0] * mcode + srpts[..., 1]) * mcode + srpts[..., 2]).min(axis=0)
+        rgen = rtmp[np.sort(np.unique(rkeys, return_index=True)[1])]
         if self.verbose: print("stars", time.time() - start)
 
         start = time.time()
-        rgen = np.array(rgen, dtype=int)
         nstars = len(rgen)
 
         # Store rpts and compute ||R||**2.
         ok = nstars >= nrwant
         nr = min(nstars, nrwant)
         rpts = rgen[:nr].copy()
-        r2vals = np.empty(nr)
-        for ir in range(nr):
-            r2vals[ir] = np.dot(rpts[ir], np.matmul(self.rmet, rpts[ir]))
+        r2vals = self._r2(rpts)
 
         if self.verbose:
             print("r2max ", rpts[nr-1])
@@ -560,6 +667,97 @@ class SkwInterpolator():
         return rpts, r2vals, ok
 
 
+# Default folder of the on-disk cache used by get_skw_interpolator (the cache is used only if requested,
+# or if the YAMBOPY_SKW_CACHE environment variable is set to the cache folder)
+SKW_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yambopy", "skw")
+# Maximum size in bytes of the cache folder: beyond it the least recently used models are removed
+SKW_CACHE_MAXSIZE = 2**30
+
+
+def skw_input_hash(lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev, filter_params=None) -> str:
+    """
+    Hash (hex string) of the input data of SkwInterpolator. Two sets of inputs with the same hash
+    give the same fitted model.
+    """
+    sha = hashlib.sha1()
+    params = None if filter_params is None else [float(p) for p in filter_params]
+    sha.update(repr((SkwInterpolator.file_version, int(lpratio), float(fermie), float(nelect),
+                     bool(has_timrev), params)).encode())
+    arrays = [np.asarray(kpts, dtype=float), np.atleast_3d(eigens), np.reshape(symrel, (-1, 3, 3))]
+    arrays += [np.asarray(item) for item in cell]
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(repr((array.dtype.str, array.shape)).encode())
+        sha.update(array.tobytes())
+
+    return sha.hexdigest()
+
+
+def prune_skw_cache(folder, maxsize=None) -> list:
+    """
+    Remove the least recently used models from the cache folder until its size is below maxsize
+    (default: SKW_CACHE_MAXSIZE bytes). The most recent model is always kept.
+    Return the list of removed files.
+    """
+    if maxsize is None: maxsize = SKW_CACHE_MAXSIZE
+    files = [os.path.join(folder, name) for name in os.listdir(folder)
+             if name.startswith("skw_") and name.endswith(".npz")]
+    stats = sorted(((os.stat(f).st_mtime, os.stat(f).st_size, f) for f in files), reverse=True)
+    removed, total = [], 0
+    for i, (mtime, size, filename) in enumerate(stats):
+        total += size
+        if i > 0 and total > maxsize:
+            os.remove(filename)
+            removed.append(filename)
+
+    return removed
+
+
+def get_skw_interpolator(lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev,
+                         filter_params=None, verbose=1, cache=None) -> SkwInterpolator:
+    """
+    Return the SkwInterpolator for the given input data (same arguments as SkwInterpolator).
+    Optionally, the fitted models are stored in an on-disk cache keyed on the hash of the inputs,
+    so that repeated calls with the same data (e.g. replotting on a different path) skip the fit.
+    The cache writes one npz file per model; the least recently used ones are removed when
+    the folder is larger than SKW_CACHE_MAXSIZE bytes.
+
+    Args:
+        cache: None (default) to use the cache only if the YAMBOPY_SKW_CACHE environment variable
+            is set (to the cache folder), True to use it in any case (default folder: SKW_CACHE_DIR),
+            a folder name to use another cache, False to always fit a new model.
+    """
+    args = (lpratio, kpts, eigens, fermie, nelect, cell, symrel, has_timrev)
+    env_folder = os.environ.get("YAMBOPY_SKW_CACHE")
+    if cache is None: cache = env_folder is not None
+    if not cache:
+        return SkwInterpolator(*args, filter_params=filter_params, verbose=verbose)
+
+    folder = (env_folder or SKW_CACHE_DIR) if cache is True else cache
+    input_hash = skw_input_hash(*args, filter_params=filter_params)
+    filename = os.path.join(folder, "skw_%s.npz" % input_hash)
+
+    if os.path.isfile(filename):
+        try:
+            skw = SkwInterpolator.from_file(filename, verbose=verbose)
+            if skw.input_hash == input_hash:
+                if verbose: print("Read SKW model from cache:", filename)
+                os.utime(filename)
+                return skw
+        except Exception as exc:
+            cprint("Cannot read SKW model %s (%s), the fit is repeated" % (filename, exc), "yellow")
+
+    skw = SkwInterpolator(*args, filter_params=filter_params, verbose=verbose)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        skw.save(filename, input_hash=input_hash)
+        prune_skw_cache(folder)
+    except OSError as exc:
+        cprint("Cannot write SKW model in the cache folder %s (%s)" % (folder, exc), "yellow")
+
+    return skw
+
+
 def extract_point_group(symrel, has_timrev) -> tuple:
     """
     Extract the point group rotations from the spacegroup. Add time-reversal
@@ -0,0 +1,133 @@
+#
+# License-Identifier: GPL
+#
+# Copyright (C) 2024 The Yambo Team
+#
+# This file is part of yambopy
+#
+import unittest
+import os
+import tempfile
+import numpy as np
+from unittest import mock
+from yambopy.dbs.latticedb import YamboLatticeDB
+from yambopy.dbs.electronsdb import YamboElectronsDB
+from yambopy.lattice import car_red
+from yambopy.units import ha2ev
+from yambopy.tools import skw as skw_module
+from yambopy.tools.skw import SkwInterpolator, get_skw_interpolator, prune_skw_cache
+
+test_path = os.path.join(os.path.dirname(__file__),'..','..','data','refs','ip','SAVE')
+
+def get_skw(lpratio=8,nbands=6):
+    """
+    SKW interpolation of the first bands of the test database
+    """
+    lat = YamboLatticeDB.from_db_file(os.path.join(test_path,'ns.db1'))
+    electrons = YamboElectronsDB.from_db_file(folder=test_path)
+    eigs = electrons.eigenvalues_ibz[:,:,:nbands]
+    kpoints = car_red(np.array([ k/lat.alat for k in lat.ibz_kpoints ]),lat.rlat)
+    symrel = [sym for sym,trev in zip(lat.sym_rec_red,lat.time_rev_list) if trev==False ]
+    cell = (lat.lat, lat.red_atomic_positions, lat.atomic_numbers)
+    args = (lpratio,kpoints,eigs,0.,0,cell,symrel,bool(lat.time_rev))
+    skw = SkwInterpolator(*args,verbose=0)
+    return skw, kpoints, eigs, args
+
+class TestSkwInterpolator(unittest.TestCase):
+
+    def test_interp_kpts(self):
+
+        skw, kpoints, eigs, args = get_skw()
+
+        #the interpolation goes through the ab-initio data
+        np.testing.assert_allclose(skw.interp_kpts(kpoints).eigens,eigs,atol=1e-5)
+
+        #batched star functions
+        kpts = np.random.default_rng(0).random((20,3))
+        skr = np.array([ sum(np.exp(2j*np.pi*np.dot(skw.rpts,np.dot(omat.T,k))) for omat in skw.ptg_symrel)/skw.ptg_nsym for k in kpts ])
+        np.testing.assert_allclose(skw.get_stark_many(kpts),skr,atol=1e-10)
+        np.testing.assert_allclose(skw.get_stark_many(kpts,chunk_size=7),skr,atol=1e-10)
+        np.testing.assert_allclose(skw.interp_kpts(kpts).eigens[0],np.real(skr@skw.coefs[0].T),atol=1e-10)
+
+    def test_derivatives(self):
+
+        skw, kpoints, eigs, args = get_skw()
+        kpts = np.random.default_rng(2).random((10,3))
+        res = skw.interp_kpts(kpts,dk1=True,dk2=True)
+
+        #compare with finite differences in reduced coordinates
+        h = 1e-5
+        dedk = np.stack([ (skw.interp_kpts(kpts+h*dk).eigens-skw.interp_kpts(kpts-h*dk).eigens)/(2*h) for dk in np.eye(3) ],axis=-1)
+        dedk2 = np.stack([ (skw.interp_kpts(kpts+h*dk,dk1=True).dedk-skw.interp_kpts(kpts-h*dk,dk1=True).dedk)/(2*h) for dk in np.eye(3) ],axis=-1)
+        np.testing.assert_allclose(res.dedk,dedk,atol=1e-5)
+        np.testing.assert_allclose(res.dedk2,dedk2,atol=1e-4)
+
+        #single k-point
+        der1, der2 = np.zeros((skw.nband,3)), np.zeros((skw.nband,3,3))
+        np.testing.assert_allclose(skw.eval_sk(0,kpts[1],der1=der1,der2=der2),res.eigens[0,1])
+        np.testing.assert_allclose(der1,res.dedk[0,1])
+        np.testing.assert_allclose(der2,res.dedk2[0,1])
+
+        #velocities and masses in cartesian coordinates
+        grid = skw.interp_grid((4,4,1))
+        self.assertEqual(grid.masses.shape,(1,16,skw.nband,3,3))
+        lat = np.array(skw.cell[0])
+        res = skw.interp_kpts(grid.kpts,dk1=True,dk2=True)
+        np.testing.assert_allclose(grid.velocities,res.dedk@lat/(2*np.pi*ha2ev),atol=1e-12)
+        np.testing.assert_allclose(grid.inverse_masses,lat.T@res.dedk2@lat/((2*np.pi)**2*ha2ev),atol=1e-12)
+
+    def test_cache(self):
+
+        skw, kpoints, eigs, args = get_skw()
+        kpts = np.random.default_rng(1).random((10,3))
+        eigens = skw.interp_kpts(kpts).eigens
+
+        with tempfile.TemporaryDirectory() as folder:
+            #the model read from file interpolates as the fitted one
+            filename = os.path.join(folder,'skw.npz')
+            skw.save(filename)
+            np.testing.assert_array_equal(SkwInterpolator.from_file(filename,verbose=0).interp_kpts(kpts).eigens,eigens)
+
+            #the first call fits and stores the model, the second one reads it
+            cache = os.path.join(folder,'cache')
+            skw_fit = get_skw_interpolator(*args,verbose=0,cache=cache)
+            self.assertEqual(len(os.listdir(cache)),1)
+            skw_read = get_skw_interpolator(*args,verbose=0,cache=cache)
+            self.assertFalse(hasattr(skw_read,'skr'))
+            self.assertEqual(skw_read.mae,skw_fit.mae)
+            np.testing.assert_array_equal(skw_read.interp_kpts(kpts).eigens,eigens)
+
+            #different input data give a new model
+            get_skw_interpolator(*args[:2],args[2]+0.1,*args[3:],verbose=0,cache=cache)
+            self.assertEqual(len(os.listdir(cache)),2)
+
+            #the least recently used models are removed beyond the maximum size
+            first, second = [ os.path.join(cache,name) for name in sorted(os.listdir(cache),key=lambda name: os.stat(os.path.join(cache,name)).st_mtime) ]
+            os.utime(second,(0,0))
+            get_skw_interpolator(*args,verbose=0,cache=cache)
+            self.assertEqual(prune_skw_cache(cache,maxsize=os.stat(first).st_size),[second])
+            self.assertEqual(os.listdir(cache),[os.path.basename(first)])
+
+    def test_cache_opt_in(self):
+
+        skw, kpoints, eigs, args = get_skw(lpratio=3,nbands=2)
+        with tempfile.TemporaryDirectory() as folder:
+            default_folder = os.path.join(folder,'default')
+            env_folder = os.path.join(folder,'env')
+            with mock.patch.object(skw_module,'SKW_CACHE_DIR',default_folder):
+                #by default nothing is written on disk
+                with mock.patch.dict(os.environ,clear=True):
+                    get_skw_interpolator(*args,verbose=0)
+                    self.assertFalse(os.path.exists(default_folder))
+                    get_skw_interpolator(*args,verbose=0,cache=True)
+                    self.assertEqual(len(os.listdir(default_folder)),1)
+
+                #the environment variable enables the cache in its folder
+                with mock.patch.dict(os.environ,{'YAMBOPY_SKW_CACHE':env_folder}):
+                    get_skw_interpolator(*args,verbose=0)
+                    self.assertEqual(len(os.listdir(env_folder)),1)
+                    get_skw_interpolator(*args,verbose=0,cache=False)
+                    self.assertEqual(len(os.listdir(env_folder)),1)
+
+if __name__ == '__main__':
+    unittest.main()